@@ -3,25 +3,93 @@ OCR API endpoints
 """
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form
-from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
 import json
 import logging
 
-from app.models.ocr_service import ocr_service
+from app.models.batcher import CropBatcher
+from app.models.ocr_service import ocr_service, predict, predict_batch
 from app.schemas.ocr import OCRResponse, OCRResult, SingleOCRResponse
-from app.utils.image import load_image_from_bytes, crop_images_batch
+from app.core.config import settings
+from app.core.executor import InferenceExecutor, OverloadedError
+from app.utils.image import load_image_from_file, crop_images_batch
+from app.utils.upload import UploadTooLarge, spooled_upload
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+executor = InferenceExecutor(
+    kind=settings.INFERENCE_EXECUTOR,
+    slots=settings.INFERENCE_SLOTS,
+    queue_size=settings.INFERENCE_QUEUE_SIZE,
+    retry_after=settings.RETRY_AFTER_SECONDS,
+)
+batcher = CropBatcher(
+    predict_batch,
+    max_batch_size=settings.BATCH_MAX_CROPS,
+    max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+    executor=executor.pool,
+    concurrency=executor.slots,
+)
+
+
+def parse_class_names(class_names: Optional[str], count: int) -> List[Optional[str]]:
+    """
+    Parse the class_names form field: a JSON list with one string (or null) per bbox
+
+    Raises:
+        HTTPException: 400 if the field is not such a list
+    """
+    if not class_names:
+        return [None] * count
+    try:
+        names = json.loads(class_names)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid class_names JSON: {e}")
+    if not isinstance(names, list) or not all(name is None or isinstance(name, str) for name in names):
+        raise HTTPException(status_code=400, detail="class_names must be a JSON list of strings or null")
+    if len(names) != count:
+        raise HTTPException(status_code=400, detail="Number of class names must match number of bboxes")
+    return names
+
+
+def overloaded(e: OverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is overloaded, please retry later",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def read_image(file: UploadFile):
+    """
+    Check the size of an uploaded image and decode it from the spooled file (in a worker thread)
+    
+    Args:
+        file: Uploaded image file
+        
+    Returns:
+        PIL Image
+    """
+    try:
+        buffer, _ = spooled_upload(file, settings.MAX_IMAGE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File size exceeds maximum allowed size of {settings.MAX_IMAGE_SIZE} bytes"
+        )
+    return await run_in_threadpool(load_image_from_file, buffer)
+
 
 @router.post("/ocr", response_model=OCRResponse)
 async def recognize_text(
     file: UploadFile = File(..., description="Image file"),
     bboxes: str = Form(..., description="JSON string of bounding boxes [[x1,y1,x2,y2],...]"),
     confidences: Optional[str] = Form(None, description="JSON string of confidence scores"),
-    conf_threshold: float = Form(0.5, description="Confidence threshold")
+    conf_threshold: float = Form(0.5, description="Confidence threshold"),
+    class_names: Optional[str] = Form(None, description="JSON string of detector class names (optional, selects the model per box, see MODEL_ROUTES)")
 ):
     """
     Perform OCR on detected regions from an image
@@ -31,78 +99,98 @@ async def recognize_text(
         bboxes: JSON string of bounding boxes
         confidences: JSON string of confidence scores (optional)
         conf_threshold: Confidence threshold to filter results
+        class_names: JSON string of the detector class of each box (optional, routes each box to its model)
         
     Returns:
         OCRResponse with recognized text for each region
     """
     try:
-        # Parse bboxes
-        bboxes_list = json.loads(bboxes)
-        
-        # Parse confidences if provided
-        confidences_list = None
-        if confidences:
-            confidences_list = json.loads(confidences)
-        
-        # Read image
-        image_bytes = await file.read()
-        image = load_image_from_bytes(image_bytes)
-        
-        logger.info(f"Processing {len(bboxes_list)} regions for OCR")
-        
-        # Filter by confidence if provided
-        if confidences_list:
-            filtered_data = [
-                (bbox, conf) 
-                for bbox, conf in zip(bboxes_list, confidences_list)
-                if conf >= conf_threshold
-            ]
-            bboxes_list = [item[0] for item in filtered_data]
-            confidences_list = [item[1] for item in filtered_data]
-        
-        if not bboxes_list:
-            logger.warning("No bounding boxes passed confidence threshold")
-            return OCRResponse(results=[], total_processed=0)
-        
-        # Crop images
-        cropped_images = crop_images_batch(image, bboxes_list)
-        
-        # Perform OCR on each cropped image
-        results = []
-        for i, (cropped_img, bbox) in enumerate(zip(cropped_images, bboxes_list)):
-            try:
-                text = ocr_service.predict(cropped_img)
-                
-                result = OCRResult(
-                    bbox=bbox,
-                    text=text,
-                    confidence=confidences_list[i] if confidences_list else None
-                )
-                results.append(result)
-                
-            except Exception as e:
-                logger.error(f"OCR failed for region {i}: {e}")
-                # Add empty result for failed OCR
-                results.append(OCRResult(
-                    bbox=bbox,
-                    text="",
-                    confidence=confidences_list[i] if confidences_list else None
-                ))
-        
-        logger.info(f"OCR completed for {len(results)} regions")
-        
-        return OCRResponse(
-            results=results,
-            total_processed=len(results)
-        )
-        
+        async with executor.admit():
+            return await _recognize_regions(file, bboxes, confidences, class_names, conf_threshold)
+    except OverloadedError as e:
+        raise overloaded(e)
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Invalid JSON format: {e}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"OCR error: {e}")
         raise HTTPException(status_code=500, detail=f"OCR processing error: {str(e)}")
 
 
+async def _recognize_regions(
+    file: UploadFile,
+    bboxes: str,
+    confidences: Optional[str],
+    class_names: Optional[str],
+    conf_threshold: float
+) -> OCRResponse:
+    """Body of /ocr, run while holding an admission slot"""
+    # Parse bboxes
+    bboxes_list = json.loads(bboxes)
+    
+    # Parse confidences if provided
+    confidences_list = None
+    if confidences:
+        confidences_list = json.loads(confidences)
+    
+    # Parse class names if provided
+    class_names_list = parse_class_names(class_names, len(bboxes_list))
+    
+    # Read image
+    image = await read_image(file)
+    
+    logger.info(f"Processing {len(bboxes_list)} regions for OCR")
+    
+    # Filter by confidence if provided
+    if confidences_list:
+        filtered_data = [
+            (bbox, conf, class_name)
+            for bbox, conf, class_name in zip(bboxes_list, confidences_list, class_names_list)
+            if conf >= conf_threshold
+        ]
+        bboxes_list = [item[0] for item in filtered_data]
+        confidences_list = [item[1] for item in filtered_data]
+        class_names_list = [item[2] for item in filtered_data]
+    
+    if not bboxes_list:
+        logger.warning("No bounding boxes passed confidence threshold")
+        return OCRResponse(results=[], total_processed=0)
+    
+    # Crop images
+    cropped_images = await run_in_threadpool(crop_images_batch, image, bboxes_list)
+    
+    # Recognize all regions, batched with the crops of concurrent requests
+    try:
+        texts = await batcher.submit(cropped_images, class_names_list)
+    except Exception as e:
+        logger.error(f"Batched OCR failed, retrying region by region: {e}")
+        texts = []
+        for i, cropped_img in enumerate(cropped_images):
+            try:
+                texts.append(await executor.run(predict, cropped_img, class_names_list[i]))
+            except Exception as region_error:
+                logger.error(f"OCR failed for region {i}: {region_error}")
+                # Add empty result for failed OCR
+                texts.append("")
+    
+    results = [
+        OCRResult(
+            bbox=bbox,
+            text=text,
+            confidence=confidences_list[i] if confidences_list else None
+        )
+        for i, (bbox, text) in enumerate(zip(bboxes_list, texts))
+    ]
+    
+    logger.info(f"OCR completed for {len(results)} regions")
+    
+    return OCRResponse(
+        results=results,
+        total_processed=len(results)
+    )
+
+
 @router.post("/ocr/single", response_model=SingleOCRResponse)
 async def recognize_single_image(
     file: UploadFile = File(..., description="Image file")
@@ -117,14 +205,14 @@ async def recognize_single_image(
         SingleOCRResponse with recognized text
     """
     try:
-        # Read image
-        image_bytes = await file.read()
-        image = load_image_from_bytes(image_bytes)
-        
-        logger.info("Processing single image for OCR")
-        
-        # Perform OCR
-        text = ocr_service.predict(image)
+        async with executor.admit():
+            # Read image
+            image = await read_image(file)
+            
+            logger.info("Processing single image for OCR")
+            
+            # Perform OCR
+            text = (await batcher.submit([image]))[0]
         
         logger.info(f"OCR completed: {text}")
         
@@ -133,15 +221,44 @@ async def recognize_single_image(
             success=True
         )
         
+    except OverloadedError as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"OCR error: {e}")
         raise HTTPException(status_code=500, detail=f"OCR processing error: {str(e)}")
 
 
+@router.get("/stats")
+async def stats():
+    """Micro-batching and admission statistics: batch fill, queue delay, queue depth, rejected requests"""
+    return {
+        "batching_enabled": batcher.running,
+        "queue_depth": batcher.queue_depth(),
+        "batcher": batcher.stats.snapshot(),
+        "executor": executor.snapshot(),
+    }
+
+
+@router.get("/cache")
+async def cache_stats():
+    """Recognition cache statistics, overall and per detector class"""
+    if executor.kind == "process":
+        # Every worker process has its own cache, the API process has none
+        raise HTTPException(
+            status_code=404,
+            detail="Recognition cache statistics are not available with INFERENCE_EXECUTOR=process"
+        )
+    return ocr_service.cache.snapshot()
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
+    model_status = executor.worker_status if executor.kind == "process" else ocr_service.status()
     return {
         "status": "healthy",
-        "model_loaded": ocr_service.model_loaded
+        **model_status,
+        "routes": settings.MODEL_ROUTES
     }
@@ -0,0 +1,24 @@
+"""
+Local content-addressed artifact store, shared by the OCR services (ai/service_common/artifacts.py)
+
+Usage:
+    python -m app.core.artifacts list|add|verify
+"""
+
+import sys
+from pathlib import Path
+
+# Add the ai/ directory (parent of service_common) to the path
+common_path = Path(__file__).resolve().parents[3]
+if str(common_path) not in sys.path:
+    sys.path.insert(0, str(common_path))
+
+from service_common.artifacts import ArtifactError, ArtifactStore, load_weights
+
+__all__ = ["ArtifactError", "ArtifactStore", "load_weights"]
+
+if __name__ == "__main__":
+    from app.core.config import settings
+    from service_common.artifacts import main
+
+    main(settings.ARTIFACT_STORE)
@@ -3,7 +3,7 @@ Configuration settings for OCR V2 service
 """
 
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import torch
 from pathlib import Path
 
@@ -24,12 +24,49 @@ class Settings(BaseSettings):
     
     # VietOCR Model settings
     MODEL_NAME: str = "vgg_transformer"  # or vgg_seq2seq
+    # Field-aware routing: YOLO class name -> VietOCR model name, as JSON, e.g.
+    # MODEL_ROUTES='{"so_cccd": "vgg_seq2seq", "ngay_sinh": "vgg_seq2seq"}'.
+    # Unlisted classes use MODEL_NAME. See `python benchmark.py routing` before routing a class
+    MODEL_ROUTES: Dict[str, str] = {}
     
     # Custom model settings
     USE_CUSTOM_MODEL: bool = True
     CUSTOM_MODEL_GDRIVE_ID: str = "17UtJhDv_I5a2AQfU4M7AtnWy2KYiQSMS"
     CUSTOM_MODEL_PATH: str = str(Path(__file__).parent.parent.parent / "weights" / "custom_vietocr_model.pth")
     
+    # Local content-addressed artifact store, shared by the services on a host (see app/core/artifacts.py)
+    ARTIFACT_STORE: str = str(Path.home() / ".cache" / "ocr-system" / "artifacts")
+    # Pin config/weights by SHA-256; empty uses the digests recorded by `python -m app.core.setup`
+    CONFIG_SHA256: str = ""
+    WEIGHTS_SHA256: str = ""
+    # Download missing artifacts on startup (network); otherwise startup fails until setup has run
+    AUTO_SETUP: bool = True
+    
+    # Batched inference: crops are resized to a fixed height and grouped by width.
+    # Crops in a bucket are right-padded to its widest crop; VietOCR is trained on
+    # unpadded same-width batches, so 0 (exact widths only) matches per-crop results.
+    # See `python benchmark.py batch` before raising the tolerance
+    BATCH_SIZE: int = 32  # Max crops per encoder/decoder pass
+    BATCH_WIDTH_TOLERANCE: int = 0  # Max padding in pixels (after resizing)
+    
+    # Inference executor: VietOCR runs off the event loop in a bounded pool
+    INFERENCE_EXECUTOR: str = "thread"  # "thread" (one shared model) or "process" (one model per worker)
+    INFERENCE_SLOTS: int = 1  # Inference jobs running in parallel (threads or worker processes)
+    INFERENCE_QUEUE_SIZE: int = 32  # Extra requests admitted while all slots are busy, beyond that 503
+    RETRY_AFTER_SECONDS: int = 1  # Retry-After header of overload responses
+    
+    # Cross-request micro-batching: crops of concurrent requests share predict_batch calls
+    BATCHING_ENABLED: bool = True
+    BATCH_MAX_CROPS: int = 64  # Max crops merged into one predict_batch call
+    BATCH_MAX_WAIT_MS: float = 10.0  # Max time the oldest queued crop waits for more crops
+    
+    # LRU of recognized text keyed by the crop pixels and model id (0 disables it)
+    RECOGNITION_CACHE_SIZE: int = 4096
+    
+    # Upload limits
+    MAX_IMAGE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_REQUEST_SIZE: int = MAX_IMAGE_SIZE + 1024 * 1024  # Image + form fields, larger bodies get 413
+    
     # CORS
     ALLOWED_ORIGINS: List[str] = ["*"]
     
@@ -0,0 +1,131 @@
+"""
+Bounded inference executor
+Runs VietOCR off the event loop, in a thread or process pool, with admission control
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """The admission queue is full, the request is rejected immediately"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+def _thread_budget() -> int:
+    """
+    CPU threads this service may use
+
+    OMP_NUM_THREADS when set (ai/launcher.py sets it to the physical cores the
+    service is pinned to), otherwise the CPUs of the affinity mask, which
+    spawned workers inherit.
+    """
+    threads = os.environ.get("OMP_NUM_THREADS", "")
+    if threads.isdigit() and int(threads) > 0:
+        return int(threads)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_process_worker(threads: int):
+    """Process pool initializer: set the worker's share of the CPU threads and load the model"""
+    import torch
+    from app.models.ocr_service import ocr_service
+
+    torch.set_num_threads(threads)
+    # Weights are memory-mapped from the artifact store, so workers share one copy
+    ocr_service.load_model()
+
+
+def _process_worker_status() -> dict:
+    """Warmup job: busy long enough for every worker to take one, reports the worker's models"""
+    from app.models.ocr_service import ocr_service
+
+    time.sleep(0.1)
+    return ocr_service.status()
+
+
+class InferenceExecutor:
+    """
+    Dedicated pool for VietOCR inference, separate from the event loop
+
+    `kind` is "thread" (one model shared by the threads; PyTorch releases the
+    GIL inside its kernels) or "process" (one model per worker process, started
+    with spawn). `slots` is the number of inference jobs running in parallel.
+    At most `slots + queue_size` requests are admitted at the same time; the
+    next one is rejected with OverloadedError instead of queueing without
+    bound, so the event loop never holds more work than it can finish.
+    """
+
+    def __init__(self, kind: str = "thread", slots: int = 1, queue_size: int = 32, retry_after: int = 1):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind} (expected 'thread' or 'process')")
+        self.kind = kind
+        self.slots = max(1, slots)
+        self.capacity = self.slots + max(0, queue_size)
+        self.retry_after = retry_after
+        self.admitted = 0
+        self.rejected = 0
+        # Models of the worker processes, the API process loads none (set by warmup)
+        self.worker_status = {"model_loaded": False, "models": []}
+        if kind == "process":
+            # Workers are spawned on the first submitted jobs, see warmup
+            self.pool: Executor = ProcessPoolExecutor(
+                max_workers=self.slots,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(max(1, _thread_budget() // self.slots),),
+            )
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="inference")
+
+    async def warmup(self):
+        """Start every worker process (each loads the model) before the first request"""
+        if self.kind == "process":
+            statuses = await asyncio.gather(*(self.run(_process_worker_status) for _ in range(self.slots)))
+            # A worker that fails to load breaks the pool, so all of them report the same models
+            self.worker_status = statuses[0]
+        logger.info(f"Inference executor started: kind={self.kind}, slots={self.slots}, capacity={self.capacity}")
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        """Hold an admission slot for the whole request"""
+        if self.admitted >= self.capacity:
+            self.rejected += 1
+            raise OverloadedError(self.retry_after)
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.admitted -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn in the pool; with processes, fn and its arguments must be picklable"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+
+    def snapshot(self) -> dict:
+        return {
+            "kind": self.kind,
+            "slots": self.slots,
+            "capacity": self.capacity,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Drop the queued jobs, wait for the running ones and reap the workers"""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        logger.info("Inference executor stopped")
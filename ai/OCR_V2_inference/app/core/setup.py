@@ -0,0 +1,95 @@
+"""
+Artifact setup for the VietOCR service
+Downloads the model configs and weights once and adds them to the local artifact store
+
+Usage:
+    python -m app.core.setup
+"""
+
+import logging
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.core.artifacts import ArtifactStore
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def uses_custom_weights(model_name: str) -> bool:
+    """The custom weights are trained for MODEL_NAME; routed models use the pretrained VietOCR weights"""
+    return settings.USE_CUSTOM_MODEL and model_name == settings.MODEL_NAME
+
+
+def config_artifact(model_name: Optional[str] = None) -> str:
+    """Store name of the VietOCR config"""
+    return f"vietocr_{model_name or settings.MODEL_NAME}_config"
+
+
+def weights_artifact(model_name: Optional[str] = None) -> str:
+    """Store name of the VietOCR weights"""
+    model_name = model_name or settings.MODEL_NAME
+    return "vietocr_custom_weights" if uses_custom_weights(model_name) else f"vietocr_{model_name}_weights"
+
+
+def setup_vietocr_artifacts(store: Optional[ArtifactStore] = None, model_name: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Download the VietOCR config and weights of one model and add them to the artifact store
+    
+    This is the only place that needs network access. load_model resolves
+    both artifacts from the store afterwards.
+    
+    Args:
+        store: Artifact store (default: ARTIFACT_STORE)
+        model_name: VietOCR model name (default: MODEL_NAME)
+    
+    Returns:
+        (config digest, weights digest)
+    """
+    import gdown
+    from vietocr.tool.config import Cfg
+    from vietocr.tool.utils import download_weights
+    
+    if store is None:
+        store = ArtifactStore(settings.ARTIFACT_STORE)
+    model_name = model_name or settings.MODEL_NAME
+    
+    logger.info(f"Downloading VietOCR config: {model_name}")
+    config = Cfg.load_config_from_name(model_name)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_file = Path(tmp_dir) / f"{model_name}.yml"
+        config.save(str(config_file))
+        config_digest = store.add(config_file, config_artifact(model_name))
+    
+    if uses_custom_weights(model_name):
+        weights_path = Path(settings.CUSTOM_MODEL_PATH)
+        if not weights_path.exists():
+            logger.info("Downloading custom model from Google Drive...")
+            weights_path.parent.mkdir(parents=True, exist_ok=True)
+            url = f"https://drive.google.com/uc?id={settings.CUSTOM_MODEL_GDRIVE_ID}"
+            gdown.download(url, str(weights_path), quiet=False)
+    else:
+        logger.info(f"Downloading VietOCR weights: {config['weights']}")
+        weights_path = Path(download_weights(config['weights']))
+    weights_digest = store.add(weights_path, weights_artifact(model_name))
+    
+    if model_name == settings.MODEL_NAME:
+        logger.info(f"VietOCR config stored as sha256 {config_digest} (pin with CONFIG_SHA256)")
+        logger.info(f"VietOCR weights stored as sha256 {weights_digest} (pin with WEIGHTS_SHA256)")
+    else:
+        logger.info(f"VietOCR {model_name} config/weights stored as sha256 {config_digest[:12]}/{weights_digest[:12]}")
+    return config_digest, weights_digest
+
+
+def model_names() -> List[str]:
+    """MODEL_NAME followed by the other models of MODEL_ROUTES"""
+    return list(dict.fromkeys([settings.MODEL_NAME, *settings.MODEL_ROUTES.values()]))
+
+
+if __name__ == "__main__":
+    from app.core.logging import setup_logging
+    
+    setup_logging()
+    for name in model_names():
+        setup_vietocr_artifacts(model_name=name)
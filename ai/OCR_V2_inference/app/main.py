@@ -6,9 +6,11 @@ Main application entry point for VietOCR API service
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import ocr
+from app.api.ocr import batcher, executor
 from app.core.config import settings
 from app.core.logging import setup_logging
 from app.models.ocr_service import ocr_service
+from app.utils.upload import BodySizeLimitMiddleware
 
 # Setup logging
 logger = setup_logging()
@@ -29,6 +31,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized request bodies (413) before they are buffered
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=settings.MAX_REQUEST_SIZE)
+
 # Include routers
 app.include_router(ocr.router, prefix=settings.API_V1_STR, tags=["OCR"])
 
@@ -39,20 +44,31 @@ async def startup_event():
     logger.info(f"Starting {settings.PROJECT_NAME} v{settings.VERSION}")
     logger.info(f"Device: {settings.DEVICE}")
     
-    try:
-        # Load VietOCR model
-        logger.info("Loading VietOCR model...")
-        ocr_service.load_model()
-        logger.info("VietOCR model loaded successfully")
-    except Exception as e:
-        logger.error(f"Failed to load VietOCR model: {e}")
-        raise
+    # With INFERENCE_EXECUTOR=process only the workers run inference, so the
+    # API process does not load a copy of the model
+    if executor.kind == "thread":
+        try:
+            # Load VietOCR model
+            logger.info("Loading VietOCR model...")
+            ocr_service.load_model()
+            logger.info("VietOCR model loaded successfully")
+        except Exception as e:
+            logger.error(f"Failed to load VietOCR model: {e}")
+            raise
+    
+    # Start the inference workers (with INFERENCE_EXECUTOR=process, each loads the model)
+    await executor.warmup()
+    
+    if settings.BATCHING_ENABLED:
+        await batcher.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info(f"Shutting down {settings.PROJECT_NAME}")
+    await batcher.stop()
+    executor.shutdown()
 
 
 @app.get("/")
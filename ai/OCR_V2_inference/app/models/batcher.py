@@ -0,0 +1,210 @@
+"""
+Cross-request micro-batching for VietOCR
+Merges the crops of concurrent requests into shared predict_batch calls
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatcherStats:
+    """Batch sizes, batch fill and queue delay of the micro-batcher"""
+
+    def __init__(self, max_batch_size: int, window: int = 1000):
+        self.max_batch_size = max_batch_size
+        self.total_batches = 0
+        self.total_items = 0
+        self.batch_sizes = Counter()
+        self._queue_waits = deque(maxlen=window)  # Seconds, most recent crops
+
+    def record(self, batch_size: int, queue_waits: List[float]):
+        self.total_batches += 1
+        self.total_items += batch_size
+        self.batch_sizes[batch_size] += 1
+        self._queue_waits.extend(queue_waits)
+
+    def snapshot(self) -> dict:
+        waits = sorted(self._queue_waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000
+
+        avg_batch_size = self.total_items / self.total_batches if self.total_batches else 0.0
+        return {
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": avg_batch_size,
+            "avg_batch_fill": avg_batch_size / self.max_batch_size,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "queue_wait_ms": {
+                "avg": sum(waits) / len(waits) * 1000 if waits else 0.0,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": waits[-1] * 1000 if waits else 0.0,
+            },
+        }
+
+
+class CropBatcher:
+    """
+    Merge crops from concurrent requests into shared batches
+
+    Each request calls `submit(crops, field_classes)` and gets back the texts of
+    its own crops, in order. A batch is run when `max_batch_size` crops are
+    queued or when the oldest queued crop has waited `max_wait_ms`. At most
+    `concurrency` batches run at the same time in `executor` (default: the
+    event loop's executor); while they are busy, the next batch keeps filling up.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[List[Any], List[Optional[str]]], List[str]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+        executor: Optional[Executor] = None,
+        concurrency: int = 1,
+    ):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.concurrency = max(1, concurrency)
+        self.stats = BatcherStats(self.max_batch_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running_batches = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Crop batcher started: max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f}, concurrency={self.concurrency}"
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for task in list(self._running_batches):
+            task.cancel()
+        await asyncio.gather(*self._running_batches, return_exceptions=True)
+
+        # Fail the crops still waiting in the queue
+        while not self._queue.empty():
+            _, _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Crop batcher stopped"))
+        logger.info("Crop batcher stopped")
+
+    async def submit(self, crops: List[Any], field_classes: Optional[List[Optional[str]]] = None) -> List[str]:
+        """
+        Queue the crops of one request and wait for their texts
+
+        The crops are queued together, so they stay contiguous and usually
+        share a batch; they are split across batches only when they do not fit.
+        """
+        if field_classes is None:
+            field_classes = [None] * len(crops)
+        loop = asyncio.get_running_loop()
+        if not self.running:
+            # Batcher not started (e.g. used outside FastAPI): call the model directly
+            return await loop.run_in_executor(self.executor, partial(self.predict_fn, crops, field_classes))
+
+        enqueued = time.perf_counter()
+        futures = []
+        for crop, field_class in zip(crops, field_classes):
+            future = loop.create_future()
+            self._queue.put_nowait((crop, field_class, future, enqueued))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self) -> list:
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first[3] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Take the crops that are already queued without waiting
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        return batch
+
+    async def _run(self):
+        free_slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            # Collect only once a slot is free, so crops keep arriving in the queue meanwhile
+            await free_slots.acquire()
+            try:
+                batch = await self._collect()
+            except asyncio.CancelledError:
+                free_slots.release()
+                raise
+            started = time.perf_counter()
+            # Skip crops of requests that were cancelled (client disconnected)
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                free_slots.release()
+                continue
+
+            self.stats.record(len(batch), [started - enqueued for _, _, _, enqueued in batch])
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+            task.add_done_callback(lambda _: free_slots.release())
+
+    async def _run_batch(self, batch: list):
+        loop = asyncio.get_running_loop()
+        try:
+            texts = await loop.run_in_executor(
+                self.executor,
+                partial(self.predict_fn, [crop for crop, _, _, _ in batch], [cls for _, cls, _, _ in batch])
+            )
+        except asyncio.CancelledError:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Crop batcher stopped"))
+            raise
+        except Exception as e:
+            logger.error(f"Batched OCR failed for {len(batch)} crops: {e}", exc_info=True)
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future, _), text in zip(batch, texts):
+            if not future.done():
+                future.set_result(text)
@@ -5,56 +5,112 @@ Handles model loading and inference using VietOCR
 
 from vietocr.tool.predictor import Predictor
 from vietocr.tool.config import Cfg
+from vietocr.tool.translate import build_model, process_input, translate
 from PIL import Image
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 import numpy as np
 from pathlib import Path
 import logging
-import gdown
 import os
+import torch
+import torch.nn.functional as F
 
 from app.core.config import settings
+from app.core.artifacts import ArtifactError, ArtifactStore, load_weights
+from app.core.setup import (
+    config_artifact, model_names, setup_vietocr_artifacts, uses_custom_weights, weights_artifact
+)
+from app.utils.cache import RecognitionCache, crop_key
 
 logger = logging.getLogger(__name__)
 
 
+def width_buckets(widths: List[int], tolerance: int, max_size: int) -> List[List[int]]:
+    """
+    Group crops by width so each batch needs at most `tolerance` pixels of padding
+    
+    Crops are sorted by width and a bucket is closed as soon as the next crop
+    is more than `tolerance` wider than its narrowest crop, or it is full.
+    
+    Args:
+        widths: Width of every crop after resizing
+        tolerance: Maximum width difference within a bucket (0 groups equal widths only)
+        max_size: Maximum number of crops per bucket
+        
+    Returns:
+        Buckets of indices into `widths`
+    """
+    buckets = []
+    for i in sorted(range(len(widths)), key=lambda i: widths[i]):
+        if buckets and len(buckets[-1]) < max_size and widths[i] - widths[buckets[-1][0]] <= tolerance:
+            buckets[-1].append(i)
+        else:
+            buckets.append([i])
+    return buckets
+
+
+class MappedPredictor(Predictor):
+    """VietOCR Predictor built from an already loaded (memory-mapped) state dict"""
+    
+    def __init__(self, config, state_dict):
+        model, vocab = build_model(config)
+        model.load_state_dict(state_dict, assign=True)
+        
+        self.config = config
+        self.model = model
+        self.vocab = vocab
+        self.device = config['device']
+
+
 class VietOCRService:
-    """VietOCR Model Service"""
+    """
+    VietOCR Model Service
+    
+    Loads MODEL_NAME plus every model named in MODEL_ROUTES. Each crop is
+    recognized by the model its detector class is routed to; unrouted
+    classes and crops without a class use MODEL_NAME.
+    """
     
     def __init__(self):
-        self.predictor = None
+        self.predictors: Dict[str, MappedPredictor] = {}
+        self.model_ids: Dict[str, str] = {}
+        self.cache = RecognitionCache(settings.RECOGNITION_CACHE_SIZE)
         self.model_loaded = False
     
-    def download_custom_model(self):
-        """Download custom model from Google Drive if not exists"""
-        model_path = Path(settings.CUSTOM_MODEL_PATH)
-        
-        # Create weights directory if it doesn't exist
-        model_path.parent.mkdir(parents=True, exist_ok=True)
+    @property
+    def predictor(self) -> Optional[MappedPredictor]:
+        """Predictor of MODEL_NAME"""
+        return self.predictors.get(settings.MODEL_NAME)
+    
+    def status(self) -> dict:
+        """Model state reported by /health"""
+        return {"model_loaded": self.model_loaded, "models": list(self.predictors)}
+    
+    def route(self, field_class: Optional[str] = None) -> str:
+        """Name of the model that recognizes crops of a detector class"""
+        return settings.MODEL_ROUTES.get(field_class, settings.MODEL_NAME) if field_class else settings.MODEL_NAME
+    
+    def resolve_artifacts(self, store: ArtifactStore, model_name: Optional[str] = None) -> Tuple[Path, Path]:
+        """
+        Find the config and weights of a model in the local artifact store (no network access)
         
-        if model_path.exists():
-            logger.info(f"Custom model already exists at {model_path}")
-            return str(model_path)
+        CONFIG_SHA256 and WEIGHTS_SHA256 pin MODEL_NAME only.
         
-        logger.info(f"Downloading custom model from Google Drive...")
-        try:
-            # Download from Google Drive
-            url = f"https://drive.google.com/uc?id={settings.CUSTOM_MODEL_GDRIVE_ID}"
-            gdown.download(url, str(model_path), quiet=False)
-            logger.info(f"Custom model downloaded successfully to {model_path}")
-            return str(model_path)
-        except Exception as e:
-            logger.error(f"Failed to download custom model: {e}")
-            raise
+        Returns:
+            (config path, weights path)
+        """
+        model_name = model_name or settings.MODEL_NAME
+        primary = model_name == settings.MODEL_NAME
+        config_path = store.resolve(config_artifact(model_name), digest=settings.CONFIG_SHA256 if primary else "")
+        source = Path(settings.CUSTOM_MODEL_PATH) if uses_custom_weights(model_name) else None
+        weights_path = store.resolve(
+            weights_artifact(model_name), digest=settings.WEIGHTS_SHA256 if primary else "", source=source
+        )
+        return config_path, weights_path
         
     def load_model(self):
-        """Load the VietOCR model"""
+        """Load MODEL_NAME and the models of MODEL_ROUTES"""
         try:
-            logger.info(f"Loading VietOCR model: {settings.MODEL_NAME}")
-            
-            # Load config
-            config = Cfg.load_config_from_name(settings.MODEL_NAME)
-            
             # Auto-detect and set device
             import torch
             if torch.cuda.is_available():
@@ -64,31 +120,63 @@ class VietOCRService:
                 device = "cpu"
                 logger.warning(f"CUDA not available. Falling back to CPU")
             
-            config['device'] = device
-            
-            # Use custom model if enabled
-            if settings.USE_CUSTOM_MODEL:
-                logger.info("Using custom VietOCR model")
-                weights_path = self.download_custom_model()
-                config['weights'] = weights_path
-                logger.info(f"Custom model weights: {weights_path}")
+            store = ArtifactStore(settings.ARTIFACT_STORE)
+            predictors, model_ids = {}, {}
+            for model_name in model_names():
+                predictors[model_name], model_ids[model_name] = self._load_predictor(store, model_name, device)
             
-            # Create predictor
-            self.predictor = Predictor(config)
+            self.predictors = predictors
+            self.model_ids = model_ids
+            # Cached texts of other models are dropped
+            self.cache.clear()
             self.model_loaded = True
             
-            logger.info(f"VietOCR model loaded successfully on {device}")
+            if settings.MODEL_ROUTES:
+                logger.info(f"Model routes: {settings.MODEL_ROUTES}, other classes: {settings.MODEL_NAME}")
+            logger.info(f"VietOCR models loaded successfully on {device}: {', '.join(predictors)}")
             
         except Exception as e:
             logger.error(f"Failed to load VietOCR model: {e}")
             raise
     
-    def predict(self, image: Union[Image.Image, np.ndarray, str, Path]) -> str:
+    def _load_predictor(self, store: ArtifactStore, model_name: str, device: str) -> Tuple[MappedPredictor, str]:
+        """Build one VietOCR predictor from the artifact store, downloading it first if allowed"""
+        logger.info(f"Loading VietOCR model: {model_name}")
+        
+        try:
+            config_path, weights_path = self.resolve_artifacts(store, model_name)
+        except ArtifactError as e:
+            if not settings.AUTO_SETUP:
+                raise RuntimeError(f"{e}. Run `python -m app.core.setup` first") from e
+            logger.warning(f"{e}. Downloading the model artifacts...")
+            setup_vietocr_artifacts(store, model_name)
+            config_path, weights_path = self.resolve_artifacts(store, model_name)
+        
+        # Load config
+        config = Cfg.load_config_from_file(str(config_path))
+        config['device'] = device
+        config['weights'] = str(weights_path)
+        # The full state dict is loaded below, so the ImageNet backbone weights are not needed
+        if 'pretrained' in config['cnn']:
+            config['cnn']['pretrained'] = False
+        logger.info(
+            f"Model weights: {weights_path.name[:12]} ({'custom' if uses_custom_weights(model_name) else 'default'})"
+        )
+        
+        # Create predictor from memory-mapped weights (shared page cache across workers on CPU)
+        predictor = MappedPredictor(config, load_weights(weights_path, device))
+        return predictor, f"{weights_path.name}:{config_path.name}"
+    
+    def predict(self, image: Union[Image.Image, np.ndarray, str, Path], field_class: Optional[str] = None) -> str:
         """
         Perform OCR on a single image
         
+        Results are cached by a hash of the crop pixels and the model id, so a
+        repeated crop skips preprocessing, encoder and decoder.
+        
         Args:
             image: PIL Image, numpy array, or path to image file
+            field_class: Detector class of the region, selects the model (MODEL_ROUTES)
             
         Returns:
             Recognized text string
@@ -102,35 +190,116 @@ class VietOCRService:
         elif isinstance(image, np.ndarray):
             image = Image.fromarray(image)
         
-        # Perform prediction
-        result = self.predictor.predict(image)
+        model_name = self.route(field_class)
+        predictor = self.predictors[model_name]
+        if not self.cache.enabled:
+            return predictor.predict(image)
+        
+        key = crop_key(image.tobytes(), image.mode, image.size, self.model_ids[model_name])
+        result = self.cache.get(key, field_class)
+        if result is None:
+            # Perform prediction
+            result = predictor.predict(image)
+            self.cache.put(key, result)
         
         return result
     
-    def predict_batch(self, images: List[Union[Image.Image, np.ndarray]]) -> List[str]:
+    def predict_batch(
+        self,
+        images: List[Union[Image.Image, np.ndarray]],
+        field_classes: Optional[List[Optional[str]]] = None
+    ) -> List[str]:
         """
-        Perform OCR on multiple images
+        Perform OCR on multiple images with batched inference
+        
+        Crops missing from the cache are grouped by the model they are routed
+        to. Within a model they are resized to the model height, grouped into
+        width buckets (see width_buckets) and each bucket runs through the
+        encoder and greedy decoder once. Identical crops are recognized once.
         
         Args:
             images: List of PIL Images or numpy arrays
+            field_classes: Detector class of each image, selects the model (MODEL_ROUTES)
             
         Returns:
-            List of recognized text strings
+            List of recognized text strings, in the same order as images
         """
         if not self.model_loaded:
             raise RuntimeError("Model not loaded. Call load_model() first.")
+        if field_classes is None:
+            field_classes = [None] * len(images)
         
-        results = []
-        for image in images:
-            # Convert to PIL Image if needed
-            if isinstance(image, np.ndarray):
-                image = Image.fromarray(image)
-            
-            result = self.predictor.predict(image)
-            results.append(result)
+        images = [Image.fromarray(image) if isinstance(image, np.ndarray) else image for image in images]
+        routes = [self.route(field_class) for field_class in field_classes]
+        keys = [
+            crop_key(image.tobytes(), image.mode, image.size, self.model_ids[model_name])
+            for image, model_name in zip(images, routes)
+        ]
+        if self.cache.enabled:
+            texts = [self.cache.get(key, field_class) for key, field_class in zip(keys, field_classes)]
+        else:
+            texts = [None] * len(images)
         
-        return results
+        pending = {}  # Key -> indices of the images waiting for it
+        for i, (key, text) in enumerate(zip(keys, texts)):
+            if text is None:
+                pending.setdefault(key, []).append(i)
+        
+        by_model = {}  # Model name -> keys it has to recognize
+        for key, indices in pending.items():
+            by_model.setdefault(routes[indices[0]], []).append(key)
+        for model_name, model_keys in by_model.items():
+            predictor = self.predictors[model_name]
+            crops = [images[pending[key][0]] for key in model_keys]
+            if predictor.config['predictor']['beamsearch']:
+                # VietOCR beam search decodes one image at a time
+                decoded = [predictor.predict(crop) for crop in crops]
+            else:
+                decoded = self._recognize_bucketed(predictor, crops)
+            for key, text in zip(model_keys, decoded):
+                self.cache.put(key, text)
+                for i in pending[key]:
+                    texts[i] = text
+        
+        return texts
+    
+    def _recognize_bucketed(self, predictor: MappedPredictor, images: List[Image.Image]) -> List[str]:
+        """Greedy decoding of width-bucketed batches, results in input order"""
+        dataset = predictor.config['dataset']
+        tensors = [
+            process_input(image, dataset['image_height'], dataset['image_min_width'], dataset['image_max_width'])
+            for image in images
+        ]
+        
+        texts = [""] * len(images)
+        buckets = width_buckets(
+            [tensor.shape[-1] for tensor in tensors],
+            settings.BATCH_WIDTH_TOLERANCE,
+            max(1, settings.BATCH_SIZE)
+        )
+        for bucket in buckets:
+            width = max(tensors[i].shape[-1] for i in bucket)
+            # Repeat the right edge column, which is usually background
+            batch = torch.cat([
+                F.pad(tensors[i], (0, width - tensors[i].shape[-1], 0, 0), mode="replicate")
+                for i in bucket
+            ]).to(predictor.device)
+            sentences, _ = translate(batch, predictor.model)
+            for i, text in zip(bucket, predictor.vocab.batch_decode(sentences.tolist())):
+                texts[i] = text
+        
+        return texts
 
 
 # Global service instance
 ocr_service = VietOCRService()
+
+
+def predict(image: Image.Image, field_class: Optional[str] = None) -> str:
+    """VietOCRService.predict on the global service, picklable for the process pool executor"""
+    return ocr_service.predict(image, field_class)
+
+
+def predict_batch(images: List[Image.Image], field_classes: Optional[List[Optional[str]]] = None) -> List[str]:
+    """VietOCRService.predict_batch on the global service, picklable for the process pool executor"""
+    return ocr_service.predict_batch(images, field_classes)
@@ -0,0 +1,15 @@
+"""
+Recognition cache, shared by the OCR services (ai/service_common/cache.py)
+"""
+
+import sys
+from pathlib import Path
+
+# Add the ai/ directory (parent of service_common) to the path
+common_path = Path(__file__).resolve().parents[3]
+if str(common_path) not in sys.path:
+    sys.path.insert(0, str(common_path))
+
+from service_common.cache import OTHER_CLASS, UNKNOWN_CLASS, RecognitionCache, crop_key
+
+__all__ = ["OTHER_CLASS", "UNKNOWN_CLASS", "RecognitionCache", "crop_key"]
@@ -4,7 +4,7 @@ Image processing utilities
 
 from PIL import Image
 import numpy as np
-from typing import List, Tuple
+from typing import BinaryIO, List, Tuple
 import io
 
 
@@ -21,6 +21,21 @@ def load_image_from_bytes(image_bytes: bytes) -> Image.Image:
     return Image.open(io.BytesIO(image_bytes))
 
 
+def load_image_from_file(file: BinaryIO) -> Image.Image:
+    """
+    Load image from a file object and decode it fully
+    
+    Args:
+        file: Binary file object (e.g. a bounded upload buffer)
+        
+    Returns:
+        PIL Image
+    """
+    image = Image.open(file)
+    image.load()
+    return image
+
+
 def crop_image(image: Image.Image, bbox: List[float]) -> Image.Image:
     """
     Crop image using bounding box
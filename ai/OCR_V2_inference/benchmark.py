@@ -0,0 +1,338 @@
+"""
+Benchmark script for the VietOCR service
+
+Usage:
+    python benchmark.py batch
+    python benchmark.py batch --tolerances 0 20 40 --repeat 5
+    python benchmark.py batch --image path/to/card.jpg --bboxes bboxes.json
+    python benchmark.py batcher --concurrency 1 4 16 --requests 64
+    python benchmark.py routing --models vgg_transformer vgg_seq2seq --samples 50
+    python benchmark.py routing --labels labels.json
+
+Runs with the recognition cache disabled, so every crop is really decoded.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Typical fields of the supported documents: (field, text), rendered at the
+# width the text needs, so crops span the same range of aspect ratios as YOLO boxes
+DOCUMENT_FIELDS = {
+    "cccd": [
+        ("so_cccd", "079203012345"),
+        ("ho_ten", "NGUYỄN VĂN AN"),
+        ("ngay_sinh", "01/01/1990"),
+        ("gioi_tinh", "Nam"),
+        ("quoc_tich", "Việt Nam"),
+        ("que_quan", "Phường Bến Nghé, Quận 1, TP Hồ Chí Minh"),
+        ("noi_thuong_tru", "123 Nguyễn Huệ, Phường Bến Nghé, Quận 1, TP Hồ Chí Minh"),
+        ("co_gia_tri_den", "01/01/2030"),
+    ],
+    "bhyt": [
+        ("so_bhyt", "DN4797932123456"),
+        ("ho_ten", "TRẦN THỊ BÌNH"),
+        ("ngay_sinh", "15/08/1985"),
+        ("gioi_tinh", "Nữ"),
+        ("dia_chi", "45 Lê Lợi, Phường Bến Thành, Quận 1, TP Hồ Chí Minh"),
+        ("noi_dkkcb", "Bệnh viện Chợ Rẫy"),
+        ("gia_tri_su_dung", "Từ 01/01/2024 đến 31/12/2024"),
+    ],
+}
+
+# Random values per field class, for per-class accuracy on rendered fields
+SURNAMES = ["NGUYỄN", "TRẦN", "LÊ", "PHẠM", "HOÀNG", "HUỲNH", "VÕ", "ĐẶNG", "BÙI", "ĐỖ"]
+MIDDLE_NAMES = ["VĂN", "THỊ", "HỮU", "ĐỨC", "NGỌC", "MINH", "THANH", "QUỐC"]
+GIVEN_NAMES = ["AN", "BÌNH", "CƯỜNG", "DŨNG", "HÀ", "HẠNH", "KHOA", "LAN", "NGHĨA", "PHƯƠNG", "THẢO", "TUẤN"]
+STREETS = ["Nguyễn Huệ", "Lê Lợi", "Trần Hưng Đạo", "Hai Bà Trưng", "Điện Biên Phủ", "Cách Mạng Tháng Tám"]
+WARDS = ["Phường Bến Nghé", "Phường Bến Thành", "Phường 12", "Phường Tân Định", "Xã Bình Hưng"]
+DISTRICTS = ["Quận 1", "Quận 3", "Quận Bình Thạnh", "Huyện Bình Chánh", "TP Thủ Đức"]
+CITIES = ["TP Hồ Chí Minh", "Hà Nội", "Đà Nẵng", "Cần Thơ", "Bình Dương"]
+HOSPITALS = ["Bệnh viện Chợ Rẫy", "Bệnh viện Nhân dân 115", "Bệnh viện Bạch Mai", "Trạm Y tế Phường 12"]
+
+
+def random_field(field_class: str, rng: random.Random) -> str:
+    """Random text in the format of a field class"""
+    def digits(n):
+        return "".join(rng.choice("0123456789") for _ in range(n))
+
+    def date():
+        return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2035)}"
+
+    def address():
+        return f"{rng.randint(1, 300)} {rng.choice(STREETS)}, {rng.choice(WARDS)}, {rng.choice(DISTRICTS)}, {rng.choice(CITIES)}"
+
+    generators = {
+        "so_cccd": lambda: "0" + digits(11),
+        "so_bhyt": lambda: rng.choice(["DN", "HS", "GD", "HT", "TE"]) + digits(13),
+        "ho_ten": lambda: f"{rng.choice(SURNAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(GIVEN_NAMES)}",
+        "gioi_tinh": lambda: rng.choice(["Nam", "Nữ"]),
+        "quoc_tich": lambda: "Việt Nam",
+        "que_quan": address,
+        "noi_thuong_tru": address,
+        "dia_chi": address,
+        "noi_dkkcb": lambda: rng.choice(HOSPITALS),
+        "gia_tri_su_dung": lambda: f"Từ {date()} đến {date()}",
+    }
+    return generators.get(field_class, date)()
+
+
+def render_field(text: str, height: int = 48):
+    """Dark text on a light background, padded like a detector box"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.load_default(size=int(height * 0.6))
+    except TypeError:  # Pillow < 10.1
+        font = ImageFont.load_default()
+    left, top, right, bottom = font.getbbox(text)
+    image = Image.new("RGB", (right - left + height // 2, height), (235, 235, 225))
+    ImageDraw.Draw(image).text(
+        (height // 4 - left, (height - (bottom - top)) // 2 - top), text, font=font, fill=(20, 20, 30)
+    )
+    return image
+
+
+def load_documents(args):
+    """Crops per document: rendered CCCD/BHYT fields, or the boxes of a real image"""
+    if args.image:
+        from app.utils.image import crop_images_batch, load_image_from_file
+
+        bboxes = Path(args.bboxes).read_text() if Path(args.bboxes).exists() else args.bboxes
+        with open(args.image, "rb") as f:
+            image = load_image_from_file(f).convert("RGB")
+        return {Path(args.image).stem: crop_images_batch(image, json.loads(bboxes))}
+    return {name: [render_field(text) for _, text in fields] for name, fields in DOCUMENT_FIELDS.items()}
+
+
+def time_call(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run_batch(args) -> int:
+    """Per-crop predict vs width-bucketed predict_batch, with padding and agreement per tolerance"""
+    from app.core.config import settings
+    from app.models.ocr_service import ocr_service, width_buckets
+    from vietocr.tool.translate import resize
+
+    ocr_service.load_model()
+    dataset = ocr_service.predictor.config["dataset"]
+
+    print(f"{'document':>10} {'crops':>5} {'tolerance':>9} {'buckets':>7} {'padding':>8} {'ms':>9} {'speedup':>7} {'agree':>6}")
+    exact = True
+    for name, crops in load_documents(args).items():
+        widths = [
+            resize(*crop.size, dataset["image_height"], dataset["image_min_width"], dataset["image_max_width"])[0]
+            for crop in crops
+        ]
+        reference = [ocr_service.predict(crop) for crop in crops]  # Also warms up the model
+        per_crop_ms = time_call(lambda: [ocr_service.predict(crop) for crop in crops], args.repeat)
+        print(f"{name:>10} {len(crops):>5} {'per-crop':>9} {len(crops):>7} {0:>8.1%} {per_crop_ms:>9.1f} {1:>6.2f}x {'-':>6}")
+
+        for tolerance in args.tolerances:
+            settings.BATCH_WIDTH_TOLERANCE = tolerance
+            buckets = width_buckets(widths, tolerance, max(1, settings.BATCH_SIZE))
+            padded = sum(max(widths[i] for i in bucket) * len(bucket) for bucket in buckets)
+            padding = 1 - sum(widths) / padded
+
+            texts = ocr_service.predict_batch(crops)
+            batch_ms = time_call(lambda: ocr_service.predict_batch(crops), args.repeat)
+            agree = sum(a == b for a, b in zip(texts, reference)) / len(crops)
+            if tolerance == 0:
+                exact &= agree == 1.0
+            print(
+                f"{name:>10} {len(crops):>5} {tolerance:>9} {len(buckets):>7} {padding:>8.1%} "
+                f"{batch_ms:>9.1f} {per_crop_ms / batch_ms:>6.2f}x {agree:>6.1%}"
+            )
+
+    print(f"\nTolerance 0 identical to per-crop predict: {exact}")
+    return 0 if exact else 1
+
+
+def run_batcher(args) -> int:
+    """Concurrent requests with and without cross-request micro-batching"""
+    from app.core.config import settings
+    from app.models.batcher import CropBatcher
+    from app.models.ocr_service import ocr_service
+
+    ocr_service.load_model()
+    documents = load_documents(args)
+    crops = documents[args.document] if args.document in documents else next(iter(documents.values()))
+    ocr_service.predict_batch(crops)  # Warmup
+
+    async def load(batching: bool, concurrency: int):
+        batcher = CropBatcher(
+            ocr_service.predict_batch,
+            max_batch_size=settings.BATCH_MAX_CROPS,
+            max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+        )
+        if batching:
+            await batcher.start()
+        latencies = []
+        remaining = iter(range(args.requests))
+
+        async def client():
+            for _ in remaining:
+                start = time.perf_counter()
+                await batcher.submit(crops)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        await batcher.stop()
+        return sorted(latencies), elapsed, batcher.stats.snapshot()
+
+    print(
+        f"{len(crops)} crops per request, BATCH_MAX_CROPS={settings.BATCH_MAX_CROPS}, "
+        f"BATCH_MAX_WAIT_MS={settings.BATCH_MAX_WAIT_MS}"
+    )
+    print(f"{'mode':>11} {'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'fill':>6} {'wait p95 ms':>12}")
+    for concurrency in args.concurrency:
+        for batching in (False, True):
+            latencies, elapsed, stats = asyncio.run(load(batching, concurrency))
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            fill = f"{stats['avg_batch_fill']:>6.1%}" if batching else f"{'-':>6}"
+            wait = f"{stats['queue_wait_ms']['p95']:>12.1f}" if batching else f"{'-':>12}"
+            print(
+                f"{'batched' if batching else 'per-request':>11} {concurrency:>7} {args.requests / elapsed:>7.2f} "
+                f"{statistics.median(latencies):>8.1f} {p95:>8.1f} {fill} {wait}"
+            )
+    return 0
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two strings"""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def load_labeled_fields(args) -> dict:
+    """Field class -> [(crop, ground truth text)], from a labels file or rendered CCCD/BHYT fields"""
+    fields = {}
+    if args.labels:
+        # [{"image": "card.jpg", "bbox": [x1, y1, x2, y2], "class_name": "so_cccd", "text": "079203012345"}, ...]
+        from app.utils.image import crop_images_batch, load_image_from_file
+
+        images = {}
+        for label in json.loads(Path(args.labels).read_text()):
+            if label["image"] not in images:
+                with open(label["image"], "rb") as f:
+                    images[label["image"]] = load_image_from_file(f).convert("RGB")
+            crop = crop_images_batch(images[label["image"]], [label["bbox"]])[0]
+            fields.setdefault(label["class_name"], []).append((crop, label["text"]))
+        return fields
+
+    rng = random.Random(0)
+    for document in DOCUMENT_FIELDS.values():
+        for field_class, _ in document:
+            texts = [random_field(field_class, rng) for _ in range(args.samples)]
+            fields.setdefault(field_class, []).extend((render_field(text), text) for text in texts)
+    return fields
+
+
+def run_routing(args) -> int:
+    """Per-class latency and accuracy of each candidate model, and the routing table they justify"""
+    from app.core.config import settings
+    from app.models.ocr_service import ocr_service
+
+    fields = load_labeled_fields(args)
+    reference = settings.MODEL_NAME
+    models = list(dict.fromkeys([reference, *args.models]))
+
+    results = {}  # (class, model) -> (ms per crop, exact match, CER)
+    for model_name in models:
+        # Route every class to the candidate, exactly as the service would
+        settings.MODEL_ROUTES = {field_class: model_name for field_class in fields}
+        ocr_service.load_model()
+        for field_class, samples in fields.items():
+            crops = [crop for crop, _ in samples]
+            classes = [field_class] * len(crops)
+            texts = ocr_service.predict_batch(crops, classes)  # Also warms up the model
+            # Time distinct crops only, identical ones would be recognized once
+            unique = list({truth: crop for crop, truth in samples}.values())
+            unique_classes = [field_class] * len(unique)
+            ms = time_call(lambda: ocr_service.predict_batch(unique, unique_classes), args.repeat) / len(unique)
+            exact = sum(text == truth for text, (_, truth) in zip(texts, samples)) / len(samples)
+            cer = sum(edit_distance(text, truth) for text, (_, truth) in zip(texts, samples)) / max(
+                1, sum(len(truth) for _, truth in samples)
+            )
+            results[field_class, model_name] = (ms, exact, cer)
+
+    print(f"{'class':>16} {'crops':>5} {'model':>16} {'ms/crop':>8} {'speedup':>7} {'exact':>6} {'CER':>6}")
+    routes = {}
+    for field_class, samples in fields.items():
+        ref_ms, ref_exact, ref_cer = results[field_class, reference]
+        for model_name in models:
+            ms, exact, cer = results[field_class, model_name]
+            print(
+                f"{field_class:>16} {len(samples):>5} {model_name:>16} {ms:>8.2f} "
+                f"{ref_ms / ms:>6.2f}x {exact:>6.1%} {cer:>6.1%}"
+            )
+        # Fastest model whose exact match and CER are at most --max-accuracy-drop worse than MODEL_NAME
+        eligible = [
+            m for m in models
+            if results[field_class, m][1] >= ref_exact - args.max_accuracy_drop
+            and results[field_class, m][2] <= ref_cer + args.max_accuracy_drop
+        ]
+        fastest = min(eligible, key=lambda m: results[field_class, m][0])
+        if fastest != reference:
+            routes[field_class] = fastest
+
+    print(f"\nMODEL_ROUTES='{json.dumps(routes)}'  # other classes: {reference}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VietOCR service benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="Per-crop vs width-bucketed batched recognition")
+    batch.add_argument("--image", help="Real document image instead of rendered CCCD/BHYT fields")
+    batch.add_argument("--bboxes", help="JSON file or JSON string of bounding boxes (with --image)")
+    batch.add_argument("--tolerances", type=int, nargs="+", default=[0, 20, 40, 80], help="BATCH_WIDTH_TOLERANCE values")
+    batch.add_argument("--repeat", type=int, default=5)
+    batch.set_defaults(func=run_batch)
+
+    batcher = subparsers.add_parser("batcher", help="Concurrent requests with vs without cross-request batching")
+    batcher.add_argument("--image", help="Real document image instead of rendered CCCD/BHYT fields")
+    batcher.add_argument("--bboxes", help="JSON file or JSON string of bounding boxes (with --image)")
+    batcher.add_argument("--document", default="cccd", help="Rendered document type (cccd/bhyt) or the image name")
+    batcher.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrent clients")
+    batcher.add_argument("--requests", type=int, default=32, help="Requests per run")
+    batcher.set_defaults(func=run_batcher)
+
+    routing = subparsers.add_parser("routing", help="Per-class latency and accuracy of each model, for MODEL_ROUTES")
+    routing.add_argument("--models", nargs="+", default=["vgg_transformer", "vgg_seq2seq"], help="Candidate models")
+    routing.add_argument("--labels", help="JSON file of labeled boxes instead of rendered CCCD/BHYT fields")
+    routing.add_argument("--samples", type=int, default=20, help="Rendered crops per field class")
+    routing.add_argument("--max-accuracy-drop", type=float, default=0.0, help="Allowed exact-match loss and CER increase against MODEL_NAME")
+    routing.add_argument("--repeat", type=int, default=3)
+    routing.set_defaults(func=run_routing, image=None)
+
+    args = parser.parse_args()
+    if args.image and not args.bboxes:
+        parser.error("--image requires --bboxes")
+    os.environ["RECOGNITION_CACHE_SIZE"] = "0"
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,11 @@ Test script for VietOCR API
 
 import requests
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import io
 import json
+import threading
+import time
 
 
 def test_single_ocr():
@@ -91,6 +95,77 @@ def test_health():
         print(f"Error: {response.status_code}")
 
 
+def test_concurrency(clients=16, requests_per_client=4, max_health_ms=100.0):
+    """
+    Test that the event loop stays responsive under OCR load
+    
+    Sends concurrent /ocr requests while polling /health; /health must keep
+    answering within max_health_ms. Requests beyond the admission capacity
+    are expected to get 503 with a Retry-After header, never to hang.
+    """
+    print("\n=== Testing Concurrency ===")
+    
+    base_url = "http://localhost:8002/api/v1"
+    
+    # Synthetic documents: a few text lines, one bbox each; every request
+    # gets its own numbers, so the recognition cache does not absorb the load
+    from PIL import Image, ImageDraw
+    bboxes = [[10, 10 + i * 70, 400, 50 + i * 70] for i in range(4)]
+    
+    def document(n):
+        image = Image.new("RGB", (640, 320), (235, 235, 225))
+        draw = ImageDraw.Draw(image)
+        for i, text in enumerate(["NGUYEN VAN AN", f"{n % 28 + 1:02d}/01/1990", f"0792030{n:05d}", "TP Ho Chi Minh"]):
+            draw.text((20, 20 + i * 70), text, fill=(20, 20, 30))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        return buffer.getvalue()
+    
+    counter = iter(range(clients * requests_per_client))
+    statuses = []
+    health_ms = []
+    done = threading.Event()
+    
+    def client():
+        for _ in range(requests_per_client):
+            response = requests.post(
+                f"{base_url}/ocr",
+                files={'file': ('test.jpg', document(next(counter)), 'image/jpeg')},
+                data={'bboxes': json.dumps(bboxes)}
+            )
+            statuses.append(response.status_code)
+            if response.status_code == 503:
+                assert 'Retry-After' in response.headers, "503 without Retry-After"
+    
+    def poll_health():
+        while not done.is_set():
+            start = time.perf_counter()
+            requests.get(f"{base_url}/health")
+            health_ms.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.02)
+    
+    poller = threading.Thread(target=poll_health)
+    poller.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(client) for _ in range(clients)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    done.set()
+    poller.join()
+    
+    health_ms.sort()
+    p95 = health_ms[min(len(health_ms) - 1, int(len(health_ms) * 0.95))]
+    print(f"Requests: {len(statuses)} in {elapsed:.1f}s, "
+          f"200: {statuses.count(200)}, 503: {statuses.count(503)}, "
+          f"other: {len(statuses) - statuses.count(200) - statuses.count(503)}")
+    print(f"/health latency over {len(health_ms)} polls: p95 {p95:.1f} ms, max {health_ms[-1]:.1f} ms")
+    
+    passed = p95 <= max_health_ms and set(statuses) <= {200, 503}
+    print(f"{'PASS' if passed else 'FAIL'}: /health p95 <= {max_health_ms} ms, only 200/503 responses")
+    return passed
+
+
 if __name__ == "__main__":
     print("VietOCR API Test Script")
     print("Make sure the API is running on http://localhost:8002")
@@ -104,4 +179,7 @@ if __name__ == "__main__":
     # Test batch OCR
     # test_batch_ocr()
     
+    # Test event loop latency under concurrent load
+    # test_concurrency()
+    
     print("\n=== Tests Complete ===")
@@ -3,25 +3,44 @@ OCR API endpoints
 """
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form
-from typing import List
+from typing import List, Optional
 import json
-import tempfile
-from pathlib import Path
 
 from app.schemas.ocr import OCRRequest, OCRResponse, OCRResult, HealthResponse
 from app.models.ocr_service import get_ocr_service
 from app.core.config import settings
-from app.utils.image import validate_image_size
+from app.utils.upload import UploadTooLarge, spooled_upload
 
 router = APIRouter()
 
 
+def parse_class_names(class_names: Optional[str], count: int) -> List[Optional[str]]:
+    """
+    Parse the class_names form field: a JSON list with one string (or null) per bbox
+
+    Raises:
+        HTTPException: 400 if the field is not such a list
+    """
+    if not class_names:
+        return [None] * count
+    try:
+        names = json.loads(class_names)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid class_names JSON: {e}")
+    if not isinstance(names, list) or not all(name is None or isinstance(name, str) for name in names):
+        raise HTTPException(status_code=400, detail="class_names must be a JSON list of strings or null")
+    if len(names) != count:
+        raise HTTPException(status_code=400, detail="Number of class names must match number of bboxes")
+    return names
+
+
 @router.post("/ocr", response_model=OCRResponse)
 async def ocr_with_bboxes(
     file: UploadFile = File(..., description="Image file to process"),
     bboxes: str = Form(..., description="JSON string of bounding boxes [[x1,y1,x2,y2],...]"),
     confidences: str = Form(..., description="JSON string of confidence scores [0.9, 0.8,...]"),
-    conf_threshold: float = Form(0.5, description="Confidence threshold")
+    conf_threshold: float = Form(0.5, description="Confidence threshold"),
+    class_names: Optional[str] = Form(None, description="JSON string of detector class names [\"ho_ten\",...] (optional, for cache statistics)")
 ):
     """
     Perform OCR on regions defined by bounding boxes
@@ -31,6 +50,7 @@ async def ocr_with_bboxes(
         bboxes: List of bounding boxes as JSON string
         confidences: List of confidence scores as JSON string
         conf_threshold: Minimum confidence threshold (0.0 - 1.0)
+        class_names: Detector class of each box as JSON string (optional)
     
     Returns:
         OCRResponse with detected text for each bounding box
@@ -42,16 +62,6 @@ async def ocr_with_bboxes(
             detail=f"Invalid file type. Allowed types: {settings.ALLOWED_IMAGE_TYPES}"
         )
     
-    # Read file content
-    contents = await file.read()
-    
-    # Validate file size
-    if not validate_image_size(len(contents), settings.MAX_IMAGE_SIZE):
-        raise HTTPException(
-            status_code=400,
-            detail=f"File size exceeds maximum allowed size of {settings.MAX_IMAGE_SIZE} bytes"
-        )
-    
     # Parse bboxes and confidences
     try:
         bboxes_list = json.loads(bboxes)
@@ -68,42 +78,55 @@ async def ocr_with_bboxes(
             status_code=400,
             detail="Number of bboxes must match number of confidences"
         )
+    class_names_list = parse_class_names(class_names, len(bboxes_list))
     
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-        tmp_file.write(contents)
-        tmp_path = tmp_file.name
-    
+    # The body was already spooled (and bounded by BodySizeLimitMiddleware);
+    # check the file size and decode it in place
     try:
-        # Get OCR service
-        ocr_service = get_ocr_service()
-        
-        # Process image
-        results = ocr_service.process_image(
-            tmp_path,
-            bboxes_list,
-            confidences_list,
-            conf_threshold
+        buffer, _ = spooled_upload(file, settings.MAX_IMAGE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File size exceeds maximum allowed size of {settings.MAX_IMAGE_SIZE} bytes"
         )
-        
-        # Format response
-        ocr_results = [
-            OCRResult(
-                bbox=bbox,
-                text=text,
-                confidence=conf
-            )
-            for bbox, text, conf in results
-        ]
-        
-        return OCRResponse(
-            results=ocr_results,
-            total_detections=len(ocr_results)
+    
+    # Get OCR service
+    ocr_service = get_ocr_service()
+    
+    # Process image
+    results = ocr_service.process_image_data(
+        buffer,
+        bboxes_list,
+        confidences_list,
+        conf_threshold,
+        class_names_list
+    )
+    
+    # Format response
+    ocr_results = [
+        OCRResult(
+            bbox=bbox,
+            text=text,
+            confidence=conf
         )
+        for bbox, text, conf in results
+    ]
     
-    finally:
-        # Clean up temporary file
-        Path(tmp_path).unlink(missing_ok=True)
+    return OCRResponse(
+        results=ocr_results,
+        total_detections=len(ocr_results)
+    )
+
+
+@router.get("/cache")
+async def cache_stats():
+    """
+    Recognition cache statistics
+    
+    Returns:
+        Entry count, overall and per-class hits, misses and hit rates
+    """
+    return get_ocr_service().cache.snapshot()
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -4,6 +4,7 @@ Configuration settings for OCR API service
 
 import os
 import torch
+from pathlib import Path
 from pydantic_settings import BaseSettings
 from typing import List
 
@@ -27,17 +28,39 @@ class Settings(BaseSettings):
         "OCR_CNN_Vietnamese/best_ocr_model.pth"
     )
     DEVICE: str = "cuda" if torch.cuda.is_available() else "cpu"
+    # Local content-addressed artifact store, shared by the services on a host (see app/core/artifacts.py)
+    ARTIFACT_STORE: str = os.getenv("ARTIFACT_STORE", str(Path.home() / ".cache" / "ocr-system" / "artifacts"))
+    OCR_MODEL_ARTIFACT: str = "ocr_cnn_vietnamese"  # Store name of the weights imported by setup
+    # Pin the weights by SHA-256; empty resolves OCR_MODEL_PATH, then the digest recorded by setup
+    OCR_MODEL_SHA256: str = os.getenv("OCR_MODEL_SHA256", "")
+    # Inference runtime: "eager" (PyTorch modules) or "torchscript" (frozen, fused graph, see export.py)
+    OCR_RUNTIME: str = os.getenv("OCR_RUNTIME", "eager")
+    TORCHSCRIPT_MODEL_PATH: str = os.getenv(
+        "TORCHSCRIPT_MODEL_PATH",
+        "OCR_CNN_Vietnamese/best_ocr_model.torchscript.pt"
+    )
+    # Weight precision: "fp32" or "int8" (dynamic quantization of the Linear layers, CPU only)
+    OCR_PRECISION: str = os.getenv("OCR_PRECISION", "fp32")
     
-    # Auto-setup settings
-    AUTO_SETUP: bool = os.getenv("AUTO_SETUP", "true").lower() in ("true", "1", "yes")
+    # Auto-setup settings: clone the model code and download the weights at startup
+    # (git, pip and network). Off by default, run `python setup.py` once instead
+    AUTO_SETUP: bool = os.getenv("AUTO_SETUP", "false").lower() in ("true", "1", "yes")
     
     # Image processing settings
     MAX_IMAGE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_REQUEST_SIZE: int = MAX_IMAGE_SIZE + 1024 * 1024  # Image + form fields, larger bodies get 413
     ALLOWED_IMAGE_TYPES: List[str] = ["image/jpeg", "image/png", "image/jpg"]
     
     # OCR settings
     DEFAULT_CONF_THRESHOLD: float = 0.5
     MAX_SEQUENCE_LENGTH: int = 36
+    OCR_BATCH_SIZE: int = 32  # Max crops decoded together in one batch
+    # Crop/resize/normalize all boxes with one roi_align call on the device.
+    # Fastest on GPU; on CPU the per-box PIL path is usually quicker (see benchmark.py preprocess)
+    ROI_ALIGN_CROPS: bool = os.getenv("ROI_ALIGN_CROPS", str(torch.cuda.is_available())).lower() in ("true", "1", "yes")
+    # LRU of recognized text keyed by the normalized crop tensor and model id (0 disables it)
+    RECOGNITION_CACHE_SIZE: int = int(os.getenv("RECOGNITION_CACHE_SIZE", "4096"))
+    KV_CACHE_ENABLED: bool = True  # Incremental decoding with cached keys/values (checked against full decoding at load)
     IMAGE_HEIGHT: int = 32
     IMAGE_WIDTH: int = 128
     
@@ -5,9 +5,12 @@ Handles automatic repository cloning and model downloading
 
 import subprocess
 import os
+import shutil
 from pathlib import Path
 import logging
 
+from app.core.config import settings
+
 logger = logging.getLogger(__name__)
 
 
@@ -152,6 +155,11 @@ def setup_ocr_environment(base_dir: Path = None, model_path: Path = None) -> boo
         logger.error("Failed to download OCR model")
         return False
     
+    # Step 3: Import the weights into the artifact store, so later starts resolve them offline
+    from app.core.artifacts import ArtifactStore
+    digest = ArtifactStore(settings.ARTIFACT_STORE).add(model_path, settings.OCR_MODEL_ARTIFACT)
+    logger.info(f"✓ OCR model stored as sha256 {digest} (pin with OCR_MODEL_SHA256)")
+    
     logger.info("✓ OCR environment setup completed successfully")
     return True
 
@@ -160,12 +168,17 @@ def check_ocr_requirements(base_dir: Path = None) -> dict:
     """
     Check if all OCR requirements are met
     
+    Runs at every startup, so it only looks at the filesystem (no subprocess
+    or network call).
+    
     Args:
         base_dir: Base directory for OCR_inference
     
     Returns:
         Dictionary with status of each requirement
     """
+    from app.core.artifacts import ArtifactStore
+    
     if base_dir is None:
         base_dir = Path(__file__).parent.parent.parent
     
@@ -175,18 +188,14 @@ def check_ocr_requirements(base_dir: Path = None) -> dict:
     status = {
         "repository_exists": repo_path.exists(),
         "repository_path": str(repo_path),
-        "model_exists": model_path.exists(),
+        "model_exists": model_path.exists() or ArtifactStore(settings.ARTIFACT_STORE).ref(settings.OCR_MODEL_ARTIFACT) is not None,
         "model_path": str(model_path),
         "git_available": False,
         "ready": False
     }
     
     # Check if git is available
-    try:
-        subprocess.run(["git", "--version"], capture_output=True, timeout=5)
-        status["git_available"] = True
-    except:
-        pass
+    status["git_available"] = shutil.which("git") is not None
     
     # Overall readiness
     status["ready"] = status["repository_exists"] and status["model_exists"]
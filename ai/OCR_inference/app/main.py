@@ -9,6 +9,7 @@ from app.api import ocr
 from app.core.config import settings
 from app.core.logging import setup_logging
 from app.core.setup import setup_ocr_environment, check_ocr_requirements
+from app.utils.upload import BodySizeLimitMiddleware
 
 # Setup logging
 logger = setup_logging()
@@ -29,6 +30,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized request bodies (413) before they are buffered
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=settings.MAX_REQUEST_SIZE)
+
 # Include routers
 app.include_router(ocr.router, prefix="/api/v1", tags=["OCR"])
 
@@ -44,26 +48,26 @@ async def startup_event():
     status = check_ocr_requirements()
     
     if not status["ready"]:
-        logger.warning("OCR environment not ready. Starting automatic setup...")
+        logger.warning("OCR environment not ready")
         logger.info(f"Repository exists: {status['repository_exists']}")
         logger.info(f"Model exists: {status['model_exists']}")
         
-        # Attempt automatic setup
-        if settings.AUTO_SETUP:
-            logger.info("Auto-setup is enabled. Setting up OCR environment...")
-            success = setup_ocr_environment()
-            
-            if success:
-                logger.info("✓ OCR environment setup completed successfully")
-            else:
-                logger.error("✗ Auto-setup failed. Please set up manually:")
-                logger.error("  1. Clone: git clone https://github.com/BoPDA1607/OCR_CNN_Vietnamese.git")
-                logger.error("  2. Download model: gdown https://drive.google.com/uc?id=1iZv3Iv3oFdvMbJl71TreW1OfYUTyUcJG")
-                logger.error("  3. Move model to OCR_CNN_Vietnamese/best_ocr_model.pth")
-        else:
-            logger.warning("Auto-setup is disabled. Manual setup required:")
-            logger.warning(f"  Repository path: {status['repository_path']}")
-            logger.warning(f"  Model path: {status['model_path']}")
+        # Setup clones the model code, installs its requirements and downloads
+        # the weights, so it only runs at startup when explicitly enabled
+        if not settings.AUTO_SETUP:
+            raise RuntimeError(
+                f"OCR environment not set up (repository: {status['repository_path']}, "
+                f"model: {status['model_path']}). Run `python setup.py` first, or start with AUTO_SETUP=true"
+            )
+        
+        logger.info("Auto-setup is enabled. Setting up OCR environment...")
+        if not setup_ocr_environment():
+            logger.error("✗ Auto-setup failed. Please set up manually:")
+            logger.error("  1. Clone: git clone https://github.com/BoPDA1607/OCR_CNN_Vietnamese.git")
+            logger.error("  2. Download model: gdown https://drive.google.com/uc?id=1iZv3Iv3oFdvMbJl71TreW1OfYUTyUcJG")
+            logger.error("  3. Move model to OCR_CNN_Vietnamese/best_ocr_model.pth")
+            raise RuntimeError("OCR auto-setup failed")
+        logger.info("✓ OCR environment setup completed successfully")
     else:
         logger.info("✓ OCR environment is ready")
 
@@ -0,0 +1,243 @@
+"""
+Incremental decoding with key/value caching for OCRModel
+"""
+
+import threading
+from typing import Callable, List, Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+
+
+class UnsupportedDecoder(ValueError):
+    """Raised when the decoder does not have the layout the cached path relies on"""
+
+
+class IncrementalDecoder:
+    """
+    Greedy decoding that only processes the newest token at every step
+
+    OCRModel's decoder embeds the target prefix and feeds it to an
+    nn.TransformerDecoder followed by a linear output projection. Instead of
+    running the whole prefix through every layer at each step, this class:
+
+    - captures the (projected) encoder memory right before it enters
+      nn.TransformerDecoder, once per batch, and projects it into
+      cross-attention keys/values,
+    - looks up the embedding of the newest token at its position in a table
+      built once from the decoder front-end (token embedding plus positional
+      encoding, which only depends on the token and its position),
+    - caches the self-attention keys/values of every layer, so each step runs
+      the layers on a single token (O(n) instead of O(n^2) per field).
+
+    The layer math mirrors nn.TransformerDecoderLayer (post-norm and pre-norm);
+    `matches_full` compares it against the full decoder before it is used.
+    """
+
+    def __init__(self, model: nn.Module, vocab_size: int):
+        self.model = model
+        decoder = model.decoder
+
+        self.transformer = next(
+            (m for m in decoder.modules() if isinstance(m, nn.TransformerDecoder)), None
+        )
+        if self.transformer is None:
+            raise UnsupportedDecoder("Decoder has no nn.TransformerDecoder")
+
+        inner = set(self.transformer.modules())
+        heads = [
+            m for m in decoder.modules()
+            if isinstance(m, (nn.Linear, DynamicQuantizedLinear))
+            and m.out_features == vocab_size and m not in inner
+        ]
+        if len(heads) != 1:
+            raise UnsupportedDecoder("Could not find the decoder output projection")
+        self.head = heads[0]
+
+        self.layers = list(self.transformer.layers)
+        for layer in self.layers:
+            if not isinstance(layer, nn.TransformerDecoderLayer):
+                raise UnsupportedDecoder(f"Unsupported decoder layer: {type(layer).__name__}")
+            for attn in (layer.self_attn, layer.multihead_attn):
+                if not attn._qkv_same_embed_dim or attn.bias_k is not None or attn.add_zero_attn:
+                    raise UnsupportedDecoder("Unsupported attention configuration")
+        self.batch_first = self.layers[0].self_attn.batch_first
+        self.embeddings: Optional[torch.Tensor] = None  # (vocab, positions, d_model)
+
+        # One hook for the lifetime of the decoder. It only records the inputs
+        # while `_capture` runs on the same thread, so concurrent requests and
+        # plain full-decoder calls are not affected.
+        local = self._local = threading.local()
+
+        def hook(module, args, kwargs):
+            captured = getattr(local, "captured", None)
+            if captured is not None:
+                captured["tgt"] = args[0] if args else kwargs["tgt"]
+                captured["memory"] = args[1] if len(args) > 1 else kwargs["memory"]
+
+        self.transformer.register_forward_pre_hook(hook, with_kwargs=True)
+
+    def _capture(self, ys: torch.Tensor, memory: torch.Tensor, tgt_mask: torch.Tensor):
+        """
+        Run the decoder and record the inputs of its nn.TransformerDecoder
+
+        Returns:
+            (embedded target, transformer memory), both batch first
+        """
+        captured = self._local.captured = {}
+        try:
+            self.model.decoder(ys, memory, tgt_mask=tgt_mask)
+        finally:
+            self._local.captured = None
+
+        if "tgt" not in captured:
+            raise UnsupportedDecoder("Decoder did not call its nn.TransformerDecoder")
+        tgt, transformer_memory = captured["tgt"], captured["memory"]
+        if not self.batch_first:
+            tgt, transformer_memory = tgt.transpose(0, 1), transformer_memory.transpose(0, 1)
+        return tgt, transformer_memory
+
+    def _build_embeddings(self, memory: torch.Tensor, batch_size: int, causal_mask: torch.Tensor) -> torch.Tensor:
+        """
+        Embedding of every token at every position, (vocab, positions, d_model)
+
+        Each decoder call embeds `batch_size` tokens repeated over all positions,
+        so the table takes vocab / batch_size calls and is built once.
+        """
+        vocab_size, length = self.head.out_features, causal_mask.size(0)
+        rows = []
+        for start in range(0, vocab_size, batch_size):
+            tokens = torch.arange(start, start + batch_size, device=memory.device).clamp(max=vocab_size - 1)
+            ys = tokens.unsqueeze(1).expand(batch_size, length)
+            tgt, _ = self._capture(ys, memory, causal_mask)
+            rows.append(tgt[:min(batch_size, vocab_size - start)])
+        return torch.cat(rows)
+
+    def transformer_memory(self, memory: torch.Tensor, batch_size: int, causal_mask: torch.Tensor) -> torch.Tensor:
+        """
+        Encoder memory as nn.TransformerDecoder receives it (batch first)
+
+        Runs the decoder once on a single token. The first call also builds the
+        embedding table used by `embed_last`.
+        """
+        if self.embeddings is None:
+            self.embeddings = self._build_embeddings(memory, batch_size, causal_mask)
+        ys = torch.zeros((batch_size, 1), dtype=torch.long, device=causal_mask.device)
+        _, transformer_memory = self._capture(ys, memory, causal_mask[:1, :1])
+        return transformer_memory
+
+    def embed_last(self, ys: torch.Tensor) -> torch.Tensor:
+        """Embedding of the newest token of every prefix in ys (B, T), shaped (B, 1, d_model)"""
+        position = ys.size(1) - 1
+        return self.embeddings[:, position:position + 1].index_select(0, ys[:, -1])
+
+    def session(
+        self, memory: torch.Tensor, batch_size: int, causal_mask: torch.Tensor
+    ) -> Callable[[torch.Tensor], torch.Tensor]:
+        """
+        Start decoding a batch
+
+        Args:
+            memory: Encoder output for the batch
+            batch_size: Number of sequences in the batch
+            causal_mask: Precomputed square subsequent mask of at least the maximum length
+
+        Returns:
+            Function mapping the token prefix ys (B, T) to next-token logits (B, V).
+            It must be called with prefixes growing by exactly one token per call.
+        """
+        transformer_memory = self.transformer_memory(memory, batch_size, causal_mask)
+        cache = {
+            "self": [None] * len(self.layers),
+            "cross": [self._project_memory(layer.multihead_attn, transformer_memory) for layer in self.layers],
+        }
+
+        def next_logits(ys: torch.Tensor) -> torch.Tensor:
+            x = self._step(self.embed_last(ys), cache)
+            return self.head(x[:, -1])
+
+        return next_logits
+
+    def matches_full(
+        self,
+        memory: torch.Tensor,
+        batch_size: int,
+        causal_mask: torch.Tensor,
+        steps: int = 8,
+        atol: float = 1e-4,
+        seed: int = 0,
+    ) -> bool:
+        """
+        Parity check: teacher-force random tokens and compare the cached logits
+        with the full decoder at every step
+        """
+        generator = torch.Generator().manual_seed(seed)
+        vocab_size = self.head.out_features
+        tokens = torch.randint(vocab_size, (batch_size, steps), generator=generator).to(memory.device)
+
+        next_logits = self.session(memory, batch_size, causal_mask)
+        for length in range(1, steps + 1):
+            ys = tokens[:, :length]
+            full = self.model.decoder(ys, memory, tgt_mask=causal_mask[:length, :length])[:, -1, :]
+            if not torch.allclose(next_logits(ys), full, atol=atol, rtol=1e-4):
+                return False
+        return True
+
+    @staticmethod
+    def _split_heads(x: torch.Tensor, attn: nn.MultiheadAttention) -> torch.Tensor:
+        batch_size, length, _ = x.shape
+        return x.view(batch_size, length, attn.num_heads, attn.head_dim).transpose(1, 2)
+
+    @staticmethod
+    def _merge_heads(x: torch.Tensor) -> torch.Tensor:
+        batch_size, heads, length, head_dim = x.shape
+        return x.transpose(1, 2).reshape(batch_size, length, heads * head_dim)
+
+    def _project_memory(self, attn: nn.MultiheadAttention, memory: torch.Tensor) -> List[torch.Tensor]:
+        """Cross-attention keys/values of the encoder memory, computed once per batch"""
+        d = attn.embed_dim
+        weight, bias = attn.in_proj_weight, attn.in_proj_bias
+        key = F.linear(memory, weight[d:2 * d], bias[d:2 * d] if bias is not None else None)
+        value = F.linear(memory, weight[2 * d:], bias[2 * d:] if bias is not None else None)
+        return [self._split_heads(key, attn), self._split_heads(value, attn)]
+
+    def _self_attention(self, layer, x: torch.Tensor, cache: Optional[List[torch.Tensor]]):
+        attn = layer.self_attn
+        query, key, value = F.linear(x, attn.in_proj_weight, attn.in_proj_bias).chunk(3, dim=-1)
+        key, value = self._split_heads(key, attn), self._split_heads(value, attn)
+        if cache is not None:
+            key = torch.cat([cache[0], key], dim=2)
+            value = torch.cat([cache[1], value], dim=2)
+        # The new token attends to every cached position, so no causal mask is needed
+        out = F.scaled_dot_product_attention(self._split_heads(query, attn), key, value)
+        return attn.out_proj(self._merge_heads(out)), [key, value]
+
+    def _cross_attention(self, layer, x: torch.Tensor, memory_kv: List[torch.Tensor]):
+        attn = layer.multihead_attn
+        d = attn.embed_dim
+        bias = attn.in_proj_bias
+        query = F.linear(x, attn.in_proj_weight[:d], bias[:d] if bias is not None else None)
+        out = F.scaled_dot_product_attention(self._split_heads(query, attn), *memory_kv)
+        return attn.out_proj(self._merge_heads(out))
+
+    @staticmethod
+    def _feed_forward(layer, x: torch.Tensor) -> torch.Tensor:
+        return layer.linear2(layer.dropout(layer.activation(layer.linear1(x))))
+
+    def _step(self, x: torch.Tensor, cache: dict) -> torch.Tensor:
+        for i, layer in enumerate(self.layers):
+            if layer.norm_first:
+                attn_out, cache["self"][i] = self._self_attention(layer, layer.norm1(x), cache["self"][i])
+                x = x + attn_out
+                x = x + self._cross_attention(layer, layer.norm2(x), cache["cross"][i])
+                x = x + self._feed_forward(layer, layer.norm3(x))
+            else:
+                attn_out, cache["self"][i] = self._self_attention(layer, x, cache["self"][i])
+                x = layer.norm1(x + attn_out)
+                x = layer.norm2(x + self._cross_attention(layer, x, cache["cross"][i]))
+                x = layer.norm3(x + self._feed_forward(layer, x))
+        if self.transformer.norm is not None:
+            x = self.transformer.norm(x)
+        return x
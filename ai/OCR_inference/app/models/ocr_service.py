@@ -4,8 +4,11 @@ Handles model loading and inference
 """
 
 import torch
+import torch.nn as nn
 from pathlib import Path
-from typing import List, Tuple
+from typing import BinaryIO, Callable, List, Optional, Tuple, Union
+from PIL import Image
+import logging
 import sys
 import os
 
@@ -18,7 +21,13 @@ from model_cnn_transformer import OCRModel
 from dataset_polygon import char2idx, idx2char
 
 from app.core.config import settings
-from app.utils.image import preprocess_ocr_image, load_image
+from app.core.artifacts import ArtifactError, ArtifactStore, load_weights
+from app.utils.image import preprocess_ocr_image, load_image, image_to_tensor, crop_regions
+from app.utils.cache import RecognitionCache, crop_key
+from app.models.kv_decoder import IncrementalDecoder, UnsupportedDecoder
+from app.models.torchscript import ScriptedOCR, export_model, optimize
+
+logger = logging.getLogger(__name__)
 
 
 class OCRService:
@@ -30,28 +39,153 @@ class OCRService:
         self.vocab_size = len(char2idx)
         self.char2idx = char2idx
         self.idx2char = idx2char
+        self.sos_token = next((token for token in char2idx.keys() if "SOS" in token), None)
+        self.sos_idx = char2idx[self.sos_token]
+        self.eos_idx = char2idx["<EOS>"]
+        self.causal_mask = None
+        self.incremental = None
+        self.scripted = None
+        self.model_id = None
+        self.cache = RecognitionCache(settings.RECOGNITION_CACHE_SIZE)
         self.model_loaded = False
         
     def load_model(self, model_path: str = None):
         """
         Load the OCR model
         
+        The weights are resolved from the local artifact store (no network
+        access): the digest pinned by OCR_MODEL_SHA256, else the model file
+        (imported into the store on first use), else the digest recorded by
+        setup. They are memory-mapped, so on CPU workers share one copy in the
+        page cache.
+        
         Args:
-            model_path: Path to the model weights file
+            model_path: Path to the model weights file (overrides OCR_MODEL_SHA256)
         """
+        pinned = settings.OCR_MODEL_SHA256 if model_path is None else ""
         if model_path is None:
             model_path = settings.OCR_MODEL_PATH
         
-        if not Path(model_path).exists():
-            raise FileNotFoundError(f"Model file not found: {model_path}")
+        store = ArtifactStore(settings.ARTIFACT_STORE)
+        try:
+            weights_path = store.resolve(settings.OCR_MODEL_ARTIFACT, digest=pinned, source=Path(model_path))
+        except ArtifactError as e:
+            raise FileNotFoundError(f"Model file not found: {model_path} ({e})")
         
         self.model = OCRModel(vocab_size=self.vocab_size).to(self.device)
-        self.model.load_state_dict(
-            torch.load(model_path, map_location=self.device)
-        )
+        self.model.load_state_dict(load_weights(weights_path, self.device), assign=True)
         self.model.eval()
+        
+        # Causal mask for the longest prefix, sliced per step instead of rebuilt
+        self.causal_mask = self.model.generate_square_subsequent_mask(
+            settings.MAX_SEQUENCE_LENGTH + 1
+        ).to(self.device)
+        self.incremental = self._load_incremental_decoder() if settings.KV_CACHE_ENABLED else None
+        if settings.OCR_PRECISION == "int8":
+            self.model = self._quantize(self.model)
+            if self.incremental is not None:
+                # Same layout, already checked against the full decoder in FP32
+                self.incremental = IncrementalDecoder(self.model, self.vocab_size)
+        self.scripted = self._load_scripted() if settings.OCR_RUNTIME == "torchscript" else None
+        
+        # Everything that can change the text of a crop; cached texts of another model are dropped
+        runtime = "torchscript" if self.scripted is not None else "eager"
+        self.model_id = f"{weights_path.name}:{settings.OCR_PRECISION}:{runtime}"
+        self.cache.clear()
+        
         self.model_loaded = True
-        print(f"OCR model loaded successfully from {model_path}")
+        print(f"OCR model loaded successfully from {model_path} (sha256 {weights_path.name[:12]})")
+    
+    def _quantize(self, model: nn.Module) -> nn.Module:
+        """
+        Dynamic INT8 quantization of the nn.Linear layers
+        
+        Weights are stored as int8 and activations are quantized per batch at
+        run time. This covers the decoder feed-forward layers and the output
+        projection. nn.MultiheadAttention keeps its projections in FP32: PyTorch
+        excludes its packed in_proj and its out_proj from dynamic quantization.
+        
+        Activation scales depend on the tensor being multiplied, so results can
+        differ slightly with the batch composition and between cached and
+        full-prefix decoding. Parity checks therefore run before quantization.
+        
+        Returns:
+            Quantized model, or the FP32 model on devices other than CPU
+        """
+        if self.device != "cpu":
+            logger.warning(f"INT8 dynamic quantization is CPU only, using FP32 on {self.device}")
+            return model
+        
+        quantized = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        logger.info("INT8 dynamic quantization enabled for Linear layers")
+        return quantized
+    
+    def _load_incremental_decoder(self):
+        """
+        Build the key/value cached decoder and check it against the full decoder
+        
+        Returns:
+            IncrementalDecoder, or None if the model layout is unsupported or the
+            parity check fails (full decoding is used instead)
+        """
+        try:
+            incremental = IncrementalDecoder(self.model, self.vocab_size)
+            generator = torch.Generator().manual_seed(0)
+            images = torch.rand(
+                (2, 3, settings.IMAGE_HEIGHT, settings.IMAGE_WIDTH), generator=generator
+            ).to(self.device)
+            with torch.no_grad():
+                memory = self.model.encoder(images)
+                matches = incremental.matches_full(memory, images.size(0), self.causal_mask)
+        except UnsupportedDecoder as e:
+            logger.warning(f"KV cache disabled, using full decoding: {e}")
+            return None
+        
+        if not matches:
+            logger.warning("KV cache disabled: cached logits do not match the full decoder")
+            return None
+        logger.info("KV cache decoding enabled")
+        return incremental
+    
+    def _load_scripted(self):
+        """
+        Load the TorchScript runtime and check it against the eager model
+        
+        Uses the module saved by export.py at TORCHSCRIPT_MODEL_PATH, or exports
+        one from the loaded weights if the file does not exist.
+        
+        Returns:
+            ScriptedOCR, or None if the export fails or its outputs differ from the
+            eager model (the eager runtime is used instead)
+        """
+        path = Path(settings.TORCHSCRIPT_MODEL_PATH)
+        try:
+            if path.exists():
+                scripted = ScriptedOCR.load(str(path), self.device)
+            else:
+                scripted = ScriptedOCR(optimize(export_model(
+                    self.model, self.vocab_size, self.causal_mask,
+                    settings.IMAGE_HEIGHT, settings.IMAGE_WIDTH
+                )))
+            generator = torch.Generator().manual_seed(0)
+            images = torch.rand(
+                (2, 3, settings.IMAGE_HEIGHT, settings.IMAGE_WIDTH), generator=generator
+            ).to(self.device)
+            matches, max_diff = scripted.matches_eager(
+                self.model, self.vocab_size, images, self.causal_mask, incremental=self.incremental
+            )
+        except (UnsupportedDecoder, RuntimeError) as e:
+            logger.warning(f"TorchScript runtime disabled, using eager runtime: {e}")
+            return None
+        
+        if not matches:
+            logger.warning(
+                f"TorchScript runtime disabled: outputs differ from the eager model by {max_diff:.2e} "
+                f"(re-export {path} with export.py if the weights changed)"
+            )
+            return None
+        logger.info(f"TorchScript runtime enabled ({path if path.exists() else 'exported at startup'})")
+        return scripted
     
     def decode_sequence(self, indices: List[int]) -> str:
         """
@@ -64,107 +198,263 @@ class OCRService:
             Decoded text string
         """
         chars = []
-        SOS_TOKEN = next((token for token in self.char2idx.keys() if "SOS" in token), None)
         
         for idx in indices:
             ch = self.idx2char.get(idx, "")
             if ch == "<EOS>":
                 break
-            if ch not in ("<PAD>", SOS_TOKEN):
+            if ch not in ("<PAD>", self.sos_token):
                 chars.append(ch)
         
         return "".join(chars)
     
-    def recognize_text(self, image_crop) -> str:
+    def recognize_text(self, image_crop, field_class: Optional[str] = None) -> str:
         """
         Recognize text from a cropped image
         
         Args:
             image_crop: PIL Image of the cropped region
+            field_class: Detector class of the region, only used for cache statistics
         
         Returns:
             Recognized text string
         """
+        return self.recognize_batch([image_crop], [field_class])[0]
+    
+    def recognize_batch(self, image_crops: List, field_classes: Optional[List[Optional[str]]] = None) -> List[str]:
+        """
+        Recognize text from several cropped images at once
+        
+        All crops go through the encoder as one tensor and are decoded together
+        with greedy search. Every sequence starts from <SOS> at the same step, so
+        the causal mask keeps each prefix identical to decoding it alone; sequences
+        that already emitted <EOS> keep receiving <EOS> until all are finished.
+        
+        Args:
+            image_crops: List of PIL Images of the cropped regions
+            field_classes: Detector class of each crop, only used for cache statistics
+        
+        Returns:
+            Recognized text strings, in the same order as image_crops
+        """
         if not self.model_loaded:
             raise RuntimeError("Model not loaded. Call load_model() first.")
+        if field_classes is None:
+            field_classes = [None] * len(image_crops)
         
-        # Preprocess image
-        image_tensor = preprocess_ocr_image(
-            image_crop, 
-            height=settings.IMAGE_HEIGHT,
-            width=settings.IMAGE_WIDTH
-        ).to(self.device)
+        texts = []
+        batch_size = max(1, settings.OCR_BATCH_SIZE)
+        for start in range(0, len(image_crops), batch_size):
+            end = start + batch_size
+            texts.extend(self._decode_batch(image_crops[start:end], field_classes[start:end]))
+        return texts
+    
+    def recognize_regions(
+        self,
+        image,
+        bboxes: List[Tuple[int, int, int, int]],
+        field_classes: Optional[List[Optional[str]]] = None
+    ) -> List[str]:
+        """
+        Recognize text in several regions of one image
+        
+        With ROI_ALIGN_CROPS the image is converted to a tensor once and all
+        regions are cropped, resized and normalized in a single roi_align call
+        instead of one PIL crop/resize/ToTensor/Normalize round trip per box.
+        Otherwise the regions are cropped with PIL and decoded as one batch.
+        
+        Args:
+            image: PIL Image (RGB)
+            bboxes: Regions as (x1, y1, x2, y2)
+            field_classes: Detector class of each region, only used for cache statistics
+        
+        Returns:
+            Recognized text strings, in the same order as bboxes
+        """
+        if not self.model_loaded:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+        if not bboxes:
+            return []
+        if field_classes is None:
+            field_classes = [None] * len(bboxes)
+        if not settings.ROI_ALIGN_CROPS:
+            return self.recognize_batch([image.crop(tuple(bbox)) for bbox in bboxes], field_classes)
+        
+        image_tensor = image_to_tensor(image, device=self.device)
+        texts = []
+        batch_size = max(1, settings.OCR_BATCH_SIZE)
+        for start in range(0, len(bboxes), batch_size):
+            end = start + batch_size
+            images = crop_regions(
+                image_tensor,
+                bboxes[start:end],
+                height=settings.IMAGE_HEIGHT,
+                width=settings.IMAGE_WIDTH
+            )
+            texts.extend(self._decode_tensor(images, field_classes[start:end]))
+        return texts
+    
+    def _decode_batch(self, image_crops: List, field_classes: List[Optional[str]]) -> List[str]:
+        if not image_crops:
+            return []
+        
+        # Preprocess images into a single (B, C, H, W) tensor
+        images = torch.cat([
+            preprocess_ocr_image(
+                crop,
+                height=settings.IMAGE_HEIGHT,
+                width=settings.IMAGE_WIDTH
+            )
+            for crop in image_crops
+        ]).to(self.device)
+        return self._decode_tensor(images, field_classes)
+    
+    def _decode_tensor(self, images: torch.Tensor, field_classes: List[Optional[str]]) -> List[str]:
+        """
+        Recognize a preprocessed (B, C, H, W) batch, decoding only the crops not in the cache
+        
+        The key is the hash of the normalized crop tensor plus the model id, so
+        a hit returns exactly what decoding would. Identical crops within the
+        batch are decoded once.
+        """
+        if not self.cache.enabled:
+            return self._greedy_texts(images)
         
-        # Run inference
+        rows = images.detach().cpu().numpy()  # One device-to-host copy per batch
+        keys = [crop_key(row.tobytes(), row.shape, self.model_id) for row in rows]
+        texts = [self.cache.get(key, field_class) for key, field_class in zip(keys, field_classes)]
+        
+        pending = {}  # Key -> indices of the crops waiting for it
+        for i, (key, text) in enumerate(zip(keys, texts)):
+            if text is None:
+                pending.setdefault(key, []).append(i)
+        if pending:
+            decoded = self._greedy_texts(images[[indices[0] for indices in pending.values()]])
+            for (key, indices), text in zip(pending.items(), decoded):
+                self.cache.put(key, text)
+                for i in indices:
+                    texts[i] = text
+        return texts
+    
+    def _greedy_texts(self, images: torch.Tensor) -> List[str]:
+        """Greedy decoding for a preprocessed (B, C, H, W) batch"""
         with torch.no_grad():
-            memory = self.model.encoder(image_tensor)
-            SOS_TOKEN = next((token for token in self.char2idx.keys() if "SOS" in token), None)
-            MAX_LEN = settings.MAX_SEQUENCE_LENGTH
-            ys = torch.tensor([[self.char2idx[SOS_TOKEN]]], device=self.device)
-            
-            for _ in range(MAX_LEN):
-                out = self.model.decoder(
-                    ys,
-                    memory,
-                    tgt_mask=self.model.generate_square_subsequent_mask(ys.size(1)).to(self.device),
-                )
-                prob = out[:, -1, :]
-                _, next_word = torch.max(prob, dim=1)
-                ys = torch.cat([ys, next_word.unsqueeze(1)], dim=1)
-                if next_word.item() == self.char2idx["<EOS>"]:
-                    break
-            
-            pred_text = self.decode_sequence(ys.squeeze(0).tolist())
-        
-        return pred_text
+            if self.scripted is not None:
+                next_logits = self.scripted.session(images)
+            else:
+                memory = self.model.encoder(images)
+                if self.incremental is not None:
+                    next_logits = self.incremental.session(memory, images.size(0), self.causal_mask)
+                else:
+                    next_logits = self._full_decoder(memory)
+            ys = self._greedy_decode(next_logits, images.size(0))
+        
+        return [self.decode_sequence(indices) for indices in ys.tolist()]
+    
+    def _full_decoder(self, memory: torch.Tensor) -> Callable[[torch.Tensor], torch.Tensor]:
+        """Next-token logits by running the whole prefix through the decoder"""
+        def next_logits(ys: torch.Tensor) -> torch.Tensor:
+            length = ys.size(1)
+            out = self.model.decoder(ys, memory, tgt_mask=self.causal_mask[:length, :length])
+            return out[:, -1, :]
+        
+        return next_logits
+    
+    def _greedy_decode(self, next_logits: Callable[[torch.Tensor], torch.Tensor], batch_size: int) -> torch.Tensor:
+        """
+        Greedy search for a batch of sequences
+        
+        Args:
+            next_logits: Maps the prefix ys (B, T) to next-token logits (B, V)
+            batch_size: Number of sequences
+        
+        Returns:
+            Token ids (B, T), starting with <SOS>
+        """
+        ys = torch.full((batch_size, 1), self.sos_idx, dtype=torch.long, device=self.device)
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=self.device)
+        
+        for _ in range(settings.MAX_SEQUENCE_LENGTH):
+            _, next_word = torch.max(next_logits(ys), dim=1)
+            next_word = next_word.masked_fill(finished, self.eos_idx)
+            ys = torch.cat([ys, next_word.unsqueeze(1)], dim=1)
+            finished |= next_word == self.eos_idx
+            if finished.all():
+                break
+        
+        return ys
     
     def process_image(
         self, 
         image_path: str, 
         bboxes: List[List[int]], 
         confidences: List[float],
-        conf_threshold: float = 0.5
+        conf_threshold: float = 0.5,
+        class_names: Optional[List[str]] = None
     ) -> List[Tuple[Tuple[int, int, int, int], str, float]]:
         """
-        Process image with bounding boxes and return OCR results
+        Process an image file with bounding boxes (path-based wrapper around process_image_data)
         
         Args:
             image_path: Path to the input image
             bboxes: List of bounding boxes [[x1, y1, x2, y2], ...]
             confidences: List of confidence scores
             conf_threshold: Minimum confidence threshold
+            class_names: Optional detector class of each box, for per-class cache statistics
+        
+        Returns:
+            List of tuples: [((x1, y1, x2, y2), text, confidence), ...]
+        """
+        return self.process_image_data(Path(image_path), bboxes, confidences, conf_threshold, class_names)
+    
+    def process_image_data(
+        self,
+        image_source: Union[bytes, BinaryIO, Image.Image, Path],
+        bboxes: List[List[int]],
+        confidences: List[float],
+        conf_threshold: float = 0.5,
+        class_names: Optional[List[str]] = None
+    ) -> List[Tuple[Tuple[int, int, int, int], str, float]]:
+        """
+        Process an in-memory image with bounding boxes and return OCR results
+        
+        The image is only decoded if at least one box passes the threshold.
+        
+        Args:
+            image_source: Encoded image bytes, a binary file object (e.g. the
+                upload buffer), or a decoded PIL Image
+            bboxes: List of bounding boxes [[x1, y1, x2, y2], ...]
+            confidences: List of confidence scores
+            conf_threshold: Minimum confidence threshold
+            class_names: Optional detector class of each box, for per-class cache statistics
         
         Returns:
             List of tuples: [((x1, y1, x2, y2), text, confidence), ...]
         """
+        if class_names is None:
+            class_names = [None] * len(bboxes)
+        
         # Filter bboxes by confidence threshold
         filtered_data = [
-            (bbox, conf) 
-            for bbox, conf in zip(bboxes, confidences) 
+            (bbox, conf, class_name)
+            for bbox, conf, class_name in zip(bboxes, confidences, class_names)
             if conf > conf_threshold
         ]
         
         if not filtered_data:
             return []
         
-        # Load image
-        img_pil = load_image(image_path)
-        
-        # Process each bounding box
-        results = []
-        for bbox, conf in filtered_data:
-            x1, y1, x2, y2 = map(int, bbox)
-            
-            # Crop the region
-            crop = img_pil.crop((x1, y1, x2, y2))
-            
-            # Recognize text
-            pred_text = self.recognize_text(crop)
-            
-            # Append result
-            results.append(((x1, y1, x2, y2), pred_text, conf))
-        
-        return results
+        # Decode image
+        img_pil = load_image(image_source)
+        
+        # Crop and recognize every bounding box in one batched pass
+        boxes = [tuple(map(int, bbox)) for bbox, _, _ in filtered_data]
+        texts = self.recognize_regions(img_pil, boxes, [class_name for _, _, class_name in filtered_data])
+        
+        return [
+            (box, pred_text, conf)
+            for box, pred_text, (_, conf, _) in zip(boxes, texts, filtered_data)
+        ]
 
 
 # Global OCR service instance
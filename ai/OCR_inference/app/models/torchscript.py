@@ -0,0 +1,176 @@
+"""
+TorchScript export of OCRModel and the runtime that serves it
+"""
+
+from typing import Callable, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+from app.models.kv_decoder import IncrementalDecoder
+
+EXPORTED_METHODS = ["encode", "step"]
+
+
+class _Exportable(nn.Module):
+    """
+    OCRModel split into the two calls made while decoding
+
+    encode(images) -> (memory, cross_k, cross_v)
+        Encoder output and the cross-attention keys/values of every decoder
+        layer, stacked as (layers, B, heads, S, head_dim).
+
+    step(ys, memory, self_k, self_v, cross_k, cross_v) -> (logits, self_k, self_v)
+        Next-token logits (B, V) for the prefix ys (B, T). Only the newest token
+        is embedded (table lookup) and runs through the decoder layers;
+        self_k/self_v hold the cached self-attention keys/values of the earlier
+        tokens, (layers, B, heads, T - 1, head_dim), and are returned with the
+        new token appended. memory is not read; it stays in the signature so
+        earlier exports load with the same runtime.
+
+    Both methods reuse the IncrementalDecoder math, so they are traced rather
+    than scripted and have no Python control flow that depends on the inputs.
+    """
+
+    def __init__(self, model: nn.Module, incremental: IncrementalDecoder, causal_mask: torch.Tensor):
+        super().__init__()
+        self.model = model
+        self.incremental = incremental
+        self.register_buffer("causal_mask", causal_mask)
+
+    def encode(self, images: torch.Tensor):
+        memory = self.model.encoder(images)
+        transformer_memory = self.incremental.transformer_memory(memory, images.size(0), self.causal_mask)
+        cross = [
+            self.incremental._project_memory(layer.multihead_attn, transformer_memory)
+            for layer in self.incremental.layers
+        ]
+        return memory, torch.stack([k for k, _ in cross]), torch.stack([v for _, v in cross])
+
+    def step(self, ys, memory, self_k, self_v, cross_k, cross_v):
+        cache = {
+            "self": [[k, v] for k, v in zip(self_k.unbind(0), self_v.unbind(0))],
+            "cross": [[k, v] for k, v in zip(cross_k.unbind(0), cross_v.unbind(0))],
+        }
+        x = self.incremental._step(self.incremental.embed_last(ys), cache)
+        logits = self.incremental.head(x[:, -1])
+        return logits, torch.stack([k for k, _ in cache["self"]]), torch.stack([v for _, v in cache["self"]])
+
+
+def export_model(
+    model: nn.Module,
+    vocab_size: int,
+    causal_mask: torch.Tensor,
+    image_height: int,
+    image_width: int,
+) -> torch.jit.ScriptModule:
+    """
+    Trace OCRModel into a frozen TorchScript module with `encode` and `step` methods
+
+    Freezing inlines the weights as constants and removes the unused parts of
+    the traced graph (the single-token transformer run in `encode` that only
+    serves to capture its memory input). Hardware specific rewrites are applied after loading,
+    see `optimize`.
+
+    Raises:
+        UnsupportedDecoder: If the decoder layout is not supported by IncrementalDecoder
+    """
+    incremental = IncrementalDecoder(model, vocab_size)
+    wrapper = _Exportable(model, incremental, causal_mask).eval()
+    device = causal_mask.device
+
+    batch_size, prefix = 2, 3
+    images = torch.rand((batch_size, 3, image_height, image_width), device=device)
+    ys = torch.zeros((batch_size, prefix), dtype=torch.long, device=device)
+    with torch.no_grad():
+        memory, cross_k, cross_v = wrapper.encode(images)
+        shape = list(cross_k.shape)
+        shape[3] = prefix - 1
+        self_k, self_v = cross_k.new_zeros(shape), cross_v.new_zeros(shape)
+
+        traced = torch.jit.trace_module(
+            wrapper,
+            {
+                "encode": (images,),
+                "step": (ys, memory, self_k, self_v, cross_k, cross_v),
+            },
+            check_trace=False,
+        )
+    return torch.jit.freeze(traced.eval(), preserved_attrs=EXPORTED_METHODS)
+
+
+def optimize(module: torch.jit.ScriptModule) -> torch.jit.ScriptModule:
+    """Apply optimize_for_inference (conv/batchnorm folding, oneDNN/prepacked kernels on CPU)"""
+    return torch.jit.optimize_for_inference(module, other_methods=EXPORTED_METHODS)
+
+
+class ScriptedOCR:
+    """Greedy decoding sessions on an exported OCRModel"""
+
+    def __init__(self, module: torch.jit.ScriptModule):
+        self.module = module
+
+    @classmethod
+    def load(cls, path: str, device: str) -> "ScriptedOCR":
+        return cls(optimize(torch.jit.load(path, map_location=device)))
+
+    def session(self, images: torch.Tensor) -> Callable[[torch.Tensor], torch.Tensor]:
+        """
+        Encode a batch and start decoding it
+
+        Returns:
+            Function mapping the token prefix ys (B, T) to next-token logits (B, V).
+            It must be called with prefixes growing by exactly one token per call.
+        """
+        memory, cross_k, cross_v = self.module.encode(images)
+        shape = list(cross_k.shape)
+        shape[3] = 0
+        cache = [cross_k.new_zeros(shape), cross_v.new_zeros(shape)]
+
+        def next_logits(ys: torch.Tensor) -> torch.Tensor:
+            logits, cache[0], cache[1] = self.module.step(ys, memory, cache[0], cache[1], cross_k, cross_v)
+            return logits
+
+        return next_logits
+
+    def matches_eager(
+        self,
+        model: nn.Module,
+        vocab_size: int,
+        images: torch.Tensor,
+        causal_mask: torch.Tensor,
+        incremental: Optional[IncrementalDecoder] = None,
+        steps: int = 8,
+        atol: float = 1e-4,
+        seed: int = 0,
+    ) -> Tuple[bool, float]:
+        """
+        Parity check against the eager model: compare the encoder output, then
+        teacher-force random tokens and compare the logits at every step
+
+        With `incremental` the logits are compared with the eager KV cached
+        decoder instead of the full decoder. Dynamically quantized models need
+        this: their activation scales depend on how many tokens go through a
+        layer, so only the cached path computes the same values.
+
+        Returns:
+            (all within atol, largest absolute difference)
+        """
+        with torch.no_grad():
+            memory = model.encoder(images)
+            exported_memory = self.module.encode(images)[0]
+            max_diff = (memory - exported_memory).abs().max().item()
+
+            generator = torch.Generator().manual_seed(seed)
+            tokens = torch.randint(vocab_size, (images.size(0), steps), generator=generator).to(images.device)
+
+            next_logits = self.session(images)
+            reference = incremental.session(memory, images.size(0), causal_mask) if incremental is not None else None
+            for length in range(1, steps + 1):
+                ys = tokens[:, :length]
+                if reference is not None:
+                    expected = reference(ys)
+                else:
+                    expected = model.decoder(ys, memory, tgt_mask=causal_mask[:length, :length])[:, -1, :]
+                max_diff = max(max_diff, (next_logits(ys) - expected).abs().max().item())
+        return max_diff <= atol, max_diff
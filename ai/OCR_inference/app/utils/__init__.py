@@ -3,5 +3,16 @@ Utils package initialization
 """
 
 from .image import preprocess_ocr_image, load_image, validate_image_size
+from .upload import spooled_upload, UploadTooLarge, BodySizeLimitMiddleware
+from .cache import RecognitionCache, crop_key
 
-__all__ = ["preprocess_ocr_image", "load_image", "validate_image_size"]
+__all__ = [
+    "preprocess_ocr_image",
+    "load_image",
+    "validate_image_size",
+    "spooled_upload",
+    "UploadTooLarge",
+    "BodySizeLimitMiddleware",
+    "RecognitionCache",
+    "crop_key",
+]
@@ -3,11 +3,27 @@ Image processing utilities for OCR
 """
 
 from PIL import Image
+import numpy as np
+import torch
 from torchvision import transforms
+from torchvision.ops import roi_align
+from functools import lru_cache
 import io
-from typing import Union
+from typing import BinaryIO, Sequence, Union
 from pathlib import Path
 
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+@lru_cache(maxsize=None)
+def _ocr_transform(height: int, width: int) -> transforms.Compose:
+    return transforms.Compose([
+        transforms.Resize((height, width)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+    ])
+
 
 def preprocess_ocr_image(pil_img: Image.Image, height: int = 32, width: int = 128):
     """
@@ -21,28 +37,86 @@ def preprocess_ocr_image(pil_img: Image.Image, height: int = 32, width: int = 12
     Returns:
         Preprocessed tensor ready for model input
     """
-    transform = transforms.Compose([
-        transforms.Resize((height, width)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
-    return transform(pil_img).unsqueeze(0)
+    return _ocr_transform(height, width)(pil_img).unsqueeze(0)
+
+
+def image_to_tensor(pil_img: Image.Image, device: str = "cpu") -> torch.Tensor:
+    """
+    Convert a PIL RGB image to a (3, H, W) float tensor in [0, 1]
+    
+    The uint8 pixels are moved to the device before the float conversion, and
+    the result is contiguous so roi_align does not copy it again.
+    
+    Args:
+        pil_img: PIL Image in RGB mode
+        device: Target device
+    
+    Returns:
+        Image tensor on the device
+    """
+    pixels = torch.from_numpy(np.array(pil_img, dtype=np.uint8))
+    return pixels.to(device).permute(2, 0, 1).contiguous().float().div_(255)
 
 
-def load_image(image_source: Union[str, Path, bytes]) -> Image.Image:
+def crop_regions(
+    image_tensor: torch.Tensor,
+    bboxes: Sequence[Sequence[float]],
+    height: int = 32,
+    width: int = 128,
+) -> torch.Tensor:
+    """
+    Crop, resize and normalize all regions of an image at once
+    
+    Uses roi_align with adaptive sampling, so each output pixel averages the
+    source pixels it covers (similar to PIL's antialiased resize). Regions
+    outside the image are zero padded like PIL crop.
+    
+    Args:
+        image_tensor: (3, H, W) image tensor in [0, 1]
+        bboxes: Regions as [x1, y1, x2, y2] in pixel coordinates
+        height: Target height for resizing
+        width: Target width for resizing
+    
+    Returns:
+        Normalized (N, 3, height, width) tensor ready for model input
+    """
+    boxes = torch.tensor(
+        [[0.0, *map(float, bbox)] for bbox in bboxes],
+        dtype=image_tensor.dtype,
+        device=image_tensor.device,
+    )
+    crops = roi_align(
+        image_tensor.unsqueeze(0),
+        boxes,
+        output_size=(height, width),
+        spatial_scale=1.0,
+        sampling_ratio=-1,
+        aligned=True,
+    )
+    mean = torch.tensor(IMAGENET_MEAN, dtype=crops.dtype, device=crops.device).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD, dtype=crops.dtype, device=crops.device).view(1, 3, 1, 1)
+    return crops.sub_(mean).div_(std)
+
+
+def load_image(image_source: Union[str, Path, bytes, BinaryIO, Image.Image]) -> Image.Image:
     """
     Load image from various sources
     
     Args:
-        image_source: Can be file path (str/Path) or bytes
+        image_source: File path (str/Path), encoded bytes, a binary file object
+            positioned at the start of the image, or an already decoded PIL Image
     
     Returns:
         PIL Image object in RGB mode
     """
-    if isinstance(image_source, (str, Path)):
+    if isinstance(image_source, Image.Image):
+        img = image_source
+    elif isinstance(image_source, (str, Path)):
         img = Image.open(image_source)
     elif isinstance(image_source, bytes):
         img = Image.open(io.BytesIO(image_source))
+    elif hasattr(image_source, "read"):
+        img = Image.open(image_source)
     else:
         raise ValueError(f"Unsupported image source type: {type(image_source)}")
     
@@ -0,0 +1,493 @@
+"""
+Benchmark script for the OCR service
+
+Usage:
+    python benchmark.py decode --image path/to/card.jpg --bboxes bboxes.json
+    python benchmark.py kv-cache --image path/to/card.jpg --bboxes bboxes.json
+    python benchmark.py preprocess --image path/to/card.jpg --bboxes bboxes.json
+    python benchmark.py runtime --image path/to/card.jpg --bboxes bboxes.json
+    python benchmark.py quantize --labels crops/labels.tsv
+    python benchmark.py intake --image path/to/card.jpg
+    python benchmark.py cache --image path/to/card.jpg --bboxes bboxes.json --classes classes.json
+
+Every subcommand except `cache` runs with the recognition cache disabled, so
+repeated crops are really decoded.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+def load_bboxes(bboxes: str):
+    """Parse bounding boxes from a JSON file or a JSON string [[x1,y1,x2,y2],...]"""
+    if Path(bboxes).exists():
+        bboxes = Path(bboxes).read_text()
+    return [tuple(map(int, bbox)) for bbox in json.loads(bboxes)]
+
+
+def load_crops(image_path: str, bboxes: str):
+    """Crop regions from an image"""
+    from app.utils.image import load_image
+
+    image = load_image(image_path)
+    return [image.crop(bbox) for bbox in load_bboxes(bboxes)]
+
+
+def load_labeled_crops(labels: str):
+    """Read a labeled crop set: one `path<TAB>text` line per crop, paths relative to the label file"""
+    from app.utils.image import load_image
+
+    root = Path(labels).parent
+    crops, texts = [], []
+    for line in Path(labels).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        path, _, text = line.partition("\t")
+        crops.append(load_image(str(root / path)))
+        texts.append(text)
+    return crops, texts
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two strings"""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def character_error_rate(predictions, references) -> float:
+    """Total edit distance divided by the total number of reference characters"""
+    errors = sum(edit_distance(p, r) for p, r in zip(predictions, references))
+    return errors / max(1, sum(len(r) for r in references))
+
+
+def time_call(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run_decode(args) -> int:
+    """Compare per-crop decoding with batched decoding for typical field counts"""
+    from app.models.ocr_service import get_ocr_service
+
+    service = get_ocr_service()
+    crops = load_crops(args.image, args.bboxes)
+    if not crops:
+        print("No bounding boxes given")
+        return 1
+
+    # Warmup
+    service.recognize_batch(crops)
+
+    failed = False
+    print(f"{'fields':>6} {'per-crop ms':>12} {'batched ms':>11} {'speedup':>8} {'match':>6}")
+    for fields in args.fields:
+        # Repeat the image's crops to reach the requested number of fields
+        batch = [crops[i % len(crops)] for i in range(fields)]
+
+        per_crop = [service.recognize_text(crop) for crop in batch]
+        batched = service.recognize_batch(batch)
+        match = per_crop == batched
+        failed |= not match
+
+        per_crop_ms = time_call(lambda: [service.recognize_text(crop) for crop in batch], args.repeat)
+        batched_ms = time_call(lambda: service.recognize_batch(batch), args.repeat)
+        print(
+            f"{fields:>6} {per_crop_ms:>12.1f} {batched_ms:>11.1f} "
+            f"{per_crop_ms / batched_ms:>7.2f}x {'yes' if match else 'NO':>6}"
+        )
+
+    return 1 if failed else 0
+
+
+def run_kv_cache(args) -> int:
+    """Parity and per-field latency of KV cached decoding vs full-prefix decoding"""
+    from app.models.ocr_service import get_ocr_service
+
+    service = get_ocr_service()
+    if service.incremental is None:
+        print("KV cache decoding is disabled for this model (see startup log)")
+        return 1
+    crops = load_crops(args.image, args.bboxes)
+    if not crops:
+        print("No bounding boxes given")
+        return 1
+
+    incremental = service.incremental
+    try:
+        # Full-prefix decoding, one field at a time
+        service.incremental = None
+        full_texts = service.recognize_batch(crops)
+        full_ms = [time_call(lambda: service.recognize_text(crop), args.repeat) for crop in crops]
+    finally:
+        service.incremental = incremental
+
+    cached_texts = service.recognize_batch(crops)
+    cached_ms = [time_call(lambda: service.recognize_text(crop), args.repeat) for crop in crops]
+
+    failed = False
+    print(f"{'field':>5} {'chars':>5} {'full ms':>8} {'cached ms':>10} {'speedup':>8} {'match':>6}")
+    for i, (full_text, cached_text) in enumerate(zip(full_texts, cached_texts)):
+        match = full_text == cached_text
+        failed |= not match
+        print(
+            f"{i:>5} {len(cached_text):>5} {full_ms[i]:>8.1f} {cached_ms[i]:>10.1f} "
+            f"{full_ms[i] / cached_ms[i]:>7.2f}x {'yes' if match else 'NO':>6}"
+        )
+    print(
+        f"\nMean per field: full {statistics.mean(full_ms):.1f} ms, "
+        f"cached {statistics.mean(cached_ms):.1f} ms"
+    )
+
+    return 1 if failed else 0
+
+
+def run_preprocess(args) -> int:
+    """Per-box PIL preprocessing vs batched roi_align crop extraction"""
+    import torch
+    from app.core.config import settings
+    from app.models.ocr_service import get_ocr_service
+    from app.utils.image import load_image, image_to_tensor, crop_regions, preprocess_ocr_image
+
+    image = load_image(args.image)
+    bboxes = load_bboxes(args.bboxes)
+    if not bboxes:
+        print("No bounding boxes given")
+        return 1
+    height, width = settings.IMAGE_HEIGHT, settings.IMAGE_WIDTH
+
+    def pil_path():
+        return torch.cat([preprocess_ocr_image(image.crop(bbox), height, width) for bbox in bboxes])
+
+    def roi_path():
+        return crop_regions(image_to_tensor(image), bboxes, height, width)
+
+    pil_ms = time_call(pil_path, args.repeat)
+    roi_ms = time_call(roi_path, args.repeat)
+    diff = (pil_path() - roi_path()).abs()
+    print(f"Boxes: {len(bboxes)}")
+    print(f"PIL per box:    {pil_ms:.2f} ms")
+    print(f"roi_align:      {roi_ms:.2f} ms ({pil_ms / roi_ms:.2f}x)")
+    print(f"Pixel diff (normalized): max {diff.max().item():.4f}, mean {diff.mean().item():.4f}")
+
+    if args.with_model:
+        service = get_ocr_service()
+        pil_texts = service.recognize_batch([image.crop(bbox) for bbox in bboxes])
+        roi_align_crops = settings.ROI_ALIGN_CROPS
+        try:
+            settings.ROI_ALIGN_CROPS = True
+            roi_texts = service.recognize_regions(image, bboxes)
+        finally:
+            settings.ROI_ALIGN_CROPS = roi_align_crops
+        same = sum(a == b for a, b in zip(pil_texts, roi_texts))
+        print(f"Identical texts: {same}/{len(bboxes)}")
+        for a, b in zip(pil_texts, roi_texts):
+            if a != b:
+                print(f"  PIL: {a!r}  roi_align: {b!r}")
+
+    return 0
+
+
+def run_runtime(args) -> int:
+    """Latency, throughput and text parity of the eager and TorchScript runtimes"""
+    from app.core.config import settings
+    from app.models.ocr_service import get_ocr_service
+    from app.models.torchscript import ScriptedOCR, export_model, optimize
+
+    service = get_ocr_service()
+    crops = load_crops(args.image, args.bboxes)
+    if not crops:
+        print("No bounding boxes given")
+        return 1
+
+    original = service.scripted
+    scripted = original
+    if scripted is None:
+        if Path(settings.TORCHSCRIPT_MODEL_PATH).exists():
+            scripted = ScriptedOCR.load(settings.TORCHSCRIPT_MODEL_PATH, service.device)
+        else:
+            scripted = ScriptedOCR(optimize(export_model(
+                service.model, service.vocab_size, service.causal_mask,
+                settings.IMAGE_HEIGHT, settings.IMAGE_WIDTH
+            )))
+
+    failed = False
+    print(
+        f"{'fields':>6} {'eager ms':>9} {'script ms':>10} {'speedup':>8} "
+        f"{'eager crops/s':>14} {'script crops/s':>15} {'match':>6}"
+    )
+    for fields in args.fields:
+        batch = [crops[i % len(crops)] for i in range(fields)]
+        timings = {}
+        texts = {}
+        try:
+            for name, runtime in (("eager", None), ("script", scripted)):
+                service.scripted = runtime
+                texts[name] = service.recognize_batch(batch)  # Also warms up the runtime
+                timings[name] = time_call(lambda: service.recognize_batch(batch), args.repeat)
+        finally:
+            service.scripted = original
+        match = texts["eager"] == texts["script"]
+        failed |= not match
+        print(
+            f"{fields:>6} {timings['eager']:>9.1f} {timings['script']:>10.1f} "
+            f"{timings['eager'] / timings['script']:>7.2f}x "
+            f"{fields * 1000 / timings['eager']:>14.1f} {fields * 1000 / timings['script']:>15.1f} "
+            f"{'yes' if match else 'NO':>6}"
+        )
+
+    return 1 if failed else 0
+
+
+def run_evaluate(args) -> int:
+    """CER, latency and peak RSS of the model variant selected by the current settings"""
+    import resource
+    from app.core.config import settings
+    from app.models.ocr_service import get_ocr_service
+
+    crops, references = load_labeled_crops(args.labels)
+    if not crops:
+        print("No labeled crops given")
+        return 1
+    service = get_ocr_service()
+
+    predictions = service.recognize_batch(crops)
+    per_crop_ms = statistics.median(time_call(lambda: service.recognize_text(crop), 1) for crop in crops)
+    batch_ms = time_call(lambda: service.recognize_batch(crops), args.repeat)
+    print(json.dumps({
+        "precision": settings.OCR_PRECISION,
+        "cer": character_error_rate(predictions, references),
+        "exact": sum(p == r for p, r in zip(predictions, references)) / len(references),
+        "per_crop_ms": per_crop_ms,
+        "crops_per_second": len(crops) * 1000 / batch_ms,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+    return 0
+
+
+def run_quantize(args) -> int:
+    """Compare FP32 and dynamic INT8 on a labeled crop set, each variant in a fresh process"""
+    results = []
+    for precision in ("fp32", "int8"):
+        completed = subprocess.run(
+            [sys.executable, __file__, "evaluate", "--labels", args.labels, "--repeat", str(args.repeat)],
+            env={**os.environ, "OCR_PRECISION": precision},
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            print(f"{precision} run failed:\n{completed.stdout}{completed.stderr}")
+            return 1
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"{'precision':>9} {'CER':>7} {'exact':>6} {'per-crop ms':>12} {'crops/s':>8} {'peak RSS MB':>12}")
+    for result in results:
+        print(
+            f"{result['precision']:>9} {result['cer']:>7.2%} {result['exact']:>6.1%} "
+            f"{result['per_crop_ms']:>12.1f} {result['crops_per_second']:>8.1f} {result['peak_rss_mb']:>12.1f}"
+        )
+    fp32, int8 = results
+    print(
+        f"\nINT8 vs FP32: CER {(int8['cer'] - fp32['cer']) * 100:+.2f} points, "
+        f"per-crop latency {fp32['per_crop_ms'] / int8['per_crop_ms']:.2f}x, "
+        f"peak RSS {int8['peak_rss_mb'] - fp32['peak_rss_mb']:+.1f} MB"
+    )
+    return 0
+
+
+def read_proc_io():
+    """I/O counters of this process from /proc/self/io (Linux), or None"""
+    try:
+        text = Path("/proc/self/io").read_text()
+    except OSError:
+        return None
+    return {key: int(value) for key, value in (line.split(": ") for line in text.splitlines())}
+
+
+def run_intake(args) -> int:
+    """Per-request latency and I/O of decoding uploads via a temp file vs in place from the spooled upload"""
+    from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+    from app.utils.image import load_image
+    from starlette.formparsers import MultiPartParser
+
+    spool_size = MultiPartParser.spool_max_size  # Where Starlette spools multipart files
+
+    data = Path(args.image).read_bytes()
+    suffix = Path(args.image).suffix
+
+    def temp_file():
+        # Previous handler: spool the upload, copy it to a named temp file, reopen it by path
+        with SpooledTemporaryFile(max_size=spool_size) as buffer:
+            buffer.write(data)
+            buffer.seek(0)
+            with NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+                shutil.copyfileobj(buffer, tmp_file)
+        try:
+            load_image(tmp_file.name)
+        finally:
+            Path(tmp_file.name).unlink(missing_ok=True)
+
+    def in_place():
+        # Current handler: decode the upload in place from Starlette's spooled file
+        with SpooledTemporaryFile(max_size=spool_size) as buffer:
+            buffer.write(data)
+            buffer.seek(0)
+            load_image(buffer)
+
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        return (time.perf_counter() - start) * 1000
+
+    print(f"Image: {len(data) / 1024:.0f} KB, {args.requests} requests per run")
+    print(
+        f"{'path':>10} {'workers':>7} {'p50 ms':>7} {'p95 ms':>7} {'req/s':>7} "
+        f"{'written KB/req':>15} {'read sys/req':>13} {'write sys/req':>14}"
+    )
+    for workers in args.concurrency:
+        for name, fn in (("temp file", temp_file), ("in place", in_place)):
+            fn()  # Warmup
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                before = read_proc_io()
+                start = time.perf_counter()
+                latencies = sorted(pool.map(lambda _: timed(fn), range(args.requests)))
+                elapsed = time.perf_counter() - start
+                after = read_proc_io()
+
+            if before is not None and after is not None:
+                io = {key: (after[key] - before[key]) / args.requests for key in ("wchar", "syscr", "syscw")}
+                io_columns = f"{io['wchar'] / 1024:>15.1f} {io['syscr']:>13.1f} {io['syscw']:>14.1f}"
+            else:
+                io_columns = f"{'n/a':>15} {'n/a':>13} {'n/a':>14}"
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(
+                f"{name:>10} {workers:>7} {statistics.median(latencies):>7.2f} {p95:>7.2f} "
+                f"{args.requests / elapsed:>7.1f} {io_columns}"
+            )
+
+    return 0
+
+
+def run_cache(args) -> int:
+    """Request latency without the recognition cache, on a miss and on a hit, plus per-class hit rates"""
+    from app.core.config import settings
+    from app.models.ocr_service import get_ocr_service
+    from app.utils.cache import RecognitionCache
+    from app.utils.image import load_image
+
+    service = get_ocr_service()
+    image = load_image(args.image)
+    bboxes = load_bboxes(args.bboxes)
+    if not bboxes:
+        print("No bounding boxes given")
+        return 1
+    classes = json.loads(Path(args.classes).read_text() if Path(args.classes).exists() else args.classes) if args.classes else None
+    confidences = [1.0] * len(bboxes)
+
+    def request():
+        return service.process_image_data(image, bboxes, confidences, 0.0, classes)
+
+    service.cache = RecognitionCache(0)
+    uncached = request()
+    uncached_ms = time_call(request, args.repeat)
+
+    service.cache = RecognitionCache(max(len(bboxes), settings.RECOGNITION_CACHE_SIZE))
+    start = time.perf_counter()
+    first = request()
+    miss_ms = (time.perf_counter() - start) * 1000
+    cached = request()
+    hit_ms = time_call(request, args.repeat)
+
+    print(f"{len(bboxes)} boxes per request")
+    print(f"no cache:   {uncached_ms:8.2f} ms")
+    print(f"cache miss: {miss_ms:8.2f} ms (first request, includes hashing)")
+    print(f"cache hit:  {hit_ms:8.2f} ms ({uncached_ms / hit_ms:.1f}x)")
+    print(f"\n{'class':<24} {'hits':>6} {'misses':>7} {'hit rate':>9}")
+    for name, stats in service.cache.snapshot()["classes"].items():
+        print(f"{name:<24} {stats['hits']:>6} {stats['misses']:>7} {stats['hit_rate']:>9.1%}")
+
+    identical = uncached == first == cached
+    print(f"\nTexts identical with and without cache: {identical}")
+    return 0 if identical else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR service benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    decode = subparsers.add_parser("decode", help="Per-crop vs batched greedy decoding")
+    decode.add_argument("--image", required=True, help="Card image")
+    decode.add_argument("--bboxes", required=True, help="JSON file or JSON string of bounding boxes")
+    decode.add_argument("--fields", type=int, nargs="+", default=[8, 12, 15], help="Number of fields per image")
+    decode.add_argument("--repeat", type=int, default=5)
+    decode.set_defaults(func=run_decode)
+
+    kv_cache = subparsers.add_parser("kv-cache", help="KV cached vs full-prefix decoding per field")
+    kv_cache.add_argument("--image", required=True, help="Card image")
+    kv_cache.add_argument("--bboxes", required=True, help="JSON file or JSON string of bounding boxes")
+    kv_cache.add_argument("--repeat", type=int, default=5)
+    kv_cache.set_defaults(func=run_kv_cache)
+
+    preprocess = subparsers.add_parser("preprocess", help="PIL per-box vs roi_align crop preprocessing")
+    preprocess.add_argument("--image", required=True, help="Card image")
+    preprocess.add_argument("--bboxes", required=True, help="JSON file or JSON string of bounding boxes")
+    preprocess.add_argument("--repeat", type=int, default=20)
+    preprocess.add_argument("--with-model", action="store_true", help="Also compare recognized texts")
+    preprocess.set_defaults(func=run_preprocess)
+
+    runtime = subparsers.add_parser("runtime", help="Eager vs TorchScript runtime")
+    runtime.add_argument("--image", required=True, help="Card image")
+    runtime.add_argument("--bboxes", required=True, help="JSON file or JSON string of bounding boxes")
+    runtime.add_argument("--fields", type=int, nargs="+", default=[1, 8, 15, 32], help="Number of fields per batch")
+    runtime.add_argument("--repeat", type=int, default=10)
+    runtime.set_defaults(func=run_runtime)
+
+    quantize = subparsers.add_parser("quantize", help="FP32 vs dynamic INT8: CER, latency and RSS")
+    quantize.add_argument("--labels", required=True, help="Label file with one `crop path<TAB>text` line per crop")
+    quantize.add_argument("--repeat", type=int, default=5)
+    quantize.set_defaults(func=run_quantize)
+
+    evaluate = subparsers.add_parser("evaluate", help="CER, latency and RSS of the configured model variant")
+    evaluate.add_argument("--labels", required=True, help="Label file with one `crop path<TAB>text` line per crop")
+    evaluate.add_argument("--repeat", type=int, default=5)
+    evaluate.set_defaults(func=run_evaluate)
+
+    intake = subparsers.add_parser("intake", help="Upload decoding via temp file vs in memory under concurrency")
+    intake.add_argument("--image", required=True, help="Card image")
+    intake.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrent requests")
+    intake.add_argument("--requests", type=int, default=200, help="Requests per run")
+    intake.set_defaults(func=run_intake)
+
+    cache = subparsers.add_parser("cache", help="Recognition cache: latency on miss/hit and per-class hit rates")
+    cache.add_argument("--image", required=True, help="Card image")
+    cache.add_argument("--bboxes", required=True, help="JSON file or JSON string of bounding boxes")
+    cache.add_argument("--classes", help="JSON file or JSON string of the class name of each box")
+    cache.add_argument("--repeat", type=int, default=10)
+    cache.set_defaults(func=run_cache)
+
+    args = parser.parse_args()
+    if args.command != "cache":
+        os.environ["RECOGNITION_CACHE_SIZE"] = "0"
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Export the OCR model to TorchScript for the fused CPU runtime (OCR_RUNTIME=torchscript)
+
+Usage:
+    python export.py
+    OCR_PRECISION=int8 python export.py --output model.int8.torchscript.pt
+    python export.py --weights OCR_CNN_Vietnamese/best_ocr_model.pth --output model.torchscript.pt
+"""
+
+import argparse
+import sys
+
+import torch
+
+from app.core.config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export OCRModel to TorchScript")
+    parser.add_argument("--weights", default=settings.OCR_MODEL_PATH, help="Eager model weights (.pth)")
+    parser.add_argument("--output", default=settings.TORCHSCRIPT_MODEL_PATH, help="TorchScript file to write")
+    parser.add_argument("--batch-size", type=int, default=8, help="Batch size of the parity check")
+    parser.add_argument("--atol", type=float, default=1e-4, help="Maximum absolute difference of the logits")
+    args = parser.parse_args()
+
+    from app.models.kv_decoder import UnsupportedDecoder
+    from app.models.ocr_service import OCRService
+    from app.models.torchscript import ScriptedOCR, export_model
+
+    # Export from the eager model, never from a previously exported file
+    settings.OCR_RUNTIME = "eager"
+    service = OCRService()
+    service.load_model(args.weights)
+
+    try:
+        module = export_model(
+            service.model, service.vocab_size, service.causal_mask,
+            settings.IMAGE_HEIGHT, settings.IMAGE_WIDTH
+        )
+    except UnsupportedDecoder as e:
+        print(f"Cannot export this model: {e}")
+        sys.exit(1)
+    torch.jit.save(module, args.output)
+    print(f"Saved {args.output}")
+
+    # Parity check of the saved file against the eager model over a full-length sequence
+    scripted = ScriptedOCR.load(args.output, service.device)
+    generator = torch.Generator().manual_seed(0)
+    images = torch.rand(
+        (args.batch_size, 3, settings.IMAGE_HEIGHT, settings.IMAGE_WIDTH), generator=generator
+    ).to(service.device)
+    # INT8 activation scales depend on the number of tokens per call, so only the
+    # eager cached decoder computes the same logits as the exported step
+    matches, max_diff = scripted.matches_eager(
+        service.model, service.vocab_size, images, service.causal_mask,
+        incremental=service.incremental if settings.OCR_PRECISION == "int8" else None,
+        steps=settings.MAX_SEQUENCE_LENGTH, atol=args.atol
+    )
+    print(f"Max abs difference vs eager: {max_diff:.2e} ({'ok' if matches else 'MISMATCH'})")
+    sys.exit(0 if matches else 1)
+
+
+if __name__ == "__main__":
+    main()
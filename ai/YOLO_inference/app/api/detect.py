@@ -1,85 +1,351 @@
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import numpy as np
+from typing import BinaryIO, List, Optional, Tuple
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from PIL import Image
-import io
 
 from app.models.yolo_detector import YOLODetector
-from app.schemas.detect import DetectResponse, Detection
+from app.models.batcher import InferenceBatcher
+from app.models.registry import ModelRegistry, ModelNotReadyError
+from app.schemas.detect import DetectResponse, Detection, BatchDetectResponse
 from app.core.config import settings
+from app.core.executor import InferenceExecutor, OverloadedError
+from app.core import metrics
+from app.utils.image import decode_image
+from app.utils.cache import ResultCache, content_hash, file_digest
+from app.utils.upload import UploadTooLarge, spooled_upload
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-detector = YOLODetector()  # load model 1 lần duy nhất
+registry = ModelRegistry(YOLODetector, warmup_runs=settings.WARMUP_RUNS)  # load ở background khi startup
+executor = InferenceExecutor(
+    slots=settings.INFERENCE_SLOTS,
+    queue_size=settings.INFERENCE_QUEUE_SIZE,
+    retry_after=settings.RETRY_AFTER_SECONDS,
+)
+
+
+def predict_batch(images, **options):
+    return registry.model.predict_batch(images, **options)
+
+
+batcher = InferenceBatcher(
+    predict_batch,
+    max_batch_size=settings.BATCH_MAX_SIZE,
+    max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+    executor=executor.pool,
+)
+metrics.QUEUE_DEPTH.set_function(batcher.queue_depth)
+metrics.INFERENCE_ADMITTED.set_function(lambda: executor.admitted)
+cache = ResultCache(
+    max_entries=settings.CACHE_MAX_ENTRIES if settings.CACHE_ENABLED else 0,
+    max_bytes=settings.CACHE_MAX_BYTES,
+    ttl_seconds=settings.CACHE_TTL_SECONDS,
+)
+
+
+def not_ready(e: ModelNotReadyError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Model is not ready (state={e.state})",
+        headers={"Retry-After": str(settings.RETRY_AFTER_SECONDS)}
+    )
+
+
+def overloaded(e: OverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is overloaded, please retry later",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def read_upload(file: UploadFile) -> Tuple[BinaryIO, Optional[bytes]]:
+    """
+    Validate file upload (loại file, kích thước) và lấy file Starlette đã spool sẵn.
+
+    Trả về (file, digest) với digest là hash nội dung dùng làm key cache
+    (None khi tắt cache). Starlette tự close file khi request kết thúc.
+    """
+    # Validate file type
+    if file.content_type and file.content_type not in settings.ALLOWED_IMAGE_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Allowed types: {', '.join(settings.ALLOWED_IMAGE_TYPES)}"
+        )
+
+    with metrics.timed("read"):
+        # Body đã được spool (và giới hạn bởi BodySizeLimitMiddleware), chỉ cần kiểm tra kích thước file
+        try:
+            buffer, file_size = spooled_upload(file, settings.MAX_FILE_SIZE)
+        except UploadTooLarge:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+            )
+
+        if not file_size:
+            raise HTTPException(status_code=400, detail="Empty file received")
+
+        digest = None
+        if cache.enabled:
+            digest = await run_in_threadpool(file_digest, buffer)
+    return buffer, digest
+
+
+def timed_decode(buffer: BinaryIO, target_size: Optional[int]):
+    with metrics.timed("decode"):
+        return decode_image(buffer, target_size)
+
+
+async def decode_upload(buffer: BinaryIO) -> Tuple[Image.Image, Tuple[float, float]]:
+    """
+    Decode ảnh trực tiếp từ file upload đã spool (không copy ra bytes).
+
+    Trả về (ảnh, scale) với scale dùng để đưa bbox về tọa độ ảnh gốc.
+    """
+    try:
+        target_size = settings.IMG_SIZE if settings.FAST_DECODE else None
+        return await executor.run(timed_decode, buffer, target_size)
+    except Exception as e:
+        logger.error(f"Invalid image file: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+
+def detection_options(
+    conf_threshold: Optional[float],
+    iou_threshold: Optional[float],
+    max_det: Optional[int],
+    classes: Optional[str],
+) -> dict:
+    """Validate tham số lọc của request, điền giá trị mặc định từ settings"""
+    if conf_threshold is not None and not 0.0 <= conf_threshold <= 1.0:
+        raise HTTPException(status_code=400, detail="conf_threshold must be between 0.0 and 1.0")
+    if iou_threshold is not None and not 0.0 <= iou_threshold <= 1.0:
+        raise HTTPException(status_code=400, detail="iou_threshold must be between 0.0 and 1.0")
+    if max_det is not None and max_det < 1:
+        raise HTTPException(status_code=400, detail="max_det must be >= 1")
+
+    class_ids = None
+    if classes:
+        try:
+            class_ids = registry.model.resolve_classes(classes.split(","))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    options = YOLODetector.inference_args(conf_threshold, iou_threshold, max_det, class_ids)
+    if options["classes"] is not None:
+        # tuple để options hashable (dùng làm key gom batch)
+        options["classes"] = tuple(sorted(set(options["classes"])))
+    return options
+
+
+def cache_key(digest: bytes, options: dict) -> str:
+    """Key cache: hash nội dung ảnh + phiên bản model + các tham số ảnh hưởng tới kết quả"""
+    return content_hash(
+        digest,
+        registry.model.version,
+        settings.IMG_SIZE,
+        settings.FAST_DECODE,
+        sorted(options.items()),
+    )
+
+
+def response_size(response: DetectResponse) -> int:
+    """Ước lượng bộ nhớ (bytes) của một DetectResponse trong cache"""
+    return 256 + 512 * response.num_detections
+
+
+def lookup(digest: Optional[bytes], options: dict) -> Tuple[Optional[str], Optional[DetectResponse]]:
+    """Tra cache theo hash nội dung ảnh, trả về (key, kết quả đã cache hoặc None)"""
+    if digest is None:
+        return None, None
+    key = cache_key(digest, options)
+    return key, cache.get(key)
+
+
+def build_response(result, scale: Tuple[float, float] = (1.0, 1.0)) -> DetectResponse:
+    """
+    Chuyển kết quả YOLO của một ảnh thành DetectResponse.
+
+    Các box đã được lọc theo conf/IoU/class ngay trong model, nên ở đây chỉ
+    cần chuyển toàn bộ tensor [x1, y1, x2, y2, conf, cls] về CPU một lần và
+    scale bbox về tọa độ ảnh gốc.
+    """
+    data = result.boxes.data.cpu().numpy()
+    bboxes = (data[:, :4] * np.array([*scale, *scale], dtype=data.dtype)).tolist()
+    confidences = data[:, 4].tolist()
+    class_ids = data[:, 5].astype(int).tolist()
+
+    detections = [
+        Detection(
+            class_id=class_id,
+            class_name=registry.model.get_class_name(class_id),
+            confidence=confidence,
+            # [x_min, y_min, x_max, y_max] theo tọa độ ảnh gốc
+            bbox=bbox,
+        )
+        for bbox, confidence, class_id in zip(bboxes, confidences, class_ids)
+    ]
+
+    return DetectResponse(
+        num_detections=len(detections),
+        detections=detections
+    )
+
 
 @router.post("/detect", response_model=DetectResponse)
-async def detect(file: UploadFile = File(...)):
+async def detect(
+    request: Request,
+    file: UploadFile = File(...),
+    conf_threshold: Optional[float] = Form(None),
+    iou_threshold: Optional[float] = Form(None),
+    max_det: Optional[int] = Form(None),
+    classes: Optional[str] = Form(None),
+):
     """
     Nhận diện đối tượng trong ảnh sử dụng YOLO model.
-    
+
     - **file**: File ảnh cần nhận diện (jpg, png, etc.)
+    - **conf_threshold**: Ngưỡng confidence (mặc định `CONFIDENCE_THRESHOLD`)
+    - **iou_threshold**: Ngưỡng IoU của NMS (mặc định `IOU_THRESHOLD`)
+    - **max_det**: Số box tối đa (mặc định `MAX_DETECTIONS`)
+    - **classes**: Chỉ giữ các class này, class id hoặc tên class phân cách bằng dấu phẩy
     - **Returns**: Danh sách các đối tượng được phát hiện với confidence >= threshold
     """
+    # Body đã được nhận + parse multipart (spool file upload) trước khi vào handler
+    metrics.observe_receive(request)
     try:
         # Log request
         logger.info(f"Received detection request: filename={file.filename}, content_type={file.content_type}")
-        
-        # Validate file type
-        if file.content_type and file.content_type not in settings.ALLOWED_IMAGE_TYPES:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid file type. Allowed types: {', '.join(settings.ALLOWED_IMAGE_TYPES)}"
-            )
-        
-        # Đọc và validate ảnh
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file received")
-        
-        # Validate file size
-        file_size = len(image_bytes)
-        if file_size > settings.MAX_FILE_SIZE:
+
+        if not registry.ready:
+            raise ModelNotReadyError(registry.state)
+        options = detection_options(conf_threshold, iou_threshold, max_det, classes)
+
+        # Đọc + validate upload trước khi giữ slot inference, upload chậm hay lỗi không chiếm slot
+        buffer, digest = await read_upload(file)
+
+        # Ảnh đã xử lý trước đó: trả kết quả cache, bỏ qua decode + inference
+        key, cached = lookup(digest, options)
+        if cached is not None:
+            logger.info(f"Detection served from cache: {cached.num_detections} objects")
+            return cached
+
+        async with executor.admit():
+            image, scale = await decode_upload(buffer)
+
+            # Inference
+            logger.info(f"Processing image: size={image.size}")
+            result = await batcher.submit(image, **options)
+
+        # Chuyển kết quả (đã lọc trong model) thành response
+        metrics.observe_speed(result)
+        with metrics.timed("postprocess"):
+            response = build_response(result, scale)
+        if key is not None:
+            cache.put(key, response, response_size(response))
+
+        logger.info(f"Detection completed: {response.num_detections} objects found (conf={options['conf']}, iou={options['iou']})")
+
+        return response
+
+    except ModelNotReadyError as e:
+        logger.warning(f"Rejected detection request: model not ready (state={e.state})")
+        raise not_ready(e)
+    except OverloadedError as e:
+        logger.warning(f"Rejected detection request: inference queue full ({executor.admitted}/{executor.capacity})")
+        raise overloaded(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error during detection: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.post("/detect/batch", response_model=BatchDetectResponse)
+async def detect_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    conf_threshold: Optional[float] = Form(None),
+    iou_threshold: Optional[float] = Form(None),
+    max_det: Optional[int] = Form(None),
+    classes: Optional[str] = Form(None),
+):
+    """
+    Nhận diện đối tượng trên nhiều ảnh trong một request (ví dụ mặt trước + mặt sau CCCD).
+
+    - **files**: Danh sách file ảnh, tối đa `MAX_BATCH_FILES` ảnh
+    - **conf_threshold**, **iou_threshold**, **max_det**, **classes**: Như `/detect`, áp dụng cho mọi ảnh
+    - **Returns**: Một DetectResponse cho mỗi ảnh, theo đúng thứ tự upload
+    """
+    metrics.observe_receive(request)
+    try:
+        logger.info(f"Received batch detection request: {len(files)} files")
+
+        if len(files) > settings.MAX_BATCH_FILES:
             raise HTTPException(
-                status_code=400, 
-                detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+                status_code=400,
+                detail=f"Too many files. Maximum files per request: {settings.MAX_BATCH_FILES}"
             )
-        
-        try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        except Exception as e:
-            logger.error(f"Invalid image file: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
-        
-        # Inference
-        logger.info(f"Processing image: size={image.size}")
-        results = detector.predict(image)
-        
-        # Xử lý kết quả với confidence threshold
-        detections = []
-        for box in results[0].boxes:
-            confidence = float(box.conf)
-            
-            # Lọc theo confidence threshold
-            if confidence >= settings.CONFIDENCE_THRESHOLD:
-                class_id = int(box.cls)
-                class_name = detector.get_class_name(class_id)
-                
-                detections.append(Detection(
-                    class_id=class_id,
-                    class_name=class_name,
-                    confidence=confidence,
-                    bbox=box.xyxy[0].tolist()  # [x_min, y_min, x_max, y_max]
-                ))
-        
-        logger.info(f"Detection completed: {len(detections)} objects found (threshold={settings.CONFIDENCE_THRESHOLD})")
-        
-        return DetectResponse(
-            num_detections=len(detections),
-            detections=detections
+
+        if not registry.ready:
+            raise ModelNotReadyError(registry.state)
+        options = detection_options(conf_threshold, iou_threshold, max_det, classes)
+
+        # Đọc + validate mọi upload trước khi giữ slot inference
+        uploads = [await read_upload(file) for file in files]
+        lookups = [lookup(digest, options) for _, digest in uploads]
+
+        # Chỉ decode + inference các ảnh chưa có trong cache
+        missing = [i for i, (_, cached) in enumerate(lookups) if cached is None]
+        decoded, results = [], []
+        if missing:
+            async with executor.admit():
+                decoded = [await decode_upload(uploads[i][0]) for i in missing]
+                # Một forward pass duy nhất cho toàn bộ ảnh còn lại
+                results = await executor.run(predict_batch, [image for image, _ in decoded], **options)
+
+        responses = [cached for _, cached in lookups]
+        for i, result, (_, scale) in zip(missing, results, decoded):
+            metrics.observe_speed(result)
+            with metrics.timed("postprocess"):
+                response = build_response(result, scale)
+            key = lookups[i][0]
+            if key is not None:
+                cache.put(key, response, response_size(response))
+            responses[i] = response
+
+        logger.info(f"Batch detection completed: {[r.num_detections for r in responses]} objects found")
+
+        return BatchDetectResponse(
+            num_images=len(responses),
+            results=responses
         )
-        
+
+    except ModelNotReadyError as e:
+        logger.warning(f"Rejected batch detection request: model not ready (state={e.state})")
+        raise not_ready(e)
+    except OverloadedError as e:
+        logger.warning(f"Rejected batch detection request: inference queue full ({executor.admitted}/{executor.capacity})")
+        raise overloaded(e)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error during detection: {str(e)}", exc_info=True)
+        logger.error(f"Unexpected error during batch detection: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.get("/stats")
+def stats():
+    """Thống kê model, batching, hàng đợi inference và cache kết quả"""
+    return {
+        "model": registry.snapshot(),
+        "batching_enabled": batcher.running,
+        "queue_depth": batcher.queue_depth(),
+        "batcher": batcher.stats.snapshot(),
+        "executor": executor.snapshot(),
+        "cache": cache.snapshot(),
+    }
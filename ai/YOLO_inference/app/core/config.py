@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 import torch
 
 class Settings:
@@ -5,10 +7,41 @@ class Settings:
     API_V1_STR: str = "/api/v1"
 
     DEVICE: str = "cuda" if torch.cuda.is_available() else "cpu"
-    CONFIDENCE_THRESHOLD: float = 0.6  # Ngưỡng confidence tối thiểu
+
+    # Model settings
+    WEIGHTS_PATH: str = "weights/Model_YOLO11s_card.pt"
+    BACKEND: str = "torch"  # torch | onnx | openvino (onnx/openvino được export tự động từ WEIGHTS_PATH)
+    PRECISION: str = "fp32"  # fp32 | int8 (int8 chỉ hỗ trợ BACKEND = "openvino")
+    CALIBRATION_DIR: str = "calibration"  # Thư mục ảnh mẫu để calibrate model INT8
+    IMG_SIZE: int = 640  # Kích thước input cố định của model
+    WARMUP_RUNS: int = 2  # Số lần inference khởi động khi start server
+    CONFIDENCE_THRESHOLD: float = 0.6  # Ngưỡng confidence tối thiểu (mặc định, request có thể override)
+    IOU_THRESHOLD: float = 0.7  # Ngưỡng IoU của NMS (mặc định, request có thể override)
+    MAX_DETECTIONS: int = 300  # Số box tối đa mỗi ảnh sau NMS
+    ALLOWED_CLASSES: Optional[List[int]] = None  # Chỉ giữ các class id này (None = tất cả)
     
     # File upload settings
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_IMAGE_TYPES: list = ["image/jpeg", "image/jpg", "image/png", "image/webp"]
+    MAX_BATCH_FILES: int = 8  # Số ảnh tối đa cho /detect/batch
+    MAX_REQUEST_SIZE: int = MAX_FILE_SIZE + 1024 * 1024  # Giới hạn body request (1 ảnh + form), vượt quá trả 413
+    MAX_BATCH_REQUEST_SIZE: int = MAX_FILE_SIZE * MAX_BATCH_FILES + 1024 * 1024  # Giới hạn body riêng của /detect/batch
+    FAST_DECODE: bool = True  # Decode JPEG ở độ phân giải giảm (gần IMG_SIZE) thay vì full resolution
+
+    # Dynamic micro-batching (gom ảnh từ nhiều request đồng thời)
+    BATCHING_ENABLED: bool = True
+    BATCH_MAX_SIZE: int = 8  # Số ảnh tối đa trong một lần gọi model
+    BATCH_MAX_WAIT_MS: float = 5.0  # Thời gian chờ tối đa để gom batch (ms)
+
+    # Inference executor (decode + inference chạy ngoài event loop)
+    INFERENCE_SLOTS: int = 2  # Số job decode/inference chạy song song
+    INFERENCE_QUEUE_SIZE: int = 16  # Số request tối đa được chờ thêm, vượt quá sẽ trả 503
+    RETRY_AFTER_SECONDS: int = 1  # Giá trị header Retry-After khi quá tải
+
+    # Cache kết quả theo hash nội dung ảnh (ảnh trùng không cần decode + inference lại)
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 1024  # Số kết quả tối đa trong cache
+    CACHE_MAX_BYTES: int = 16 * 1024 * 1024  # Giới hạn bộ nhớ cache (ước lượng), 16MB
+    CACHE_TTL_SECONDS: int = 600  # Thời gian sống của một entry
 
 settings = Settings()
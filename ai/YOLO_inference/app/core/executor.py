@@ -0,0 +1,61 @@
+import asyncio
+import contextlib
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """Hàng đợi inference đã đầy, request bị từ chối ngay lập tức"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Thread pool riêng cho decode ảnh và inference, tách khỏi event loop.
+
+    `slots` là số job CPU chạy song song. Số request được nhận cùng lúc bị giới
+    hạn ở `slots + queue_size`; request vượt quá sẽ bị từ chối với OverloadedError
+    thay vì xếp hàng vô hạn.
+    """
+
+    def __init__(self, slots: int = 2, queue_size: int = 16, retry_after: int = 1):
+        self.slots = max(1, slots)
+        self.capacity = self.slots + max(0, queue_size)
+        self.retry_after = retry_after
+        self.pool = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="inference")
+        self.admitted = 0
+        self.rejected = 0
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        """Giữ một chỗ trong hàng đợi trong suốt thời gian xử lý request"""
+        if self.admitted >= self.capacity:
+            self.rejected += 1
+            raise OverloadedError(self.retry_after)
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.admitted -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+
+    def snapshot(self) -> dict:
+        return {
+            "slots": self.slots,
+            "capacity": self.capacity,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+        logger.info("Inference executor stopped")
@@ -0,0 +1,78 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+# Bucket (giây) từ 0.5ms tới 5s, đủ chi tiết cho cả decode ảnh nhỏ lẫn inference trên CPU
+STAGE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0,
+)
+
+# Stage của một request:
+#   receive     - nhận body + parse multipart (stream và spool file upload), tới lúc vào handler
+# Các stage của một ảnh:
+#   read        - kiểm tra kích thước file upload đã spool + hash nội dung (key cache, khi bật cache)
+#   decode      - decode bytes thành ảnh RGB
+#   preprocess  - letterbox + chuẩn hóa tensor (ultralytics)
+#   inference   - forward pass của model (ultralytics)
+#   nms         - NMS + scale box về ảnh input (ultralytics postprocess)
+#   postprocess - lọc theo confidence và build response
+STAGE_SECONDS = Histogram(
+    "yolo_stage_duration_seconds",
+    "Latency of each detection stage per image",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "yolo_requests_in_flight",
+    "Detection requests currently being processed",
+)
+
+QUEUE_DEPTH = Gauge(
+    "yolo_batch_queue_depth",
+    "Images waiting in the micro-batching queue",
+)
+
+INFERENCE_ADMITTED = Gauge(
+    "yolo_inference_admitted",
+    "Requests holding or waiting for an inference slot",
+)
+
+# Tên key trong `Results.speed` của ultralytics (ms/ảnh) -> tên stage
+ULTRALYTICS_STAGES = {
+    "preprocess": "preprocess",
+    "inference": "inference",
+    "postprocess": "nms",
+}
+
+
+@contextmanager
+def timed(stage: str):
+    """Đo thời gian một đoạn code và ghi vào histogram của stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def observe_receive(request):
+    """Ghi stage receive, tính từ lúc middleware nhận request (request.state.received_at)"""
+    received_at = getattr(request.state, "received_at", None)
+    if received_at is not None:
+        STAGE_SECONDS.labels("receive").observe(time.perf_counter() - received_at)
+
+
+def observe_speed(result):
+    """Ghi thời gian preprocess/inference/NMS mà ultralytics đo cho một ảnh"""
+    speed = getattr(result, "speed", None) or {}
+    for key, stage in ULTRALYTICS_STAGES.items():
+        if speed.get(key) is not None:
+            STAGE_SECONDS.labels(stage).observe(speed[key] / 1000)
+
+
+def render():
+    """Nội dung /metrics theo định dạng text của Prometheus"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,8 +1,12 @@
 import logging
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.detect import router
+from app.api.detect import router, batcher, executor, registry
 from app.core.config import settings
+from app.core import metrics
+from app.utils.upload import BodySizeLimitMiddleware
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,12 +24,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Từ chối body quá lớn (413) trước khi multipart parser đọc hết request.
+# Chỉ /detect/batch được nhận body cỡ nhiều ảnh
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=settings.MAX_REQUEST_SIZE,
+    path_limits={f"{settings.API_V1_STR}/detect/batch": settings.MAX_BATCH_REQUEST_SIZE},
+)
+
+
+@app.middleware("http")
+async def track_in_flight(request: Request, call_next):
+    # Chỉ đếm request detect, không tính /health, /ready, /metrics
+    if not request.url.path.startswith(f"{settings.API_V1_STR}/detect"):
+        return await call_next(request)
+    # Mốc thời gian cho stage receive (đọc body + spool upload)
+    request.state.received_at = time.perf_counter()
+    with metrics.REQUESTS_IN_FLIGHT.track_inprogress():
+        return await call_next(request)
+
+
 app.include_router(
     router,
     prefix=settings.API_V1_STR,
     tags=["Detection"]
 )
 
+@app.on_event("startup")
+async def startup_event():
+    # Load + warmup model ở background (serve.py đã load sẵn trong process cha)
+    registry.start(executor.pool)
+    if settings.BATCHING_ENABLED:
+        await batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await batcher.stop()
+    executor.shutdown()
+
+
 @app.get("/")
 def root():
     return {"status": "ok"}
@@ -34,3 +72,19 @@ def root():
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness: 200 khi model đã load và warmup xong, 503 trong lúc loading hoặc khi load thất bại"""
+    return JSONResponse(
+        status_code=200 if registry.ready else 503,
+        content=registry.snapshot()
+    )
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Latency theo từng stage, số request đang xử lý và độ sâu hàng đợi (Prometheus text format)"""
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
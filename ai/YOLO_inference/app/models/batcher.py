@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatcherStats:
+    """Thống kê kích thước batch và thời gian chờ trong hàng đợi"""
+
+    def __init__(self, window: int = 1000):
+        self.total_batches = 0
+        self.total_items = 0
+        self.batch_sizes = Counter()
+        self._queue_waits = deque(maxlen=window)  # giây, cửa sổ gần nhất
+
+    def record(self, batch_size: int, queue_waits: List[float]):
+        self.total_batches += 1
+        self.total_items += batch_size
+        self.batch_sizes[batch_size] += 1
+        self._queue_waits.extend(queue_waits)
+
+    def snapshot(self) -> dict:
+        waits = sorted(self._queue_waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000
+
+        return {
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "avg_batch_size": self.total_items / self.total_batches if self.total_batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            "queue_wait_ms": {
+                "avg": sum(waits) / len(waits) * 1000 if waits else 0.0,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": waits[-1] * 1000 if waits else 0.0,
+            },
+        }
+
+
+class InferenceBatcher:
+    """
+    Gom ảnh từ các request đồng thời thành một lần gọi model duy nhất.
+
+    Mỗi request gọi `submit(image, **options)` và nhận lại đúng phần kết quả
+    của mình. Một batch được chạy khi đủ `max_batch_size` ảnh hoặc khi ảnh đầu
+    tiên đã chờ quá `max_wait_ms`. Các ảnh trong batch được chia nhóm theo
+    `options` (ví dụ conf/iou), mỗi nhóm là một lần gọi `predict_fn(images,
+    **options)`. Model được gọi trong `executor` (mặc định là executor của
+    event loop).
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[..., List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+    ):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.stats = BatcherStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Inference batcher started: max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f}"
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Hủy các request còn nằm trong hàng đợi
+        while not self._queue.empty():
+            _, future, _, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference batcher stopped"))
+        logger.info("Inference batcher stopped")
+
+    async def submit(self, image: Any, **options) -> Any:
+        """
+        Đưa một ảnh vào hàng đợi và chờ kết quả của riêng ảnh đó.
+
+        `options` được truyền nguyên vẹn vào `predict_fn` và phải hashable;
+        chỉ các ảnh có cùng `options` mới được gom chung một lần gọi model.
+        """
+        loop = asyncio.get_running_loop()
+        key = tuple(sorted(options.items()))
+        if not self.running:
+            # Batcher chưa chạy (ví dụ khi dùng ngoài FastAPI): gọi trực tiếp
+            results = await loop.run_in_executor(self.executor, partial(self.predict_fn, [image], **options))
+            return results[0]
+
+        future = loop.create_future()
+        await self._queue.put((image, future, time.perf_counter(), key))
+        return await future
+
+    async def _collect(self) -> list:
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Lấy thêm các ảnh đã sẵn sàng mà không phải chờ
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            # Bỏ qua các request đã bị hủy (client ngắt kết nối)
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            # Chia nhóm theo options, giữ thứ tự xuất hiện
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[3], []).append(item)
+
+            for key, group in groups.items():
+                images = [image for image, _, _, _ in group]
+                self.stats.record(len(group), [started - enqueued for _, _, enqueued, _ in group])
+
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, partial(self.predict_fn, images, **dict(key))
+                    )
+                except asyncio.CancelledError:
+                    for _, future, _, _ in batch:
+                        if not future.done():
+                            future.set_exception(RuntimeError("Inference batcher stopped"))
+                    raise
+                except Exception as e:
+                    logger.error(f"Batched inference failed for {len(group)} images: {e}", exc_info=True)
+                    for _, future, _, _ in group:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for (_, future, _, _), result in zip(group, results):
+                    if not future.done():
+                        future.set_result(result)
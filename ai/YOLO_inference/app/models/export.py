@@ -0,0 +1,98 @@
+import logging
+import tempfile
+from pathlib import Path
+
+import yaml
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+# Backend được hỗ trợ -> format export của ultralytics
+BACKEND_FORMATS = {
+    "torch": None,
+    "onnx": "onnx",
+    "openvino": "openvino",
+}
+
+# Backend hỗ trợ INT8 (post-training quantization với NNCF)
+INT8_BACKENDS = {"openvino"}
+
+
+def exported_path(weights: str, backend: str, precision: str = "fp32") -> Path:
+    """Đường dẫn model sau khi export (theo quy ước đặt tên của ultralytics)"""
+    weights = Path(weights)
+    if backend == "onnx":
+        return weights.with_suffix(".onnx")
+    if backend == "openvino":
+        suffix = "_int8_openvino_model" if precision == "int8" else "_openvino_model"
+        return weights.parent / f"{weights.stem}{suffix}"
+    return weights
+
+
+def write_calibration_yaml(calibration_dir: str, names: dict) -> str:
+    """Tạo dataset yaml cho ultralytics từ một thư mục ảnh mẫu (không cần label)"""
+    calibration_dir = Path(calibration_dir).resolve()
+    if not calibration_dir.is_dir():
+        raise FileNotFoundError(f"Calibration directory not found: {calibration_dir}")
+
+    data = {"path": str(calibration_dir), "train": ".", "val": ".", "names": names}
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        yaml.safe_dump(data, f, allow_unicode=True)
+        return f.name
+
+
+def export_model(
+    weights: str,
+    backend: str,
+    imgsz: int,
+    precision: str = "fp32",
+    calibration_dir: str = None,
+) -> str:
+    """Export model PyTorch sang ONNX/OpenVINO, trả về đường dẫn model đã export"""
+    fmt = BACKEND_FORMATS[backend]
+    logger.info(f"Exporting {weights} to {backend} {precision} (imgsz={imgsz})...")
+    model = YOLO(weights)
+
+    # dynamic=True để cùng một model chạy được với mọi kích thước batch
+    kwargs = {"format": fmt, "imgsz": imgsz, "dynamic": True}
+    if precision == "int8":
+        data = write_calibration_yaml(calibration_dir, model.names)
+        kwargs.update(int8=True, data=data)
+        try:
+            path = model.export(**kwargs)
+        finally:
+            Path(data).unlink(missing_ok=True)
+    else:
+        path = model.export(**kwargs)
+
+    logger.info(f"Exported {backend} {precision} model to {path}")
+    return str(path)
+
+
+def resolve_weights(
+    weights: str,
+    backend: str,
+    imgsz: int,
+    precision: str = "fp32",
+    calibration_dir: str = None,
+) -> str:
+    """
+    Trả về đường dẫn model cho backend/precision đã chọn, export từ file .pt nếu chưa có.
+
+    Với backend "torch" trả về chính `weights`. Model INT8 được calibrate từ các
+    ảnh trong `calibration_dir`.
+    """
+    if backend not in BACKEND_FORMATS:
+        raise ValueError(f"Unsupported backend: {backend}. Supported: {', '.join(BACKEND_FORMATS)}")
+    if precision not in ("fp32", "int8"):
+        raise ValueError(f"Unsupported precision: {precision}. Supported: fp32, int8")
+    if precision == "int8" and backend not in INT8_BACKENDS:
+        raise ValueError(f"INT8 precision requires backend: {', '.join(INT8_BACKENDS)}")
+    if backend == "torch":
+        return weights
+
+    path = exported_path(weights, backend, precision)
+    if path.exists():
+        logger.info(f"Using exported {backend} {precision} model: {path}")
+        return str(path)
+    return export_model(weights, backend, imgsz, precision, calibration_dir)
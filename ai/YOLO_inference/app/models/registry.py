@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReadyError(Exception):
+    """Model chưa load/warmup xong (hoặc load thất bại)"""
+
+    def __init__(self, state: str):
+        super().__init__(f"Model is not ready (state={state})")
+        self.state = state
+
+
+class ModelRegistry:
+    """
+    Quản lý vòng đời model: load và warmup ở background khi khởi động.
+
+    Trạng thái: idle -> loading -> warming -> ready (hoặc failed). Request chỉ
+    được phục vụ khi trạng thái là ready, để orchestrator chỉ route traffic
+    tới replica đã warmup xong (qua endpoint /ready).
+    """
+
+    def __init__(self, factory: Callable, warmup_runs: Optional[int] = None):
+        self.factory = factory
+        self.warmup_runs = warmup_runs
+        self.state = "idle"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def model(self):
+        """Model đã sẵn sàng, raise ModelNotReadyError nếu chưa"""
+        if not self.ready:
+            raise ModelNotReadyError(self.state)
+        return self._model
+
+    def load(self):
+        """Load + warmup đồng bộ. Gọi nhiều lần chỉ load một lần."""
+        with self._lock:
+            if self.state in ("ready", "loading", "warming"):
+                return
+            self.error = None
+            try:
+                self.state = "loading"
+                start = time.perf_counter()
+                model = self.factory()
+                self.load_seconds = time.perf_counter() - start
+
+                self.state = "warming"
+                start = time.perf_counter()
+                model.warmup(self.warmup_runs)
+                self.warmup_seconds = time.perf_counter() - start
+
+                self._model = model
+                self.state = "ready"
+                logger.info(f"Model ready: load={self.load_seconds:.2f}s, warmup={self.warmup_seconds:.2f}s")
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                logger.error(f"Model loading failed: {e}", exc_info=True)
+
+    def start(self, executor: Optional[Executor] = None) -> Optional[asyncio.Future]:
+        """Bắt đầu load ở background, không chặn startup của server"""
+        if self.ready:
+            return None
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(executor, self.load)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
@@ -1,23 +1,94 @@
 import logging
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
 from ultralytics import YOLO
 from app.core.config import settings
+from app.models.export import resolve_weights
 
 logger = logging.getLogger(__name__)
 
 class YOLODetector:
-    def __init__(self):
-        logger.info("Loading YOLO model...")
-        self.model = YOLO("weights/Model_YOLO11s_card.pt")
-        self.model.to(settings.DEVICE)
-        logger.info(f"YOLO loaded on device: {settings.DEVICE}")
+    def __init__(self, backend: str = None, precision: str = None):
+        self.backend = backend or settings.BACKEND
+        self.precision = precision or settings.PRECISION
+        logger.info(f"Loading YOLO model (backend={self.backend}, precision={self.precision})...")
+        weights = resolve_weights(
+            settings.WEIGHTS_PATH,
+            self.backend,
+            settings.IMG_SIZE,
+            precision=self.precision,
+            calibration_dir=settings.CALIBRATION_DIR,
+        )
+        self.weights = weights
+        self.warmed = False
+        self.model = YOLO(weights, task="detect")
+        if self.backend == "torch":
+            self.model.to(settings.DEVICE)
+            logger.info(f"YOLO loaded on device: {settings.DEVICE}")
+        else:
+            logger.info(f"YOLO loaded from {weights}")
         # Lấy class names từ model
         self.class_names = self.model.names
         logger.info(f"Model has {len(self.class_names)} classes")
 
-    def predict(self, image):
-        results = self.model(image)
+    @property
+    def version(self) -> str:
+        """Định danh model đang phục vụ (đổi weights/backend/precision thì kết quả cache cũ không còn hợp lệ)"""
+        return f"{self.weights}:{self.backend}:{self.precision}"
+
+    def predict(self, image, **options):
+        results = self.model(image, imgsz=settings.IMG_SIZE, **self.inference_args(**options))
         return results
-    
+
+    def predict_batch(self, images, **options):
+        """Chạy một forward pass cho nhiều ảnh, trả về list Results theo đúng thứ tự"""
+        return self.model(list(images), imgsz=settings.IMG_SIZE, **self.inference_args(**options))
+
+    @staticmethod
+    def inference_args(
+        conf: Optional[float] = None,
+        iou: Optional[float] = None,
+        max_det: Optional[int] = None,
+        classes: Optional[Sequence[int]] = None,
+    ) -> dict:
+        """
+        Tham số lọc truyền thẳng vào model: box dưới `conf` hoặc ngoài `classes`
+        bị loại trước NMS, không đi qua NMS và Python.
+        """
+        classes = settings.ALLOWED_CLASSES if classes is None else classes
+        return {
+            "conf": settings.CONFIDENCE_THRESHOLD if conf is None else conf,
+            "iou": settings.IOU_THRESHOLD if iou is None else iou,
+            "max_det": settings.MAX_DETECTIONS if max_det is None else max_det,
+            "classes": list(classes) if classes is not None else None,
+        }
+
+    def resolve_classes(self, values: Sequence[str]) -> List[int]:
+        """Chuyển danh sách class id hoặc tên class thành class id, raise ValueError nếu không tồn tại"""
+        ids_by_name = {name: class_id for class_id, name in self.class_names.items()}
+        class_ids = []
+        for value in values:
+            value = value.strip()
+            if value.isdigit() and int(value) in self.class_names:
+                class_ids.append(int(value))
+            elif value in ids_by_name:
+                class_ids.append(ids_by_name[value])
+            else:
+                raise ValueError(f"Unknown class: {value}")
+        return class_ids
+
+    def warmup(self, runs: int = None):
+        """Chạy inference trên ảnh rỗng kích thước cố định để khởi tạo allocator/kernel"""
+        runs = settings.WARMUP_RUNS if runs is None else runs
+        dummy = np.zeros((settings.IMG_SIZE, settings.IMG_SIZE, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(runs):
+            self.model(dummy, imgsz=settings.IMG_SIZE, verbose=False)
+        self.warmed = True
+        logger.info(f"YOLO warmup done: {runs} runs in {time.perf_counter() - start:.2f}s")
+
     def get_class_name(self, class_id: int) -> str:
         """Lấy tên class từ class_id"""
         return self.class_names.get(int(class_id), f"class_{class_id}")
@@ -10,3 +10,7 @@ class Detection(BaseModel):
 class DetectResponse(BaseModel):
     num_detections: int
     detections: List[Detection]
+
+class BatchDetectResponse(BaseModel):
+    num_images: int
+    results: List[DetectResponse]  # cùng thứ tự với các file upload
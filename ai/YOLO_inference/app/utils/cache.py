@@ -0,0 +1,97 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, BinaryIO, Hashable, Optional
+
+
+def content_hash(data: bytes, *parts: Any) -> str:
+    """Hash nhanh (BLAKE2b 128-bit) của nội dung file cùng các tham số ảnh hưởng tới kết quả"""
+    h = hashlib.blake2b(data, digest_size=16)
+    for part in parts:
+        h.update(b"\0" + repr(part).encode())
+    return h.hexdigest()
+
+
+def file_digest(file: BinaryIO, chunk_size: int = 64 * 1024) -> bytes:
+    """BLAKE2b 128-bit của nội dung file, đọc theo khối rồi seek về đầu (không copy file)"""
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        h.update(chunk)
+    file.seek(0)
+    return h.digest()
+
+
+class ResultCache:
+    """
+    Cache LRU + TTL có giới hạn bộ nhớ.
+
+    Mỗi entry được lưu kèm kích thước ước lượng (bytes). Khi vượt `max_entries`
+    hoặc `max_bytes`, entry ít được dùng nhất bị loại bỏ. Entry quá `ttl_seconds`
+    được coi là miss.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int):
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.current_bytes += size
+            while len(self._data) > self.max_entries or self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self.current_bytes -= size
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -1,5 +1,9 @@
+import io
+from typing import BinaryIO, Optional, Tuple, Union
+
 import cv2
 import numpy as np
+from PIL import Image
 
 def read_image(file_bytes: bytes) -> np.ndarray:
     img_np = np.frombuffer(file_bytes, np.uint8)
@@ -7,3 +11,22 @@ def read_image(file_bytes: bytes) -> np.ndarray:
     if image is None:
         raise ValueError("Invalid image file")
     return image
+
+
+def decode_image(source: Union[bytes, BinaryIO], target_size: Optional[int] = None) -> Tuple[Image.Image, Tuple[float, float]]:
+    """
+    Decode ảnh (bytes hoặc file object) thành PIL RGB.
+
+    Với JPEG và `target_size`, ảnh được giảm kích thước ngay trong miền DCT khi
+    decode (PIL `draft`, hệ số 1/2, 1/4 hoặc 1/8) sao cho cả hai cạnh vẫn
+    >= target_size. Trả về (ảnh, (scale_x, scale_y)) để nhân tọa độ trên ảnh đã
+    decode về tọa độ ảnh gốc.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    original_width, original_height = image.size
+    if target_size and image.format == "JPEG":
+        image.draft("RGB", (target_size, target_size))
+    image = image.convert("RGB")
+    return image, (original_width / image.width, original_height / image.height)
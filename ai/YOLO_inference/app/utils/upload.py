@@ -0,0 +1,15 @@
+"""
+Giới hạn kích thước upload, dùng chung với các service OCR và pipeline (ai/service_common/upload.py)
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục ai/ (chứa service_common) vào sys.path
+common_path = Path(__file__).resolve().parents[3]
+if str(common_path) not in sys.path:
+    sys.path.insert(0, str(common_path))
+
+from service_common.upload import BodySizeLimitMiddleware, UploadTooLarge, spooled_upload
+
+__all__ = ["BodySizeLimitMiddleware", "UploadTooLarge", "spooled_upload"]
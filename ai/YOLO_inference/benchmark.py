@@ -0,0 +1,390 @@
+"""
+Benchmark script cho YOLO Inference Service
+
+Ví dụ:
+    python benchmark.py load --image test.jpg --concurrency 8 --requests 200
+    python benchmark.py backends --image-dir samples/ --backends onnx openvino
+    python benchmark.py int8-report --image-dir samples/
+    python benchmark.py decode --image-dir samples/
+    python benchmark.py memory --pid <pid của serve.py> --image test.jpg
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import psutil
+import requests
+from PIL import Image
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def load_images(image_dir):
+    paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise SystemExit(f"No images found in {image_dir}")
+    return [(p.name, Image.open(p).convert("RGB")) for p in paths]
+
+
+def extract_boxes(result, conf_threshold):
+    """(xyxy, cls, conf) dạng numpy của các box có confidence >= threshold"""
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy()
+    cls = boxes.cls.cpu().numpy().astype(int)
+    conf = boxes.conf.cpu().numpy()
+    keep = conf >= conf_threshold
+    return xyxy[keep], cls[keep], conf[keep]
+
+
+def box_iou(a, b):
+    """IoU giữa từng cặp box của a (N, 4) và b (M, 4)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter)
+
+
+def match_boxes(ref, other, iou_threshold):
+    """
+    Ghép box của `other` với box tham chiếu cùng class (greedy theo IoU).
+
+    Trả về list (ref_index, other_index, iou) của các cặp có IoU >= iou_threshold.
+    """
+    ref_xyxy, ref_cls, _ = ref
+    other_xyxy, other_cls, _ = other
+    iou = box_iou(ref_xyxy, other_xyxy)
+    iou[ref_cls[:, None] != other_cls[None, :]] = 0
+
+    matches = []
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        matches.append((i, j, float(iou[i, j])))
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matches
+
+
+def average_precision(refs, preds, iou_threshold):
+    """
+    mAP (101 điểm nội suy, như COCO) của `preds` khi coi `refs` là ground truth.
+
+    refs/preds: list theo từng ảnh các bộ (xyxy, cls, conf).
+    """
+    classes = sorted(set(np.concatenate([ref[1] for ref in refs]).tolist())) if refs else []
+    aps = []
+    for c in classes:
+        num_gt = sum(int((ref[1] == c).sum()) for ref in refs)
+        scored = []  # (confidence, true positive)
+        for ref, pred in zip(refs, preds):
+            gt = ref[0][ref[1] == c]
+            mask = pred[1] == c
+            p_xyxy, p_conf = pred[0][mask], pred[2][mask]
+            iou = box_iou(p_xyxy, gt)
+            used = set()
+            for k in np.argsort(-p_conf):
+                candidates = [(iou[k, j], j) for j in range(len(gt)) if j not in used and iou[k, j] >= iou_threshold]
+                if candidates:
+                    used.add(max(candidates)[1])
+                scored.append((p_conf[k], bool(candidates)))
+
+        scored.sort(key=lambda x: -x[0])
+        tp = np.cumsum([hit for _, hit in scored])
+        fp = np.cumsum([not hit for _, hit in scored])
+        recall = tp / max(num_gt, 1)
+        precision = tp / np.maximum(tp + fp, 1)
+        ap = 0.0
+        for r in np.linspace(0, 1, 101):
+            above = precision[recall >= r] if len(recall) else []
+            ap += (max(above) if len(above) else 0.0) / 101
+        aps.append(ap)
+    return float(np.mean(aps)) if aps else 1.0
+
+
+def model_size_mb(path):
+    path = Path(path)
+    files = path.rglob("*") if path.is_dir() else [path]
+    return sum(f.stat().st_size for f in files if f.is_file()) / (1024 * 1024)
+
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def time_predict(detector, images, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for _, image in images:
+            start = time.perf_counter()
+            detector.predict_batch([image])
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def print_latency(name, latencies):
+    print(
+        f"{name:<10} mean={statistics.mean(latencies) * 1000:7.1f} ms  "
+        f"p50={percentile(latencies, 0.50) * 1000:7.1f} ms  "
+        f"p95={percentile(latencies, 0.95) * 1000:7.1f} ms  "
+        f"throughput={len(latencies) / sum(latencies):6.2f} img/s"
+    )
+
+
+def run_load(args):
+    """Gửi request đồng thời tới /api/v1/detect, đo requests/sec và latency"""
+    url = f"{args.url}/api/v1/detect"
+    image_bytes = Path(args.image).read_bytes()
+    filename = Path(args.image).name
+
+    def send(_):
+        start = time.perf_counter()
+        response = requests.post(url, files={"file": (filename, image_bytes, "image/jpeg")})
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, status in samples if status == 200]
+    errors = {}
+    for _, status in samples:
+        if status != 200:
+            errors[status] = errors.get(status, 0) + 1
+
+    print(f"Requests:     {args.requests} (concurrency={args.concurrency})")
+    print(f"Throughput:   {len(latencies) / elapsed:.2f} req/s")
+    if latencies:
+        print(f"Latency p50:  {percentile(latencies, 0.50) * 1000:.1f} ms")
+        print(f"Latency p95:  {percentile(latencies, 0.95) * 1000:.1f} ms")
+        print(f"Latency mean: {statistics.mean(latencies) * 1000:.1f} ms")
+    if errors:
+        print(f"Errors:       {errors}")
+
+    stats = requests.get(f"{args.url}/api/v1/stats").json()
+    print(f"Server stats: {stats}")
+
+
+def run_backends(args):
+    """Kiểm tra parity của backend ONNX/OpenVINO so với torch và so sánh latency"""
+    from app.core.config import settings
+    from app.models.yolo_detector import YOLODetector
+
+    images = load_images(args.image_dir)
+    conf_threshold = settings.CONFIDENCE_THRESHOLD
+
+    reference = YOLODetector(backend="torch")
+    reference.warmup()
+    ref_boxes = [extract_boxes(reference.predict_batch([image])[0], conf_threshold) for _, image in images]
+    latencies = {"torch": time_predict(reference, images, args.repeat)}
+
+    failed = False
+    for backend in args.backends:
+        detector = YOLODetector(backend=backend)
+        detector.warmup()
+
+        print(f"\n=== Parity: {backend} vs torch (IoU >= {args.iou}, |Δconf| <= {args.conf_tol}) ===")
+        for (name, image), ref in zip(images, ref_boxes):
+            other = extract_boxes(detector.predict_batch([image])[0], conf_threshold)
+            matches = match_boxes(ref, other, args.iou)
+            max_conf_diff = max((abs(ref[2][i] - other[2][j]) for i, j, _ in matches), default=0.0)
+
+            # Box nằm sát ngưỡng confidence có thể xuất hiện ở backend này mà không có ở backend kia
+            matched_ref = {i for i, _, _ in matches}
+            matched_other = {j for _, j, _ in matches}
+            unmatched = [c for i, c in enumerate(ref[2]) if i not in matched_ref]
+            unmatched += [c for j, c in enumerate(other[2]) if j not in matched_other]
+            ok = max_conf_diff <= args.conf_tol and all(c - conf_threshold <= args.conf_tol for c in unmatched)
+            failed |= not ok
+
+            print(
+                f"{'PASS' if ok else 'FAIL'}  {name}: matched {len(matches)}/{len(ref[0])} "
+                f"(other={len(other[0])}), max |Δconf|={max_conf_diff:.4f}"
+            )
+
+        latencies[backend] = time_predict(detector, images, args.repeat)
+
+    print(f"\n=== Latency per image ({len(images)} images x {args.repeat}) ===")
+    for backend, values in latencies.items():
+        print_latency(backend, values)
+
+    if failed:
+        sys.exit(1)
+
+
+def run_int8_report(args):
+    """So sánh model INT8 với model FP32: độ chính xác, latency và bộ nhớ"""
+    from app.core.config import settings
+    from app.models.yolo_detector import YOLODetector
+
+    if args.calibration_dir:
+        settings.CALIBRATION_DIR = args.calibration_dir
+
+    images = load_images(args.image_dir)
+    conf_threshold = settings.CONFIDENCE_THRESHOLD
+    variants = [
+        ("fp32", args.reference_backend, "fp32"),
+        ("fp32-ov", "openvino", "fp32"),
+        ("int8-ov", "openvino", "int8"),
+    ]
+
+    rows = {}
+    for name, backend, precision in variants:
+        rss_before = rss_mb()
+        detector = YOLODetector(backend=backend, precision=precision)
+        detector.warmup()
+        rss_loaded = rss_mb() - rss_before
+
+        boxes = [extract_boxes(detector.predict_batch([image])[0], conf_threshold) for _, image in images]
+        latencies = time_predict(detector, images, args.repeat)
+        rows[name] = {
+            "boxes": boxes,
+            "latencies": latencies,
+            "size": model_size_mb(detector.weights),
+            "rss": rss_loaded,
+        }
+        del detector
+
+    reference = rows["fp32"]["boxes"]
+    print(f"\n=== INT8 report ({len(images)} images, reference = {args.reference_backend} fp32) ===")
+    print(
+        f"{'model':<9} {'mAP50':>6} {'mAP50-95':>9} {'recall':>7} {'precision':>9} "
+        f"{'mean ms':>8} {'p95 ms':>7} {'size MB':>8} {'RSS MB':>7}"
+    )
+    for name, row in rows.items():
+        matched = sum(len(match_boxes(ref, other, 0.5)) for ref, other in zip(reference, row["boxes"]))
+        num_ref = sum(len(ref[0]) for ref in reference)
+        num_pred = sum(len(other[0]) for other in row["boxes"])
+        map50 = average_precision(reference, row["boxes"], 0.5)
+        map50_95 = np.mean([average_precision(reference, row["boxes"], t) for t in np.arange(0.5, 0.96, 0.05)])
+        print(
+            f"{name:<9} {map50:6.3f} {map50_95:9.3f} {matched / max(num_ref, 1):7.3f} {matched / max(num_pred, 1):9.3f} "
+            f"{statistics.mean(row['latencies']) * 1000:8.1f} {percentile(row['latencies'], 0.95) * 1000:7.1f} "
+            f"{row['size']:8.1f} {row['rss']:7.1f}"
+        )
+
+
+def decode_worker(paths, target_size, repeat, queue):
+    """Decode toàn bộ ảnh trong một process riêng để đo peak RSS độc lập"""
+    from app.utils.image import decode_image
+
+    files = [Path(p).read_bytes() for p in paths]
+    baseline = rss_mb()
+    peak = baseline
+    latencies = []
+    for _ in range(repeat):
+        for data in files:
+            start = time.perf_counter()
+            image, _ = decode_image(data, target_size)
+            latencies.append(time.perf_counter() - start)
+            peak = max(peak, rss_mb())
+            del image
+    queue.put((latencies, peak - baseline))
+
+
+def run_decode(args):
+    """So sánh decode full resolution với decode giảm kích thước trong miền DCT"""
+    from app.core.config import settings
+
+    paths = sorted(str(p) for p in Path(args.image_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise SystemExit(f"No images found in {args.image_dir}")
+
+    print(f"=== Decode benchmark ({len(paths)} images x {args.repeat}) ===")
+    for name, target_size in [("full", None), (f"reduced@{settings.IMG_SIZE}", settings.IMG_SIZE)]:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=decode_worker, args=(paths, target_size, args.repeat, queue))
+        process.start()
+        latencies, peak_rss = queue.get()
+        process.join()
+        print(
+            f"{name:<12} mean={statistics.mean(latencies) * 1000:7.1f} ms  "
+            f"p95={percentile(latencies, 0.95) * 1000:7.1f} ms  "
+            f"peak RSS +{peak_rss:6.1f} MB"
+        )
+
+
+def run_memory(args):
+    """RSS/PSS/USS của từng worker (serve.py hoặc uvicorn --workers) và throughput tổng"""
+    parent = psutil.Process(args.pid)
+    workers = parent.children(recursive=True) or [parent]
+
+    def report(title):
+        print(f"\n=== {title} ===")
+        print(f"{'pid':>8} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8}")
+        totals = [0.0, 0.0, 0.0]
+        for process in [parent] + [w for w in workers if w.pid != parent.pid]:
+            info = process.memory_full_info()
+            values = [info.rss, getattr(info, "pss", 0), info.uss]
+            values = [v / (1024 * 1024) for v in values]
+            totals = [t + v for t, v in zip(totals, values)]
+            print(f"{process.pid:>8} {values[0]:8.1f} {values[1]:8.1f} {values[2]:8.1f}")
+        print(f"{'total':>8} {totals[0]:8.1f} {totals[1]:8.1f} {totals[2]:8.1f}")
+
+    report("Memory before load")
+    if args.image:
+        run_load(args)
+        report("Memory after load")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLO Inference Service benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    load = subparsers.add_parser("load", help="Đo throughput/latency của /api/v1/detect")
+    load.add_argument("--url", default="http://localhost:8001")
+    load.add_argument("--image", required=True)
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--requests", type=int, default=200)
+    load.set_defaults(func=run_load)
+
+    backends = subparsers.add_parser("backends", help="Parity và latency của ONNX/OpenVINO so với torch")
+    backends.add_argument("--image-dir", required=True)
+    backends.add_argument("--backends", nargs="+", default=["onnx", "openvino"])
+    backends.add_argument("--repeat", type=int, default=3)
+    backends.add_argument("--iou", type=float, default=0.95, help="IoU tối thiểu để coi hai box là trùng")
+    backends.add_argument("--conf-tol", type=float, default=0.02, help="Sai lệch confidence tối đa cho phép")
+    backends.set_defaults(func=run_backends)
+
+    int8 = subparsers.add_parser("int8-report", help="Độ chính xác/latency/bộ nhớ của model INT8 so với FP32")
+    int8.add_argument("--image-dir", required=True, help="Ảnh dùng để đánh giá (nên khác ảnh calibration)")
+    int8.add_argument("--calibration-dir", default=None, help="Mặc định: settings.CALIBRATION_DIR")
+    int8.add_argument("--reference-backend", default="torch")
+    int8.add_argument("--repeat", type=int, default=3)
+    int8.set_defaults(func=run_int8_report)
+
+    decode = subparsers.add_parser("decode", help="Thời gian decode và peak RSS: full vs reduced resolution")
+    decode.add_argument("--image-dir", required=True)
+    decode.add_argument("--repeat", type=int, default=5)
+    decode.set_defaults(func=run_decode)
+
+    memory = subparsers.add_parser("memory", help="Bộ nhớ từng worker và throughput tổng của server nhiều worker")
+    memory.add_argument("--pid", type=int, required=True, help="PID của process cha (serve.py hoặc uvicorn)")
+    memory.add_argument("--url", default="http://localhost:8001")
+    memory.add_argument("--image", default=None, help="Nếu có, chạy load test rồi đo lại bộ nhớ")
+    memory.add_argument("--concurrency", type=int, default=8)
+    memory.add_argument("--requests", type=int, default=200)
+    memory.set_defaults(func=run_memory)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
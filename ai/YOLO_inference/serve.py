@@ -0,0 +1,156 @@
+"""
+Pre-fork server cho YOLO Inference Service
+
+Process cha load và warmup model một lần, sau đó fork N worker. Các worker dùng
+chung trang bộ nhớ chứa weights theo cơ chế copy-on-write, nên RSS thực tế
+(PSS) không tăng theo số worker. Mỗi worker có số thread torch cố định.
+
+Chỉ hỗ trợ Linux/macOS (cần os.fork). Với --pin, core của các worker được chia
+bằng planner của ai/launcher.py (giữ các hyperthread cùng core với nhau), nên
+serve.py và `launcher.py start` pin worker theo cùng một cách.
+
+Ví dụ:
+    python serve.py --workers 4 --threads 2 --port 8001
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+from pathlib import Path
+
+import torch
+import uvicorn
+
+logger = logging.getLogger("yolo-prefork")
+
+
+def plan_workers(workers: int, threads: int):
+    """
+    CPU và số thread torch của từng worker, theo planner của ai/launcher.py
+
+    Chỉ dùng `workers x threads` physical core đầu tiên trong affinity hiện tại
+    của process, mỗi worker nhận `threads` core riêng. Nếu không đủ core, các
+    worker dùng chung core (round-robin) như `launcher.py`.
+    """
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from launcher import SERVICES, available_cpus, make_plan, physical_cores
+
+    service = next(s for s in SERVICES if s.name == "yolo")
+    cores = physical_cores(available_cpus())[:workers * threads]
+    cpus = sorted(cpu for core in cores for cpu in core)
+    plan = make_plan([service], cpus, {}, {service.name: threads}, {service.name: workers})
+    return [(set(worker.cpus), worker.threads) for worker in plan]
+
+
+def run_worker(app, sock, args, index: int, cpus=None):
+    threads = args.threads
+    if cpus is not None:
+        cpus, threads = cpus
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    logger.info(f"Worker {index} started: pid={os.getpid()}, torch threads={torch.get_num_threads()}")
+
+    config = uvicorn.Config(app, log_level=args.log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(app, sock, args, index: int, cpus=None) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            run_worker(app, sock, args, index, cpus)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork YOLO Inference Service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads mỗi worker")
+    parser.add_argument("--interop-threads", type=int, default=1, help="torch inter-op threads mỗi worker")
+    parser.add_argument("--pin", action="store_true", help="Gán mỗi worker vào tập core riêng (planner của ai/launcher.py)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py requires os.fork (Linux/macOS). Use uvicorn --workers instead.")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+
+    # Phải đặt trước khi torch chạy bất kỳ phép tính song song nào
+    torch.set_num_interop_threads(args.interop_threads)
+    torch.set_num_threads(args.threads)
+
+    # Load + warmup model ngay trong process cha để các worker dùng chung
+    from app.main import app
+    from app.api.detect import registry
+    registry.load()
+    if not registry.ready:
+        sys.exit(f"Model loading failed: {registry.error}")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.set_inheritable(True)
+
+    # Đưa các object đã tạo vào permanent generation để GC của worker không ghi lên các trang dùng chung
+    gc.collect()
+    gc.freeze()
+
+    # (cpus, threads) của mỗi worker khi --pin
+    layout = [None] * args.workers
+    if args.pin and hasattr(os, "sched_setaffinity"):
+        layout = plan_workers(args.workers, args.threads)
+        for index, (cpus, threads) in enumerate(layout):
+            logger.info(f"Worker {index}: cpus={sorted(cpus)}, torch threads={threads}")
+
+    workers = {spawn_worker(app, sock, args, index, layout[index]): index for index in range(args.workers)}
+    logger.info(f"Serving on {args.host}:{args.port} with {args.workers} workers: {sorted(workers)}")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = workers.pop(pid, None)
+        if index is None:
+            continue
+        if not stopping:
+            # Worker chết bất thường: fork lại từ process cha (vẫn dùng chung weights)
+            logger.warning(f"Worker {index} (pid={pid}) exited with status {status}, restarting")
+            workers[spawn_worker(app, sock, args, index, layout[index])] = index
+
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+"""
+CPU planner and launcher for the AI services
+
+YOLO, OCR V2 and the pipeline usually run on the same host. With default
+settings every process starts one torch thread per core, so the services
+oversubscribe the CPU and slow each other down. This script splits the
+physical cores between the services by share, gives every uvicorn worker its
+own set of cores (CPU affinity) and sets its torch intra-op/inter-op threads to
+match. The pipeline mostly waits on the other two services, so by default it
+gets no cores of its own: one unpinned worker with a single torch thread.
+
+Usage:
+    python launcher.py plan
+    python launcher.py plan --cpus 0-15 --share yolo=3 ocr=2
+    python launcher.py start --threads yolo=2 ocr=1
+    python launcher.py benchmark --seconds 10
+
+Affinity and shared listening sockets need Linux. On other platforms `start`
+runs one process per service with the planned thread counts only.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+AI_DIR = Path(__file__).resolve().parent
+SYSFS_CPU = Path("/sys/devices/system/cpu")
+
+
+class Service:
+    """A service started by the launcher"""
+
+    def __init__(self, name: str, directory: str, app: str, port: int, share: int, threads: int, workload: Optional[str]):
+        self.name = name
+        self.directory = directory
+        self.app = app
+        self.port = port
+        self.share = share  # Relative number of physical cores (0: unpinned, no dedicated cores)
+        self.threads = threads  # Default torch threads per worker
+        self.workload = workload  # Synthetic load used by `benchmark` (None: not CPU bound)
+
+
+SERVICES = [
+    Service("yolo", "YOLO_inference", "app.main:app", 8001, share=2, threads=2, workload="conv"),
+    Service("ocr", "OCR_V2_inference", "app.main:app", 8002, share=2, threads=1, workload="transformer"),
+    Service("pipeline", "pipeline_v2", "app:app", 8003, share=0, threads=1, workload=None),
+]
+
+
+class Worker:
+    """One uvicorn process of a service and the cores it is pinned to"""
+
+    def __init__(self, service: Service, index: int, cpus: List[int], threads: int):
+        self.service = service
+        self.index = index
+        self.cpus = cpus  # Logical CPUs, hyperthread siblings included (empty: unpinned)
+        self.threads = threads  # torch intra-op threads (one per physical core)
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """Parse a Linux CPU list such as "0-3,8,10-11" """
+    cpus = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def format_cpu_list(cpus: List[int]) -> str:
+    """Inverse of parse_cpu_list"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def available_cpus() -> List[int]:
+    """Logical CPUs this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_cores(cpus: List[int]) -> List[List[int]]:
+    """
+    Group logical CPUs into physical cores
+
+    Hyperthread siblings share a core's execution units, so they are kept
+    together and a worker gets one torch thread per physical core. Cores are
+    ordered by package (socket), so consecutive cores share a cache.
+    Without sysfs topology every logical CPU counts as a core.
+    """
+    cores: Dict[tuple, List[int]] = {}
+    for cpu in cpus:
+        topology = SYSFS_CPU / f"cpu{cpu}" / "topology"
+        try:
+            key = (
+                int((topology / "physical_package_id").read_text()),
+                int((topology / "core_id").read_text()),
+            )
+        except (OSError, ValueError):
+            key = (0, cpu)
+        cores.setdefault(key, []).append(cpu)
+    return [cores[key] for key in sorted(cores)]
+
+
+def allocate(total: int, shares: List[int]) -> List[int]:
+    """Split `total` cores proportionally to `shares` (largest remainder), at least one each"""
+    counts = [1] * len(shares)
+    remaining = total - len(shares)
+    if remaining <= 0:
+        return counts
+    weight = sum(shares)
+    exact = [remaining * share / weight for share in shares]
+    for i, value in enumerate(exact):
+        counts[i] += int(value)
+    leftover = total - sum(counts)
+    for i in sorted(range(len(shares)), key=lambda i: exact[i] - int(exact[i]), reverse=True)[:leftover]:
+        counts[i] += 1
+    return counts
+
+
+def make_plan(
+    services: List[Service],
+    cpus: List[int],
+    shares: Dict[str, int],
+    threads: Dict[str, int],
+    workers: Dict[str, int],
+) -> List[Worker]:
+    """
+    Assign physical cores to services and split them between their workers
+
+    Each service gets a contiguous block of physical cores proportional to its
+    share. By default a service runs one worker per `threads` cores; every
+    worker is pinned to its own cores and uses one torch thread per core. If
+    there are fewer cores than services, services share cores round-robin.
+    Services with a share of 0 get no cores: their workers (one by default)
+    are not pinned and keep `threads` torch threads.
+    """
+    cores = physical_cores(cpus)
+    pinned = [s for s in services if shares.get(s.name, s.share) > 0]
+    counts = allocate(len(cores), [shares.get(s.name, s.share) for s in pinned])
+
+    plan = []
+    offset = 0
+    for service, count in zip(pinned, counts):
+        service_cores = [cores[(offset + i) % len(cores)] for i in range(count)]
+        offset += count
+
+        per_worker = max(1, min(threads.get(service.name, service.threads), count))
+        n_workers = workers.get(service.name, max(1, count // per_worker))
+        for index in range(n_workers):
+            # Contiguous, nearly equal slices; workers share cores only if there are more workers than cores
+            start = index * count // n_workers
+            end = max(start + 1, (index + 1) * count // n_workers)
+            slice_cores = [service_cores[i % count] for i in range(start, end)]
+            worker_cpus = sorted({cpu for core in slice_cores for cpu in core})
+            plan.append(Worker(service, index, worker_cpus, threads=len(slice_cores)))
+
+    for service in services:
+        if service not in pinned:
+            for index in range(workers.get(service.name, 1)):
+                plan.append(Worker(service, index, [], threads=threads.get(service.name, service.threads)))
+    return plan
+
+
+def print_plan(plan: List[Worker], cpus: List[int]):
+    cores = physical_cores(cpus)
+    print(f"Host: {len(cpus)} logical CPUs ({format_cpu_list(cpus)}), {len(cores)} physical cores")
+    if len(cores) < len({worker.service.name for worker in plan if worker.cpus}):
+        print("Warning: fewer physical cores than services, some services share cores")
+    print(f"{'service':<9} {'port':>5} {'worker':>6} {'cpus':>12} {'torch threads':>14} {'interop':>8}")
+    for worker in plan:
+        print(
+            f"{worker.service.name:<9} {worker.service.port:>5} {worker.index:>6} "
+            f"{format_cpu_list(worker.cpus) or 'unpinned':>12} {worker.threads:>14} {1:>8}"
+        )
+
+
+def parse_assignments(values: Optional[List[str]], option: str, minimum: int = 1) -> Dict[str, int]:
+    """Parse ["yolo=2", "ocr=1"] into {"yolo": 2, "ocr": 1}"""
+    names = {service.name for service in SERVICES}
+    result = {}
+    for value in values or []:
+        name, _, number = value.partition("=")
+        if name not in names or not number.isdigit() or int(number) < minimum:
+            sys.exit(f"Invalid {option} value {value!r}, expected <service>=<int >= {minimum}> with service in {sorted(names)}")
+        result[name] = int(number)
+    return result
+
+
+def plan_from_args(args):
+    cpus = parse_cpu_list(args.cpus) if args.cpus else available_cpus()
+    services = [s for s in SERVICES if not args.only or s.name in args.only]
+    plan = make_plan(
+        services,
+        cpus,
+        parse_assignments(args.share, "--share", minimum=0),
+        parse_assignments(args.threads, "--threads"),
+        parse_assignments(args.workers, "--workers"),
+    )
+    return plan, cpus
+
+
+def worker_command(worker: Worker, subcommand: str, *extra: str) -> List[str]:
+    return [
+        sys.executable, str(Path(__file__).resolve()), subcommand,
+        "--cpus", format_cpu_list(worker.cpus),
+        "--threads", str(worker.threads),
+        *extra,
+    ]
+
+
+def run_plan(args) -> int:
+    plan, cpus = plan_from_args(args)
+    print_plan(plan, cpus)
+    return 0
+
+
+def run_start(args) -> int:
+    """Start every planned worker and restart workers that exit unexpectedly"""
+    plan, cpus = plan_from_args(args)
+    print_plan(plan, cpus)
+
+    shared_sockets = hasattr(os, "sched_setaffinity") and os.name == "posix"
+    if not shared_sockets:
+        print("No CPU affinity or shared sockets on this platform: one process per service, threads only")
+        first = {}
+        for worker in plan:
+            first.setdefault(worker.service.name, worker)
+        plan = list(first.values())
+
+    # One listening socket per service, inherited by all of its workers (pre-fork model)
+    sockets = {}
+    if shared_sockets:
+        for worker in plan:
+            service = worker.service
+            if service.name not in sockets:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((args.host, service.port))
+                sock.set_inheritable(True)
+                sockets[service.name] = sock
+
+    def spawn(worker: Worker) -> subprocess.Popen:
+        service = worker.service
+        if shared_sockets:
+            fd = sockets[service.name].fileno()
+            command = worker_command(worker, "worker", "--app", service.app, "--fd", str(fd), "--log-level", args.log_level)
+            return subprocess.Popen(command, cwd=AI_DIR / service.directory, pass_fds=(fd,))
+        command = worker_command(
+            worker, "worker", "--app", service.app, "--host", args.host, "--port", str(service.port), "--log-level", args.log_level
+        )
+        return subprocess.Popen(command, cwd=AI_DIR / service.directory)
+
+    processes = {}
+    for worker in plan:
+        processes[spawn(worker)] = worker
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while processes:
+        for process, worker in list(processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del processes[process]
+            if not stopping:
+                print(f"{worker.service.name} worker {worker.index} exited with code {code}, restarting")
+                processes[spawn(worker)] = worker
+        time.sleep(0.5)
+
+    print("All workers stopped")
+    return 0
+
+
+def configure_process(cpus: Optional[str], threads: int, interop_threads: int):
+    """Pin the current process and set its thread pools; must run before torch starts any work"""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, parse_cpu_list(cpus))
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_interop_threads(interop_threads)
+    torch.set_num_threads(threads)
+
+
+def run_worker(args) -> int:
+    """Entry point of one uvicorn worker started by `start`"""
+    configure_process(args.cpus, args.threads, args.interop_threads)
+
+    import uvicorn
+
+    # Same module resolution as `python -m uvicorn` started in the service directory
+    sys.path.insert(0, os.getcwd())
+    if args.fd is not None:
+        uvicorn.run(args.app, fd=args.fd, log_level=args.log_level)
+    else:
+        uvicorn.run(args.app, host=args.host, port=args.port, log_level=args.log_level)
+    return 0
+
+
+def synthetic_workload(kind: str):
+    """A small model with the shape of the service's hot loop"""
+    import torch
+    import torch.nn as nn
+
+    if kind == "conv":
+        model = nn.Sequential(
+            nn.Conv2d(3, 32, 3, 2, 1), nn.SiLU(),
+            nn.Conv2d(32, 64, 3, 2, 1), nn.SiLU(),
+            nn.Conv2d(64, 128, 3, 2, 1), nn.SiLU(),
+            nn.Conv2d(128, 128, 3, 1, 1), nn.SiLU(),
+        ).eval()
+        inputs = torch.rand(1, 3, 320, 320)
+    else:
+        model = nn.TransformerEncoder(
+            nn.TransformerEncoderLayer(256, 8, 1024, batch_first=True), num_layers=2
+        ).eval()
+        inputs = torch.rand(8, 32, 256)
+
+    def step():
+        with torch.no_grad():
+            model(inputs)
+
+    return step
+
+
+def run_load(args) -> int:
+    """Run a synthetic workload from `start_at` for `seconds` and print the iteration count"""
+    if args.planned:
+        configure_process(args.cpus, args.threads, 1)
+    step = synthetic_workload(args.workload)
+    step()  # Warmup
+
+    time.sleep(max(0.0, args.start_at - time.time()))
+    end = time.time() + args.seconds
+    iterations = 0
+    while time.time() < end:
+        step()
+        iterations += 1
+    print(iterations)
+    return 0
+
+
+def run_benchmark(args) -> int:
+    """
+    Aggregate throughput of all planned workers running at once, with and
+    without the plan. Unplanned workers keep torch's default threading and no
+    affinity, which is what plain `uvicorn` gives each service.
+    """
+    plan, cpus = plan_from_args(args)
+    print_plan(plan, cpus)
+    plan = [worker for worker in plan if worker.service.workload is not None]
+    print(f"\nSynthetic load: {len(plan)} CPU-bound workers for {args.seconds}s per run "
+          f"(the pipeline is I/O bound and not loaded)\n")
+
+    results = {}
+    for mode in ("unplanned", "planned"):
+        start_at = time.time() + args.startup
+        processes = []
+        for worker in plan:
+            command = worker_command(
+                worker, "load",
+                "--workload", worker.service.workload,
+                "--seconds", str(args.seconds),
+                "--start-at", str(start_at),
+            )
+            if mode == "planned":
+                command.append("--planned")
+            processes.append((worker, subprocess.Popen(command, stdout=subprocess.PIPE, text=True)))
+
+        totals: Dict[str, int] = {}
+        for worker, process in processes:
+            out, _ = process.communicate()
+            if process.returncode != 0:
+                print(f"{mode} load for {worker.service.name} failed")
+                return 1
+            totals[worker.service.name] = totals.get(worker.service.name, 0) + int(out.strip().splitlines()[-1])
+        results[mode] = {name: count / args.seconds for name, count in totals.items()}
+
+    names = list(results["planned"])
+    print(f"{'service':<9} {'unplanned it/s':>15} {'planned it/s':>13} {'change':>8}")
+    for name in names:
+        before, after = results["unplanned"][name], results["planned"][name]
+        print(f"{name:<9} {before:>15.1f} {after:>13.1f} {(after / before - 1) if before else 0:>+8.1%}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU planner and launcher for the AI services")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_plan_arguments(subparser):
+        subparser.add_argument("--cpus", help="Logical CPUs to plan over, e.g. 0-15 (default: current affinity)")
+        subparser.add_argument("--share", nargs="+", metavar="SERVICE=N", help="Relative core share per service (0: unpinned)")
+        subparser.add_argument("--threads", nargs="+", metavar="SERVICE=N", help="Torch threads (cores) per worker")
+        subparser.add_argument("--workers", nargs="+", metavar="SERVICE=N", help="Number of workers per service")
+        subparser.add_argument("--only", nargs="+", choices=[s.name for s in SERVICES], help="Plan only these services")
+
+    plan = subparsers.add_parser("plan", help="Print the CPU layout")
+    add_plan_arguments(plan)
+    plan.set_defaults(func=run_plan)
+
+    start = subparsers.add_parser("start", help="Start the services with the CPU layout")
+    add_plan_arguments(start)
+    start.add_argument("--host", default="0.0.0.0")
+    start.add_argument("--log-level", default="info")
+    start.set_defaults(func=run_start)
+
+    benchmark = subparsers.add_parser("benchmark", help="Aggregate throughput with and without the plan")
+    add_plan_arguments(benchmark)
+    benchmark.add_argument("--seconds", type=float, default=10)
+    benchmark.add_argument("--startup", type=float, default=5, help="Seconds allowed for the processes to start")
+    benchmark.set_defaults(func=run_benchmark)
+
+    # Internal: one uvicorn worker
+    worker = subparsers.add_parser("worker")
+    worker.add_argument("--app", required=True)
+    worker.add_argument("--cpus")
+    worker.add_argument("--threads", type=int, default=1)
+    worker.add_argument("--interop-threads", type=int, default=1)
+    worker.add_argument("--fd", type=int)
+    worker.add_argument("--host", default="0.0.0.0")
+    worker.add_argument("--port", type=int)
+    worker.add_argument("--log-level", default="info")
+    worker.set_defaults(func=run_worker)
+
+    # Internal: one synthetic load process of `benchmark`
+    load = subparsers.add_parser("load")
+    load.add_argument("--workload", choices=["conv", "transformer"], required=True)
+    load.add_argument("--cpus")
+    load.add_argument("--threads", type=int, default=1)
+    load.add_argument("--planned", action="store_true")
+    load.add_argument("--seconds", type=float, required=True)
+    load.add_argument("--start-at", type=float, required=True)
+    load.set_defaults(func=run_load)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ Combines YOLO detection and OCR recognition
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
+import shutil
 import tempfile
 from pathlib import Path
 import logging
@@ -12,11 +13,16 @@ import requests
 
 from pipeline.service import PipelineService
 from pipeline.schemas import PipelineResponse, PipelineConfig
+from pipeline.upload import BodySizeLimitMiddleware, UploadTooLarge, spooled_upload
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upload limits
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_REQUEST_SIZE = MAX_IMAGE_SIZE + 1024 * 1024  # Image + form fields, larger bodies get 413
+
 # Create FastAPI app
 app = FastAPI(
     title="YOLO + OCR Pipeline API",
@@ -33,6 +39,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized request bodies (413) before they are buffered
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_REQUEST_SIZE)
+
 # Initialize pipeline service
 pipeline_service = None
 
@@ -103,20 +112,18 @@ async def process_image(
             detail=f"Invalid file type. Allowed types: {allowed_types}"
         )
     
-    # Read file content
-    contents = await file.read()
-    
-    # Validate file size (10MB max)
-    max_size = 10 * 1024 * 1024
-    if len(contents) > max_size:
+    # The body was already spooled (and bounded by BodySizeLimitMiddleware), only check the file size
+    try:
+        buffer, _ = spooled_upload(file, MAX_IMAGE_SIZE)
+    except UploadTooLarge:
         raise HTTPException(
-            status_code=400,
-            detail=f"File size exceeds maximum allowed size of {max_size} bytes"
+            status_code=413,
+            detail=f"File size exceeds maximum allowed size of {MAX_IMAGE_SIZE} bytes"
         )
     
     # Save uploaded file temporarily
     with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-        tmp_file.write(contents)
+        shutil.copyfileobj(buffer, tmp_file)
         tmp_path = tmp_file.name
     
     try:
@@ -6,10 +6,14 @@ Combines YOLO detection and VietOCR recognition
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+import shutil
+import tempfile
+from pathlib import Path
 import requests
 
 from service import PipelineService
 from schemas import PipelineResponse, PipelineConfig
+from upload import BodySizeLimitMiddleware, UploadTooLarge, spooled_upload
 
 # Setup logging
 logging.basicConfig(
@@ -18,6 +22,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Upload limits
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_REQUEST_SIZE = MAX_IMAGE_SIZE + 1024 * 1024  # Image + form fields, larger bodies get 413
+
 # Create FastAPI app
 app = FastAPI(
     title="YOLO + VietOCR Pipeline API",
@@ -34,6 +42,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized request bodies (413) before they are buffered
+app.add_middleware(BodySizeLimitMiddleware, max_body_size=MAX_REQUEST_SIZE)
+
 # Initialize pipeline service
 pipeline_service = None
 
@@ -120,16 +131,27 @@ async def process_image(
     if not 0.0 <= iou_threshold <= 1.0:
         raise HTTPException(status_code=400, detail="iou_threshold must be between 0.0 and 1.0")
     
+    # The body was already spooled (and bounded by BodySizeLimitMiddleware), only check the file size
+    try:
+        buffer, _ = spooled_upload(file, MAX_IMAGE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File size exceeds maximum allowed size of {MAX_IMAGE_SIZE} bytes"
+        )
+    
+    # Save uploaded file temporarily
+    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename or "image.jpg").suffix) as tmp_file:
+        shutil.copyfileobj(buffer, tmp_file)
+        tmp_path = tmp_file.name
+    
     try:
         # Update pipeline config
         pipeline_service.config.conf_threshold = conf_threshold
         pipeline_service.config.iou_threshold = iou_threshold
         
-        # Read image bytes
-        image_bytes = await file.read()
-        
         # Process through pipeline
-        result = pipeline_service.process_image_bytes(image_bytes, file.filename)
+        result = pipeline_service.process_image(tmp_path)
         
         logger.info(f"Successfully processed {file.filename}: {result.total_detections} detections")
         
@@ -143,6 +165,9 @@ async def process_image(
     except Exception as e:
         logger.error(f"Pipeline error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Pipeline processing error: {str(e)}")
+    finally:
+        # Clean up temporary file
+        Path(tmp_path).unlink(missing_ok=True)
 
 
 if __name__ == "__main__":
@@ -78,7 +78,8 @@ class PipelineService:
         self, 
         image_path: Union[str, Path],
         bboxes: list,
-        confidences: list
+        confidences: list,
+        class_names: Optional[list] = None
     ) -> Dict[str, Any]:
         """
         Perform OCR on detected regions using VietOCR
@@ -87,6 +88,7 @@ class PipelineService:
             image_path: Path to the image file
             bboxes: List of bounding boxes from YOLO
             confidences: List of confidence scores from YOLO
+            class_names: List of class names from YOLO (model routing and per-class cache statistics in the OCR service)
         
         Returns:
             VietOCR recognition response
@@ -100,6 +102,8 @@ class PipelineService:
                 "confidences": json.dumps(confidences),
                 "conf_threshold": self.config.conf_threshold
             }
+            if class_names is not None:
+                data["class_names"] = json.dumps(class_names)
             
             response = requests.post(url, files=files, data=data)
             response.raise_for_status()
@@ -148,7 +152,7 @@ class PipelineService:
         
         # Step 3: VietOCR recognition
         logger.info("Step 2: Running VietOCR on detected regions...")
-        ocr_response = self.recognize_with_ocr(image_path, bboxes, confidences)
+        ocr_response = self.recognize_with_ocr(image_path, bboxes, confidences, class_names)
         ocr_results = ocr_response.get("results", [])
         
         logger.info(f"VietOCR processed {len(ocr_results)} regions")
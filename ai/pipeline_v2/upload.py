@@ -0,0 +1,15 @@
+"""
+Upload size limits, shared by the OCR and pipeline services (ai/service_common/upload.py)
+"""
+
+import sys
+from pathlib import Path
+
+# Add the ai/ directory (parent of service_common) to the path
+common_path = Path(__file__).resolve().parents[1]
+if str(common_path) not in sys.path:
+    sys.path.insert(0, str(common_path))
+
+from service_common.upload import BodySizeLimitMiddleware, UploadTooLarge, spooled_upload
+
+__all__ = ["BodySizeLimitMiddleware", "UploadTooLarge", "spooled_upload"]
@@ -0,0 +1,3 @@
+"""
+Modules shared by the YOLO, OCR and pipeline services
+"""
@@ -0,0 +1,227 @@
+"""
+Local content-addressed artifact store for model weights
+
+Layout under the store root:
+    blobs/sha256/<digest>         Read-only artifact, named by its SHA-256
+    blobs/sha256/<digest>.json    Size/mtime recorded when the blob was last verified
+    refs/<name>.json              Name -> digest, plus the stat of the file it was imported from
+
+Artifacts are added once (by setup or on first use of a local file) and then
+resolved by digest or name without any network or subprocess call. A blob is
+hashed once; later loads only compare its size and mtime with the record.
+Weights are loaded with torch.load(mmap=True), so several workers on the same
+host share the page cache pages of one file.
+
+Used by both OCR services through their app/core/artifacts.py, which also
+runs the command line from the service directory:
+    python -m app.core.artifacts list
+    python -m app.core.artifacts add OCR_CNN_Vietnamese/best_ocr_model.pth --name ocr_cnn_vietnamese
+    python -m app.core.artifacts add weights/custom_vietocr_model.pth --name vietocr_custom_weights
+    python -m app.core.artifacts verify <digest>
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArtifactError(Exception):
+    """Artifact missing from the store or failing verification"""
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat_record(path: Path) -> dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _write_json(path: Path, data: dict):
+    """Write JSON atomically, so concurrent workers never read a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+class ArtifactStore:
+    """Content-addressed store of model artifacts"""
+
+    def __init__(self, root: str):
+        self.root = Path(root).expanduser()
+        self.blobs = self.root / "blobs" / "sha256"
+        self.refs = self.root / "refs"
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blobs / digest
+
+    def has(self, digest: str) -> bool:
+        return self.blob_path(digest).exists()
+
+    def ref(self, name: str) -> Optional[str]:
+        """Digest a name points to, or None"""
+        record = _read_json(self.refs / f"{name}.json")
+        return record["digest"] if record else None
+
+    def add(self, source: Path, name: Optional[str] = None) -> str:
+        """
+        Import a local file into the store
+
+        PyTorch checkpoints in the legacy (non-zip) format are re-saved in the
+        zip format, which torch.load(mmap=True) requires; the digest is that of
+        the stored file. If `name` already points to an import of the same
+        unchanged source file, nothing is read again.
+
+        Returns:
+            Digest of the stored artifact
+        """
+        source = Path(source)
+        if name is not None:
+            record = _read_json(self.refs / f"{name}.json")
+            if (
+                record
+                and record.get("source") == str(source.resolve())
+                and record.get("source_stat") == _stat_record(source)
+                and self.has(record["digest"])
+            ):
+                return record["digest"]
+
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.blobs, suffix=".tmp")
+        tmp_path = Path(tmp_name)
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                if source.suffix in (".pth", ".pt") and not zipfile.is_zipfile(source):
+                    torch.save(torch.load(source, map_location="cpu", weights_only=True), tmp_file)
+                else:
+                    with open(source, "rb") as f:
+                        shutil.copyfileobj(f, tmp_file, CHUNK_SIZE)
+            digest = file_sha256(tmp_path)
+            blob = self.blob_path(digest)
+            if blob.exists():
+                tmp_path.unlink()
+            else:
+                tmp_path.chmod(0o444)
+                os.replace(tmp_path, blob)
+                self._mark_verified(digest)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        if name is not None:
+            _write_json(self.refs / f"{name}.json", {
+                "digest": digest,
+                "source": str(source.resolve()),
+                "source_stat": _stat_record(source),
+            })
+        logger.info(f"Added {source} to the artifact store as {digest[:12]}" + (f" ({name})" if name else ""))
+        return digest
+
+    def verify(self, digest: str) -> Path:
+        """
+        Path of a blob, checked against its digest
+
+        The full hash is computed the first time (or after the file changed);
+        afterwards a size/mtime comparison is enough.
+
+        Raises:
+            ArtifactError: If the blob is missing or its content does not match the digest
+        """
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            raise ArtifactError(f"Artifact {digest} is not in the store at {self.root}")
+        if _read_json(blob.with_suffix(".json")) == _stat_record(blob):
+            return blob
+
+        actual = file_sha256(blob)
+        if actual != digest:
+            raise ArtifactError(f"Artifact {blob} is corrupted: sha256 is {actual}")
+        self._mark_verified(digest)
+        return blob
+
+    def resolve(self, name: str, digest: str = "", source: Optional[Path] = None) -> Path:
+        """
+        Find an artifact, without network access
+
+        Order: the pinned `digest`; the local `source` file (imported on first
+        use); the digest `name` points to.
+
+        Raises:
+            ArtifactError: If none of them is available
+        """
+        if digest:
+            return self.verify(digest)
+        if source is not None and Path(source).exists():
+            return self.verify(self.add(Path(source), name))
+        ref = self.ref(name)
+        if ref is not None:
+            return self.verify(ref)
+        raise ArtifactError(f"Artifact '{name}' not found in {self.root}" + (f" or at {source}" if source else ""))
+
+    def _mark_verified(self, digest: str):
+        blob = self.blob_path(digest)
+        _write_json(blob.with_suffix(".json"), _stat_record(blob))
+
+
+def load_weights(path: Path, device: str) -> dict:
+    """
+    Memory-map a state dict
+
+    On CPU the tensors stay backed by the file, so with
+    load_state_dict(..., assign=True) the weights live in the shared page cache.
+    """
+    return torch.load(path, map_location=device, mmap=True, weights_only=True)
+
+
+def main(default_store: str):
+    """Command line of the store, run by each service's app/core/artifacts.py with its ARTIFACT_STORE"""
+    parser = argparse.ArgumentParser(description="Local model artifact store")
+    parser.add_argument("--store", default=default_store, help="Store root")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List named artifacts")
+    add = subparsers.add_parser("add", help="Import a file")
+    add.add_argument("file")
+    add.add_argument("--name")
+    verify = subparsers.add_parser("verify", help="Re-hash an artifact")
+    verify.add_argument("digest")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.store)
+    if args.command == "list":
+        for ref in sorted(store.refs.glob("*.json")):
+            digest = store.ref(ref.stem)
+            size = store.blob_path(digest).stat().st_size if store.has(digest) else 0
+            print(f"{ref.stem:<32} {digest} {size / 1024 / 1024:>8.1f} MB")
+    elif args.command == "add":
+        print(store.add(Path(args.file), args.name))
+    else:
+        store.blob_path(args.digest).with_suffix(".json").unlink(missing_ok=True)
+        print(store.verify(args.digest))
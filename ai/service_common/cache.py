@@ -0,0 +1,104 @@
+"""
+Bounded LRU cache of recognized text, keyed by crop content
+"""
+
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Optional
+
+UNKNOWN_CLASS = "unknown"  # Crops sent without a class name
+OTHER_CLASS = "other"  # Classes seen after max_classes distinct ones
+
+
+def crop_key(data: bytes, *parts: Any) -> str:
+    """BLAKE2b (128-bit) of the crop content plus everything else the text depends on (model id, shape)"""
+    h = hashlib.blake2b(data, digest_size=16)
+    for part in parts:
+        h.update(b"\0" + repr(part).encode())
+    return h.hexdigest()
+
+
+class RecognitionCache:
+    """
+    LRU cache mapping crop keys to recognized text
+
+    Texts are at most a few dozen characters, so the cache is bounded by its
+    number of entries only. Lookups are counted per field class (the YOLO
+    class name of the box, if the caller sent one), since the hit rate of
+    static labels and of personal fields differs by orders of magnitude.
+
+    Class names come from the client, so only the first `max_classes` distinct
+    names get their own counters; later ones are counted under OTHER_CLASS.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_classes: int = 32):
+        self.max_entries = max_entries
+        self.max_classes = max_classes
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self._classes = set()  # Class names with their own counters
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _stats_class(self, field_class: Optional[str]) -> str:
+        """Counter key of a field class; call with the lock held"""
+        if not field_class:
+            return UNKNOWN_CLASS
+        if field_class not in self._classes:
+            if len(self._classes) >= self.max_classes:
+                return OTHER_CLASS
+            self._classes.add(field_class)
+        return field_class
+
+    def get(self, key: str, field_class: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            field_class = self._stats_class(field_class)
+            text = self._data.get(key)
+            if text is None:
+                self.misses[field_class] += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits[field_class] += 1
+            return text
+
+    def put(self, key: str, text: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = text
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            classes = {}
+            for field_class in sorted(set(self.hits) | set(self.misses)):
+                class_hits, class_misses = self.hits[field_class], self.misses[field_class]
+                classes[field_class] = {
+                    "hits": class_hits,
+                    "misses": class_misses,
+                    "hit_rate": class_hits / (class_hits + class_misses),
+                }
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self.evictions,
+                "classes": classes,
+            }
@@ -0,0 +1,118 @@
+"""
+Upload size limits shared by the YOLO, OCR and pipeline services
+
+Starlette spools every multipart file into a SpooledTemporaryFile (in memory
+up to 1MB, then on disk) while it parses the body. BodySizeLimitMiddleware
+bounds that body, so handlers only check the size of the spooled file and
+decode it in place, without copying it again.
+"""
+
+import json
+import os
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from fastapi import UploadFile
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds maximum size of {limit} bytes")
+        self.limit = limit
+
+
+def spooled_upload(file: UploadFile, max_size: int) -> Tuple[BinaryIO, int]:
+    """
+    Check the size of an upload and return the file Starlette spooled it to
+    
+    Args:
+        file: Uploaded file
+        max_size: Maximum allowed size in bytes
+    
+    Returns:
+        (spooled file positioned at the start, size in bytes). Starlette closes
+        the file when the request ends.
+    
+    Raises:
+        UploadTooLarge: If the upload is larger than max_size
+    """
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, os.SEEK_END)
+    if size > max_size:
+        raise UploadTooLarge(max_size)
+    file.file.seek(0)
+    return file.file, size
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware that answers 413 when a request body exceeds max_body_size
+    
+    `path_limits` sets a different limit for some paths (e.g. a batch endpoint
+    that takes several images); other paths use max_body_size.
+    
+    Requests whose Content-Length is over the limit are rejected before the body
+    is read. Bodies without Content-Length (chunked) are cut off as soon as the
+    received bytes pass the limit, before the multipart parser spools them.
+    """
+
+    def __init__(self, app, max_body_size: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"], self.max_body_size)
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self.reject(send, limit)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Once the body is too large, drop the app's error response and send 413 instead
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded and not response_started:
+            await self.reject(send, limit)
+
+    async def reject(self, send, limit: int):
+        body = json.dumps({"detail": f"Request body exceeds maximum size of {limit} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})